@@ -2,6 +2,7 @@ import eventlet
 eventlet.monkey_patch()
 
 # Main entry point for the backend API
+import os
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
@@ -10,10 +11,17 @@ from routes.review import reviews_bp
 from routes.chat import chats_bp
 from routes.transaction import transactions_bp
 from routes.account import accounts_bp
+from routes.profile import profiles_bp
+from routes.bootstrap import bootstrap_bp
+from routes.stats import stats_bp
 from routes.message import messages_bp
 from routes.listing_report import report_bp
 from routes.admin_report import admin_report_bp
 from routes.ai_price_fill import ai_price_fill_bp
+from routes.image import images_bp
+from routes.admin_jobs import admin_jobs_bp
+from routes.admin_replicas import admin_replicas_bp
+from services.job_queue import job_queue
 
 def create_app():
     app = Flask(__name__)
@@ -39,14 +47,23 @@ def create_app():
     CORS(app)
     
     app.register_blueprint(accounts_bp, url_prefix='/api/accounts')
+    app.register_blueprint(profiles_bp, url_prefix='/api/profiles')
+    app.register_blueprint(bootstrap_bp, url_prefix='/api/bootstrap')
     app.register_blueprint(listings_bp, url_prefix='/api/listings')
     app.register_blueprint(reviews_bp, url_prefix='/api/reviews')
     app.register_blueprint(chats_bp, url_prefix='/api/chats')
     app.register_blueprint(transactions_bp, url_prefix='/api/transactions')
+    app.register_blueprint(stats_bp, url_prefix='/api/stats')
     app.register_blueprint(messages_bp, url_prefix='/api/messages')
     app.register_blueprint(report_bp)
     app.register_blueprint(admin_report_bp)
+    app.register_blueprint(admin_jobs_bp)
+    app.register_blueprint(admin_replicas_bp)
     app.register_blueprint(ai_price_fill_bp,      url_prefix='/api/ai_price_fill')
+    app.register_blueprint(images_bp,             url_prefix='/api/images')
+
+    # Background workers for queued side effects (image uploads, blob deletes, OpenAI calls)
+    job_queue.start(workers=int(os.environ.get('REUSEU_JOB_WORKERS', 4)))
 
     @app.route("/")
     def home():
@@ -0,0 +1,53 @@
+import time
+
+import firebase_admin
+from firebase_admin import credentials, db
+
+# Convert /Account/{uid}/Favorites from a list of listing IDs to a {listing_id: timestamp} map
+# (timestamps keep the old order), then rebuild /{marketplace}/ListingFavorites/{listing_id}
+# counts from every account's favorites. Safe to re-run. Run at a quiet time: favorites
+# changed while this runs may be missing from the rebuilt counts until the next run.
+
+# Initialize Firebase
+cred = credentials.Certificate("pk.json")
+firebase_admin.initialize_app(cred, {
+    'databaseURL': 'https://reuseu-e42b8-default-rtdb.firebaseio.com/'
+})
+
+ref = db.reference('/')
+
+accounts = ref.child('Account').get() or {}
+
+converted = 0
+skipped = 0
+counts = {}  # marketplace_id -> {listing_id: count}
+now = int(time.time() * 1000)
+
+for user_id, profile in accounts.items():
+    if not isinstance(profile, dict):
+        continue
+    favorites = profile.get('Favorites')
+    if isinstance(favorites, list):
+        ids = list(dict.fromkeys(str(f) for f in favorites if f))
+        favorites = {f: now - len(ids) + i for i, f in enumerate(ids)}
+        ref.child('Account').child(user_id).child('Favorites').set(favorites or None)
+        print(f"Converted {len(ids)} favorites for {user_id}.")
+        converted += 1
+    elif favorites is not None and not isinstance(favorites, dict):
+        print(f"User {user_id} has unreadable Favorites ({type(favorites).__name__}). Skipping.")
+        skipped += 1
+        continue
+    marketplace_id = profile.get('marketplace_id')
+    if not marketplace_id:
+        if favorites:
+            print(f"User {user_id} has no marketplace_id; their favorites are not counted.")
+        continue
+    marketplace_counts = counts.setdefault(marketplace_id, {})
+    for listing_id in (favorites or {}):
+        marketplace_counts[listing_id] = marketplace_counts.get(listing_id, 0) + 1
+
+for marketplace_id, marketplace_counts in counts.items():
+    ref.child(marketplace_id).child('ListingFavorites').set(marketplace_counts or None)
+    print(f"Marketplace {marketplace_id}: counts written for {len(marketplace_counts)} listings.")
+
+print(f"Migration complete. Converted: {converted}, Skipped: {skipped}, Marketplaces counted: {len(counts)}")
@@ -0,0 +1,46 @@
+import firebase_admin
+from firebase_admin import credentials, db
+
+from services.listing_record import summary_of
+
+# Backfill /{marketplace}/ListingSummary/{id} for listings written before summaries existed,
+# then set /{marketplace}/ListingSummaryMeta/Complete so the list endpoints start reading summaries.
+# Safe to re-run; run it again for marketplaces created later. Run at a quiet time: a listing
+# deleted while this runs could leave a stray summary behind.
+
+# Initialize Firebase
+cred = credentials.Certificate("pk.json")
+firebase_admin.initialize_app(cred, {
+    'databaseURL': 'https://reuseu-e42b8-default-rtdb.firebaseio.com/'
+})
+
+ref = db.reference('/')
+
+# Marketplaces are the root nodes that hold a Listing child
+root_keys = ref.get(shallow=True) or {}
+
+migrated = 0
+marketplaces = 0
+
+for marketplace_id in root_keys:
+    listings = ref.child(marketplace_id).child('Listing').get()
+    if not isinstance(listings, dict):
+        continue
+    marketplaces += 1
+    updates = {}
+    for listing_id, listing in listings.items():
+        if not isinstance(listing, dict):
+            print(f"Listing {listing_id} in {marketplace_id} is not a dict. Skipping.")
+            continue
+        summary = summary_of(listing)
+        summary.setdefault('ListingID', listing_id)
+        updates[f"ListingSummary/{listing_id}"] = summary
+        migrated += 1
+        if len(updates) >= 500:
+            ref.child(marketplace_id).update(updates)
+            updates = {}
+    updates["ListingSummaryMeta/Complete"] = True
+    ref.child(marketplace_id).update(updates)
+    print(f"Marketplace {marketplace_id}: summaries written for {len(listings)} listings.")
+
+print(f"Migration complete. Marketplaces: {marketplaces}, Summaries written: {migrated}")
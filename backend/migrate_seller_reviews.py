@@ -0,0 +1,51 @@
+import firebase_admin
+from firebase_admin import credentials, db
+
+# Build /SellerReviews/{seller}/{listing} -> ReviewDate and /SellerRating/{seller} (Count, Sum,
+# Histogram of stars) from every review, then set /SellerReviewsMeta/Complete so profile ratings
+# and review lists read them instead of querying /Review. Safe to re-run: both nodes are rebuilt
+# from scratch. Run at a quiet time: reviews written while this runs may be miscounted until
+# the next run.
+
+# Initialize Firebase
+cred = credentials.Certificate("pk.json")
+firebase_admin.initialize_app(cred, {
+    'databaseURL': 'https://reuseu-e42b8-default-rtdb.firebaseio.com/'
+})
+
+ref = db.reference('/')
+
+reviews = ref.child('Review').get() or {}
+if isinstance(reviews, list):  # integer listing IDs come back as a list
+    reviews = {str(i): r for i, r in enumerate(reviews)}
+
+index = {}
+ratings = {}
+skipped = 0
+
+for listing_id, review in reviews.items():
+    if not isinstance(review, dict) or review.get('SellerID') is None:
+        print(f"Review {listing_id} has no SellerID. Skipping.")
+        skipped += 1
+        continue
+    seller_id = str(review['SellerID'])
+    index.setdefault(seller_id, {})[str(listing_id)] = str(review.get('ReviewDate', ''))
+    rating = ratings.setdefault(seller_id, {'Count': 0, 'Sum': 0, 'Histogram': {str(s): 0 for s in range(1, 6)}})
+    try:
+        stars = float(review.get('Rating'))
+    except (TypeError, ValueError):
+        stars = None
+    if stars is None or not stars.is_integer() or not 1 <= stars <= 5:
+        print(f"Review {listing_id} has rating {review.get('Rating')!r}; indexed but not counted.")
+        continue
+    rating['Count'] += 1
+    rating['Sum'] += int(stars)
+    rating['Histogram'][str(int(stars))] += 1
+
+ref.update({
+    'SellerReviews': index or None,
+    'SellerRating': ratings or None,
+    'SellerReviewsMeta/Complete': True,
+})
+
+print(f"Migration complete. Sellers: {len(index)}, Reviews indexed: {sum(len(v) for v in index.values())}, Skipped: {skipped}")
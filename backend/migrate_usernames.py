@@ -0,0 +1,53 @@
+import firebase_admin
+from firebase_admin import credentials, db
+
+from services.account_service import username_key
+
+# Backfill /UsernameIndex/{lowercase username} -> uid for accounts created before the index
+# existed, then set /UsernameIndexMeta/Complete so username lookups stop falling back to a
+# scan of /Account. When two accounts share a username (case-insensitively) the earliest
+# created keeps it; the others are listed so they can be renamed. Safe to re-run.
+
+# Initialize Firebase (account_service has already done so if pk.json is present)
+try:
+    firebase_admin.get_app()
+except ValueError:
+    cred = credentials.Certificate("pk.json")
+    firebase_admin.initialize_app(cred, {
+        'databaseURL': 'https://reuseu-e42b8-default-rtdb.firebaseio.com/'
+    })
+
+ref = db.reference('/')
+
+accounts = ref.child('Account').get() or {}
+index = ref.child('UsernameIndex').get() or {}
+
+owners = {}
+for user_id, profile in sorted(accounts.items(), key=lambda kv: str((kv[1] or {}).get('dateTime_creation', ''))
+                               if isinstance(kv[1], dict) else ''):
+    if not isinstance(profile, dict) or not profile.get('Username'):
+        continue
+    key = username_key(profile['Username'])
+    if not key:
+        continue
+    current = index.get(key)
+    if current and current != user_id and current in accounts:
+        owners.setdefault(key, current)  # already claimed through the live code path
+    owners.setdefault(key, user_id)
+    if owners[key] != user_id:
+        print(f"Username {profile['Username']!r} of {user_id} is already held by {owners[key]}. Not indexed.")
+
+updates = {}
+written = 0
+for key, user_id in owners.items():
+    if index.get(key) == user_id:
+        continue
+    updates[f"UsernameIndex/{key}"] = user_id
+    written += 1
+    if len(updates) >= 500:
+        ref.update(updates)
+        updates = {}
+updates["UsernameIndexMeta/Complete"] = True
+ref.update(updates)
+
+print(f"Migration complete. Usernames indexed: {len(owners)}, Entries written: {written}")
@@ -1,8 +1,9 @@
-from flask import Blueprint, jsonify, request, Response, current_app
+from flask import Blueprint, jsonify, request, Response, current_app, g
 import traceback
 from services.account_service import account_service
-from services.exceptions import NotFoundError, DatabaseError
+from services.exceptions import NotFoundError, DatabaseError, ConflictError, ValidationError
 from services.jwt_middleware import jwt_required
+from services.versions import not_modified, tag
 import logging
 
 accounts_bp = Blueprint('accounts', __name__, url_prefix='/api/accounts')
@@ -12,11 +13,20 @@ accounts_bp = Blueprint('accounts', __name__, url_prefix='/api/accounts')
 def get_account(account_id):
     # User context is available via flask.g
     try:
+        # Versions are kept per UID; lookups by username still get an ETag once resolved
+        etag = account_service.account_etag(account_id)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
         try:
             data = account_service.get_acc(account_id)
         except NotFoundError:
             data = account_service.get_acc_by_username(account_id)
-        return jsonify(data), 200
+            etag = account_service.account_etag(data.get('UserID', account_id))
+            unchanged = not_modified(etag)
+            if unchanged:
+                return unchanged
+        return tag(jsonify(data), etag), 200
     except NotFoundError as e:
         return jsonify({"message": str(e)}), 404
     except DatabaseError as e:
@@ -33,6 +43,10 @@ def create_account():
             "message": "Account created successfully",
             "account_id": new_id
         }), 201
+    except ConflictError as e:
+        return jsonify({"error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except DatabaseError as e:
         return jsonify({"error": str(e)}), 400
 
@@ -58,6 +72,8 @@ def update_account(account_id):
         return jsonify(updated_account), 200
     except NotFoundError as e:
         return jsonify({"message": str(e)}), 404
+    except ConflictError as e:
+        return jsonify({"error": str(e)}), 409
     except DatabaseError as e:
         return jsonify({"error": str(e)}), 500
 
@@ -66,8 +82,12 @@ def update_account(account_id):
 @jwt_required
 def get_favorites(account_id):
     try:
+        etag = account_service.account_etag(account_id)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
         favorites = account_service.get_favorites(account_id)
-        return jsonify({"Favorites": favorites}), 200
+        return tag(jsonify({"Favorites": favorites}), etag), 200
     except NotFoundError as e:
         return jsonify({"message": str(e)}), 404
     except DatabaseError as e:
@@ -79,12 +99,29 @@ def update_favorites(account_id):
     payload = request.get_json() or {}
     favorites = payload.get('Favorites', [])
     try:
-        updated = account_service.update_favorites(account_id, favorites)
+        updated = account_service.update_favorites(account_id, g.marketplace_id, favorites)
         return jsonify({"Favorites": updated}), 200
     except NotFoundError as e:
         return jsonify({"message": str(e)}), 404
     except DatabaseError as e:
         return jsonify({"error": str(e)}), 500    
+
+# Favorite / unfavorite one listing. Single-child writes, so clicks from two tabs don't overwrite each other.
+@accounts_bp.route('/<string:account_id>/favorites/<string:listing_id>', methods=['PUT', 'DELETE'])
+@jwt_required
+def set_favorite(account_id, listing_id):
+    if account_id != g.user_id:
+        return jsonify({"error": "Access forbidden"}), 403
+    try:
+        if request.method == 'PUT':
+            changed = account_service.add_favorite(account_id, g.marketplace_id, listing_id)
+        else:
+            changed = account_service.remove_favorite(account_id, g.marketplace_id, listing_id)
+        return jsonify({"ListingID": listing_id, "Favorited": request.method == 'PUT', "Changed": changed}), 200
+    except NotFoundError as e:
+        return jsonify({"message": str(e)}), 404
+    except DatabaseError as e:
+        return jsonify({"error": str(e)}), 500
 @accounts_bp.route('/<string:account_id>/pfp', methods=['OPTIONS', 'PUT'])
 def update_pfp(account_id):
     # 1) CORS preflight
@@ -97,10 +134,11 @@ def update_pfp(account_id):
         data_bytes = payload.get('data_bytes')
 
         try:
+            # the upload itself runs on the background job queue
             blob_key = account_service.add_pfp(account_id, data_bytes)
-            return jsonify(pfp_key=blob_key), 200
+            return jsonify(pfp_key=blob_key), 202
 
-        except LookupError as ve:
+        except (LookupError, ValidationError) as ve:
             return jsonify(message=str(ve)), 400
 
         except DatabaseError as de:
@@ -121,9 +159,13 @@ def get_pfp(account_id):
 
     try:
         logger.debug(f"GET /pfp for user_id={account_id}")
+        etag = account_service.pfp_etag(account_id)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
         img_bytes = account_service.get_pfp(account_id)
         logger.debug(f"Fetched {len(img_bytes)} bytes")
-        return Response(img_bytes, mimetype='application/octet-stream'), 200
+        return tag(Response(img_bytes, mimetype='application/octet-stream'), etag), 200
 
     except NotFoundError as nf:
         logger.info(f"No PFP for {account_id}: {nf}")
@@ -0,0 +1,38 @@
+# Admin endpoints for the background job queue: metrics, dead letters and requeueing
+from flask import Blueprint, jsonify, g
+from services.job_queue import job_queue
+from services.jwt_middleware import jwt_required
+from routes.admin_report import ADMIN_UIDS
+
+admin_jobs_bp = Blueprint('admin_jobs_bp', __name__, url_prefix='/api/admin/jobs')
+
+
+def _is_admin():
+    return getattr(g, 'user_id', None) in ADMIN_UIDS
+
+
+# Queue depth, oldest ready job age and recent latency
+@admin_jobs_bp.route('/metrics', methods=['GET'])
+@jwt_required
+def get_job_metrics():
+    if not _is_admin():
+        return jsonify({'error': 'Admin access only'}), 403
+    return jsonify(job_queue.metrics()), 200
+
+# Jobs that ran out of retries
+@admin_jobs_bp.route('/dead', methods=['GET'])
+@jwt_required
+def get_dead_jobs():
+    if not _is_admin():
+        return jsonify({'error': 'Admin access only'}), 403
+    return jsonify(job_queue.dead_letters()), 200
+
+# Give a dead job a fresh set of retries
+@admin_jobs_bp.route('/<int:job_id>/requeue', methods=['POST'])
+@jwt_required
+def requeue_job(job_id):
+    if not _is_admin():
+        return jsonify({'error': 'Admin access only'}), 403
+    if not job_queue.requeue(job_id):
+        return jsonify({'error': f'Job {job_id} is not dead-lettered'}), 404
+    return jsonify({'message': f'Job {job_id} requeued'}), 200
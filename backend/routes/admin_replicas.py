@@ -0,0 +1,16 @@
+# Admin endpoint exposing the in-memory listing replicas' size and lag
+from flask import Blueprint, jsonify, g
+from services.listing_replica import replica_manager
+from services.jwt_middleware import jwt_required
+from routes.admin_report import ADMIN_UIDS
+
+admin_replicas_bp = Blueprint('admin_replicas_bp', __name__, url_prefix='/api/admin/replicas')
+
+
+# Per-marketplace replica state, size and lag
+@admin_replicas_bp.route('/metrics', methods=['GET'])
+@jwt_required
+def get_replica_metrics():
+    if getattr(g, 'user_id', None) not in ADMIN_UIDS:
+        return jsonify({'error': 'Admin access only'}), 403
+    return jsonify({"enabled": replica_manager.enabled, "marketplaces": replica_manager.metrics()}), 200
@@ -1,6 +1,10 @@
 from flask import Blueprint, jsonify, request, g
 from services import openai_price_fill
+from services.job_queue import job_queue
 from services.jwt_middleware import jwt_required
+from services.price_cache import prediction_cache
+from services.price_estimator import estimator_manager, price_fill_metrics
+from routes.admin_report import ADMIN_UIDS
 import logging
 import traceback
 
@@ -29,10 +33,23 @@ def get_price_range():
             f"POST /api/ai_price_fill/ payload: "
             f"category={category}, name={name}, description={description}"
         )
+        # ?async=true: queue the OpenAI call and let the client poll /jobs/<job_id>.
+        # Jobs belong to the user who queued them, and so do their idempotency keys.
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            client_key = request.headers.get('Idempotency-Key')
+            job_id = job_queue.enqueue(
+                'price_prediction',
+                {'user_id': g.user_id, 'marketplace_id': g.marketplace_id,
+                 'category': category, 'name': name, 'description': description},
+                idempotency_key=f"price:{g.user_id}:{client_key}" if client_key else None,
+                max_attempts=3
+            )
+            return jsonify({"job_id": job_id, "status": "queued"}), 202
+
         try:
-            # call the service
-            range_data = openai_price_fill.get_price_prediction(
-                category, name, description
+            # call the service: the marketplace's local estimator when it is confident, else OpenAI
+            range_data = openai_price_fill.suggest_price(
+                g.marketplace_id, category, name, description
             )
             if range_data:
                 return jsonify(range_data), 200
@@ -55,4 +72,34 @@ def get_price_range():
             }), 500
 
     # call our protected POST handler
-    return _protected()
\ No newline at end of file
+    return _protected()
+
+
+# Poll a queued price prediction; other users' jobs are reported as not found
+@ai_price_fill_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required
+def get_price_range_job(job_id):
+    job = job_queue.get_job(job_id)
+    if not job or job['kind'] != 'price_prediction' or job['payload'].get('user_id') != g.user_id:
+        return jsonify({"message": f"Job {job_id} not found"}), 404
+    body = {"job_id": job_id, "status": job['status']}
+    if job['status'] == 'done':
+        body.update(job['result'] or {})
+    elif job['status'] == 'dead':
+        body["error"] = job['last_error']
+    return jsonify(body), 200
+
+
+# How often price fills are answered locally, from the prediction cache or by OpenAI, with latencies,
+# plus the local models' sizes and the cache's hit counts
+@ai_price_fill_bp.route('/metrics', methods=['GET'])
+@jwt_required
+def get_price_fill_metrics():
+    if getattr(g, 'user_id', None) not in ADMIN_UIDS:
+        return jsonify({'error': 'Admin access only'}), 403
+    return jsonify({
+        "enabled": estimator_manager.enabled,
+        "paths": price_fill_metrics.metrics(),
+        "models": estimator_manager.metrics(),
+        "cache": prediction_cache.metrics(),
+    }), 200
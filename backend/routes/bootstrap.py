@@ -0,0 +1,72 @@
+from flask import Blueprint, jsonify, request, g
+from services import listing_service
+from services.account_service import account_service, favorite_ids
+from services.fanout import fan_out
+from services.jwt_middleware import jwt_required
+from services.versions import not_modified, tag
+import hashlib
+import logging
+
+bootstrap_bp = Blueprint('bootstrap_bp', __name__)
+logger = logging.getLogger(__name__)
+
+# Largest ?limit= for the first listings page
+MAX_FIRST_PAGE = 100
+
+
+# What the homepage needs to render after login, in one authenticated request:
+#   viewer     the caller's account (as GET /api/accounts/<id> returns it)
+#   favorites  the caller's favorite listing ids
+#   listings   the newest ?limit= listings (default 25), shaped like GET /api/listings items
+#   avatar     presigned URL of the caller's profile picture, or null
+# The token is verified and the account read once, by jwt_required; viewer and favorites come from
+# that read. The listings page and the avatar URL are fetched concurrently. Clients load the full
+# listing set from GET /api/listings after first render. A failed section is null with its error
+# under "errors", and the response is then not cacheable.
+@bootstrap_bp.route('', methods=['GET'])
+@jwt_required
+def bootstrap():
+    user_id = g.user_id
+    marketplace_id = g.marketplace_id
+    account = g.account
+    try:
+        limit = min(int(request.args.get('limit', listing_service.FIRST_PAGE_SIZE)), MAX_FIRST_PAGE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    raw_fields = request.args.get('fields')
+    fields = [f.strip() for f in raw_fields.split(',') if f.strip()] if raw_fields else None
+    logger.info(f"GET /bootstrap for user {user_id} in marketplace {marketplace_id}")
+
+    try:
+        etag = hashlib.sha1('|'.join((
+            account_service.account_etag(user_id),
+            account_service.avatar_etag(user_id),
+            listing_service.listings_etag(marketplace_id, variant=f"bootstrap-{limit}-{raw_fields or ''}"),
+        )).encode()).hexdigest()
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+
+        results = fan_out({
+            'listings': lambda: listing_service.get_listings_page(marketplace_id, limit, fields=fields),
+            'avatar': lambda: account_service.get_avatar_url(user_id),
+        })
+
+        payload = {"viewer": account, "favorites": favorite_ids(account.get('Favorites')), "errors": {}}
+        for name, outcome in results.items():
+            payload[name] = outcome.value if outcome.ok else None
+            if not outcome.ok:
+                payload["errors"][name] = str(outcome.error)
+        logger.debug(f"Bootstrap for {user_id} timings: " +
+                     ", ".join(f"{name}={outcome.seconds * 1000:.0f}ms" for name, outcome in results.items()))
+
+        response = jsonify(payload)
+        if payload["errors"]:
+            response.headers['Cache-Control'] = 'no-store'
+            return response, 200
+        return tag(response, etag), 200
+    except Exception as e:
+        logger.error(f"Error building bootstrap for user {user_id} in marketplace {marketplace_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to load homepage data"}), 500
@@ -9,6 +9,8 @@ import traceback
 import logging
 
 from services.jwt_middleware import jwt_required
+from services.chat_service import chat_service
+from services.versions import not_modified, tag
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +45,10 @@ def get_user_chats():
     marketplace_id = g.marketplace_id
     logger.info(f"Fetching chats for user {user_id} in marketplace {marketplace_id}")
     try:
+        etag = chat_service.chats_etag(marketplace_id, user_id)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
         chats_ref = _get_marketplace_chats_ref()
         all_chats = chats_ref.get() or {}
         logger.debug(f"Retrieved {len(all_chats)} total chats from marketplace path {chats_ref.path}")
@@ -84,7 +90,7 @@ def get_user_chats():
                 })
 
         logger.info(f"Found {len(user_chats)} chats for user {user_id} in marketplace {marketplace_id}")
-        return jsonify({"chats": user_chats}), 200
+        return tag(jsonify({"chats": user_chats}), etag), 200
     except ValueError as ve:
         logger.error(f"Value error getting user chats for {user_id}: {ve}")
         return jsonify({"error": str(ve)}), 400
@@ -104,11 +110,10 @@ def get_chat_messages(chat_id):
     marketplace_id = g.marketplace_id
     logger.info(f"Fetching messages for chat {chat_id} in marketplace {marketplace_id} for user {user_id}")
     try:
-        chats_ref = _get_marketplace_chats_ref()
-        chat_ref = chats_ref.child(chat_id)
-        chat = chat_ref.get()
+        etag = chat_service.chat_etag(marketplace_id, chat_id)
+        chat = chat_service.get_chat(marketplace_id, chat_id)
 
-        if not chat or not isinstance(chat, dict):
+        if not chat:
             logger.warning(f"Chat {chat_id} not found in marketplace {marketplace_id}")
             return jsonify({"error": "Chat not found"}), 404
 
@@ -117,6 +122,10 @@ def get_chat_messages(chat_id):
             logger.warning(f"Permission denied: User {user_id} tried to access chat {chat_id} (marketplace {marketplace_id}) they are not part of.")
             return jsonify({"error": "Access forbidden"}), 403
 
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+
         messages_data = chat.get('Messages', {}) or {}
         message_list = []
 
@@ -133,12 +142,12 @@ def get_chat_messages(chat_id):
                  logger.warning(f"Skipping invalid message data (not a dict) for msg_id {msg_id} in chat {chat_id}")
 
         logger.info(f"Successfully retrieved {len(message_list)} messages for chat {chat_id}")
-        return jsonify({
+        return tag(jsonify({
             'chat_id': chat_id,
             'listing_id': chat.get('ListingID', ''), 
             'participants': participants, 
             'messages': message_list
-        }), 200
+        }), etag), 200
 
     except ValueError as ve:
         logger.error(f"Value error getting chat messages for {chat_id}: {ve}")
@@ -179,23 +188,12 @@ def start_or_get_chat():
     logger.debug(f"Request details: listing={listing_id}, seller={seller_id}, buyer={user_id}, marketplace={marketplace_id}")
 
     try:
-        chats_ref = _get_marketplace_chats_ref()
-        existing_chats = chats_ref.get() or {}
-
         existing_chat_id = None
         existing_chat_data = None
-        participants_set = {user_id, seller_id}
-
-        for chat_id_key, chat_data_val in existing_chats.items():
-            if isinstance(chat_data_val, dict):
-                 if str(chat_data_val.get('ListingID')) == str(listing_id) and \
-                    set(chat_data_val.get('Participants', [])) == participants_set:
-                    existing_chat_id = chat_id_key
-                    existing_chat_data = chat_data_val
-                    logger.info(f"Found existing chat {existing_chat_id} for listing {listing_id} between {user_id} and {seller_id} in marketplace {marketplace_id}")
-                    break
-            else:
-                logger.warning(f"Skipping invalid chat data (not a dict) for chat_id {chat_id_key} during lookup.")
+        found = chat_service.find_chat(marketplace_id, listing_id, [user_id, seller_id])
+        if found:
+            existing_chat_id, existing_chat_data = found
+            logger.info(f"Found existing chat {existing_chat_id} for listing {listing_id} between {user_id} and {seller_id} in marketplace {marketplace_id}")
 
         if existing_chat_id and existing_chat_data:
             chat_id = existing_chat_id
@@ -203,16 +201,7 @@ def start_or_get_chat():
             status_code = 200 
         else:
             logger.info(f"Creating new chat for listing {listing_id} between {user_id} and {seller_id} in marketplace {marketplace_id}")
-            timestamp = datetime.utcnow().isoformat()
-            new_chat_payload = {
-                'ListingID': listing_id,
-                'Participants': [user_id, seller_id], 
-                'CreatedAt': timestamp,
-                'Messages': {} 
-            }
-            new_chat_ref = chats_ref.push(new_chat_payload)
-            chat_id = new_chat_ref.key
-            created_at = timestamp
+            chat_id, created_at = chat_service.create_chat(marketplace_id, listing_id, [user_id, seller_id])
             status_code = 201 
             logger.info(f"Created new chat with ID: {chat_id} in marketplace {marketplace_id}")
 
@@ -257,11 +246,8 @@ def send_chat_message(chat_id):
         return jsonify({"error": "Message content cannot be empty"}), 400
 
     try:
-        chats_ref = _get_marketplace_chats_ref()
-        chat_ref = chats_ref.child(chat_id)
-
-        chat_data = chat_ref.get()
-        if not chat_data or not isinstance(chat_data, dict):
+        chat_data = chat_service.get_chat(marketplace_id, chat_id)
+        if not chat_data:
             logger.warning(f"Chat {chat_id} not found in marketplace {marketplace_id} for sending message by user {user_id}")
             return jsonify({"error": "Chat not found"}), 404
 
@@ -270,17 +256,7 @@ def send_chat_message(chat_id):
             logger.warning(f"Permission denied: User {user_id} tried to send message to chat {chat_id} (marketplace {marketplace_id}) they are not part of.")
             return jsonify({"error": "Access forbidden"}), 403
 
-        messages_ref = chat_ref.child('Messages')
-        timestamp = datetime.utcnow().isoformat()
-        message_data = {
-            'SenderID': user_id,
-            'Content': message_content.strip(), 
-            'Timestamp': timestamp,
-            'Read': False 
-        }
-
-        new_message_ref = messages_ref.push(message_data)
-        message_id = new_message_ref.key
+        message_id, timestamp = chat_service.add_message(marketplace_id, chat_id, user_id, message_content.strip())
 
         logger.info(f"Successfully sent message {message_id} from user {user_id} to chat {chat_id} in marketplace {marketplace_id}")
 
@@ -312,12 +288,9 @@ def delete_chat(chat_id):
     logger.info(f"Request to delete chat {chat_id} in marketplace {marketplace_id} by user {user_id}")
 
     try:
-        chats_ref = _get_marketplace_chats_ref()
-        chat_ref = chats_ref.child(chat_id)
-
         # Check that the chat exists and the user is a participant before deleting.
-        chat_data = chat_ref.get()
-        if not chat_data or not isinstance(chat_data, dict):
+        chat_data = chat_service.get_chat(marketplace_id, chat_id)
+        if not chat_data:
             # If the chat doesn't exist, treat as already deleted (idempotent delete).
             logger.warning(f"Chat {chat_id} not found in marketplace {marketplace_id} during delete request by user {user_id}. Returning success.")
             return jsonify({"message": "Chat not found or already deleted"}), 200 # Or 204 No Content
@@ -329,7 +302,7 @@ def delete_chat(chat_id):
             return jsonify({"error": "Access forbidden"}), 403
 
         # Proceed to delete the chat.
-        chat_ref.delete()
+        chat_service.delete_chat(marketplace_id, chat_id)
         logger.info(f"Successfully deleted chat {chat_id} in marketplace {marketplace_id} by user {user_id}")
         # Return 204 No Content to indicate successful deletion.
         return '', 204
@@ -0,0 +1,58 @@
+# Blueprint for the cached image proxy (only active when the image cache is enabled)
+from flask import Blueprint, jsonify, request, send_file
+from services import blob_storage, image_cache
+import logging
+
+images_bp = Blueprint('images_bp', __name__, url_prefix='/api/images')
+logger = logging.getLogger(__name__)
+
+LISTING_KEY_PREFIX = "x%Tz^Lp&"
+
+
+def _sniff_mimetype(path):
+    with open(path, 'rb') as f:
+        head = f.read(12)
+    if head.startswith(b'\x89PNG'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+# Serve a listing image from the local disk cache, filling it from blob storage on a miss.
+# <img> tags cannot send a bearer token, so like presigned bucket URLs the link itself is the
+# credential: ?expires=&sig= as issued by image_cache.url_for_key. Browsers may keep the image
+# privately until the link expires.
+@images_bp.route('/<path:key>', methods=['GET'])
+def get_image(key):
+    cache = image_cache.get_cache()
+    if cache is None:
+        return jsonify({"message": "Image cache is not enabled"}), 404
+    if not key.startswith(LISTING_KEY_PREFIX):
+        return jsonify({"message": "Image not found"}), 404
+    max_age = image_cache.verify_url(key, request.args.get('expires'), request.args.get('sig'))
+    if max_age is None:
+        return jsonify({"message": "Image link is invalid or has expired"}), 403
+
+    # Two attempts: the file may be evicted between the lookup and opening it
+    for _ in range(2):
+        try:
+            path, etag = cache.get_or_fill(key, blob_storage.get_image_from_key)
+            # send_file hands the open file to the server (wsgi.file_wrapper / sendfile)
+            # and answers If-None-Match with 304 since conditional=True
+            response = send_file(path, mimetype=_sniff_mimetype(path), etag=etag,
+                                 conditional=True, max_age=max_age)
+        except FileNotFoundError:
+            cache.invalidate(key)
+            continue
+        except image_cache.ImageNotFound:
+            return jsonify({"message": "Image not found"}), 404
+        except Exception as e:
+            logger.warning(f"Failed to load image {key} into cache: {e}")
+            return jsonify({"message": "Image not found"}), 404
+        response.cache_control.private = True
+        response.headers.pop('Content-Disposition', None)  # don't leak the cache file name
+        return response
+    return jsonify({"message": "Image not found"}), 404
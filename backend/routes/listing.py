@@ -1,11 +1,37 @@
-from flask import Blueprint, jsonify, request, g 
+from flask import Blueprint, Response, jsonify, request, g, stream_with_context
 from services import listing_service
+from services.account_service import account_service
+from services.review_service import review_service
+from services.chat_service import chat_service
+from services.fanout import fan_out
+from services.response_cache import choose_encoding
 from services.jwt_middleware import jwt_required
+from services.exceptions import ValidationError
+from services.versions import not_modified, tag
+import json
 import logging
 
 listings_bp = Blueprint('listings_bp', __name__, url_prefix='/api/listings') 
 logger = logging.getLogger(__name__)
 
+def _requested_fields():
+    """?fields=Title,Price,... as a list (ListingID is always returned), or None for full listings."""
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    return [f.strip() for f in raw.split(',') if f.strip()]
+
+
+def _encoded_response(encoded, content_encoding, etag):
+    """Response for a pre-encoded JSON body in the given encoding (None for identity)."""
+    response = Response(encoded.body_for(content_encoding), status=200, mimetype='application/json')
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    tag(response, etag)  # the ETag names the representation, so each encoding gets its own
+    response.headers['Vary'] = 'Accept-Encoding, Authorization'
+    return response
+
+
 # Retrieve a listing by its listing_id.
 @listings_bp.route('/<string:listing_id>', methods=['GET'])
 @jwt_required
@@ -13,9 +39,13 @@ def get_listing(listing_id):
     marketplace_id = g.marketplace_id
     logger.info(f"GET /listings/{listing_id} for marketplace {marketplace_id}")
     try:
-        listing_data = listing_service.get_listing(marketplace_id, listing_id)
+        etag = listing_service.listing_etag(marketplace_id, listing_id)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+        listing_data = listing_service.get_listing(marketplace_id, listing_id, fields=_requested_fields())
         if listing_data:
-            return jsonify(listing_data), 200
+            return tag(jsonify(listing_data), etag), 200
         else:
             logger.warning(f"Listing {listing_id} not found in marketplace {marketplace_id}")
             return jsonify({"message": f"Listing {listing_id} not found"}), 404
@@ -24,20 +54,170 @@ def get_listing(listing_id):
          return jsonify({"error": "Failed to retrieve listing"}), 500
 
 
+# Everything the listing page needs in one round trip: the listing, its seller's public profile and
+# rating, and the viewer's existing chat about it. The reads run concurrently; a section that fails
+# comes back null with its error under "errors" instead of failing the whole page.
+@listings_bp.route('/<string:listing_id>/bundle', methods=['GET'])
+@jwt_required
+def get_listing_bundle(listing_id):
+    marketplace_id = g.marketplace_id
+    user_id = g.user_id  # fan-out calls run outside the request context
+    logger.info(f"GET /listings/{listing_id}/bundle for user {user_id} in marketplace {marketplace_id}")
+    try:
+        seller_id = listing_service.get_listing_owner(marketplace_id, listing_id)
+        if not seller_id:
+            return jsonify({"message": f"Listing {listing_id} not found"}), 404
+
+        calls = {
+            'listing': lambda: listing_service.get_listing(marketplace_id, listing_id),
+            'seller': lambda: account_service.get_public_profile(seller_id),
+            'rating': lambda: review_service.get_seller_rating(seller_id),
+        }
+        if seller_id != user_id:
+            calls['chat'] = lambda: chat_service.find_chat(marketplace_id, listing_id, [user_id, seller_id])
+        results = fan_out(calls)
+
+        listing = results['listing']
+        if not listing.ok:
+            raise listing.error
+        if not listing.value:
+            return jsonify({"message": f"Listing {listing_id} not found"}), 404
+
+        bundle = {"listing": listing.value, "seller": None, "rating": None, "chat": None, "errors": {}}
+        for section in ('seller', 'rating', 'chat'):
+            outcome = results.get(section)
+            if outcome is None:
+                continue
+            if outcome.ok:
+                bundle[section] = outcome.value
+            else:
+                bundle["errors"][section] = str(outcome.error)
+        if bundle["chat"]:
+            chat_id, chat = bundle["chat"]
+            bundle["chat"] = {'id': chat_id, 'listing_id': listing_id, 'buyer_id': user_id,
+                              'seller_id': seller_id, 'created_at': chat.get('CreatedAt')}
+        logger.debug(f"Bundle for listing {listing_id} timings: " +
+                     ", ".join(f"{name}={outcome.seconds * 1000:.0f}ms" for name, outcome in results.items()))
+        return jsonify(bundle), 200
+    except Exception as e:
+        logger.error(f"Error building bundle for listing {listing_id} in marketplace {marketplace_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to retrieve listing"}), 500
+
+
 # Retrieve all listings for the user's marketplace.
+# ?fields=Title,Price,CoverImageUrl,... limits the keys per listing; grid-only projections are read from ListingSummary.
 @listings_bp.route('/', methods=['GET'])
 @jwt_required
 def get_listings(): 
     marketplace_id = g.marketplace_id
     logger.info(f"GET /listings for marketplace {marketplace_id}")
     try:
-        listing_data = listing_service.get_all_listings_total(marketplace_id)
-        return jsonify(listing_data or []), 200 
+        # Served from the pre-encoded response cache; the query shape is part of the key
+        content_encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        etag = listing_service.listings_etag(marketplace_id, variant=content_encoding or '')
+        unchanged = not_modified(etag)
+        if unchanged:
+            unchanged.headers['Vary'] = 'Accept-Encoding, Authorization'
+            return unchanged
+        shape = tuple(sorted(request.args.items(multi=True)))
+        encoded = listing_service.get_all_listings_encoded(marketplace_id, shape, fields=_requested_fields())
+        return _encoded_response(encoded, content_encoding, etag)
     except Exception as e:
         logger.error(f"Error fetching all listings for marketplace {marketplace_id}: {e}", exc_info=True)
         return jsonify({"error": "Failed to retrieve listings"}), 500
 
 
+# Incremental sync: listings changed or removed since a version token from an earlier call.
+# Without ?since= this returns every listing plus the token to use next time.
+@listings_bp.route('/changes', methods=['GET'])
+@jwt_required
+def get_listing_changes():
+    marketplace_id = g.marketplace_id
+    since = request.args.get('since')
+    logger.info(f"GET /listings/changes since {since} for marketplace {marketplace_id}")
+    try:
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError("'since' must be a version token returned by this endpoint.")
+        return jsonify(listing_service.get_listing_changes(marketplace_id, since, fields=_requested_fields())), 200
+    except ValidationError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        logger.error(f"Error fetching listing changes for marketplace {marketplace_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to retrieve listing changes"}), 500
+
+
+# Stream every listing in the marketplace as one JSON array, read from RTDB page by page.
+# For exports of whole marketplaces: memory stays flat however many listings there are.
+# Supports ?fields= like GET /api/listings. An error mid-stream truncates the array.
+@listings_bp.route('/export', methods=['GET'])
+@jwt_required
+def export_listings():
+    marketplace_id = g.marketplace_id
+    fields = _requested_fields()
+    logger.info(f"GET /listings/export for marketplace {marketplace_id}")
+
+    def generate():
+        yield '['
+        try:
+            for i, listing in enumerate(listing_service.iter_listings(marketplace_id, fields=fields)):
+                yield (',' if i else '') + json.dumps(listing, separators=(',', ':'))
+        except Exception as e:
+            # Headers are already sent; stop here and leave the array unterminated so clients notice
+            logger.error(f"Error streaming listing export for marketplace {marketplace_id}: {e}", exc_info=True)
+            return
+        yield ']'
+
+    return Response(stream_with_context(generate()), status=200, mimetype='application/json')
+
+
+# The marketplace's most favorited listings, most first, each with its "Favorites" count. ?limit= (default 20).
+@listings_bp.route('/most-favorited', methods=['GET'])
+@jwt_required
+def get_most_favorited():
+    marketplace_id = g.marketplace_id
+    try:
+        limit = min(int(request.args.get('limit', 20)), listing_service.MAX_BATCH_IDS)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    logger.info(f"GET /listings/most-favorited for marketplace {marketplace_id}")
+    try:
+        ranked = account_service.get_most_favorited(marketplace_id, limit)
+        batch = listing_service.get_listings_batch(marketplace_id, [r["ListingID"] for r in ranked],
+                                                   fields=_requested_fields())
+        listings = [dict(batch["listings"][r["ListingID"]], Favorites=r["Favorites"])
+                    for r in ranked if r["ListingID"] in batch["listings"]]
+        return jsonify(listings), 200
+    except Exception as e:
+        logger.error(f"Error fetching most favorited listings for marketplace {marketplace_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to retrieve listings"}), 500
+
+
+# Several listings by id in one request, e.g. for favorites pages and chat thumbnails.
+# Body: {"ids": ["-N...", ...]} (at most 100). Supports ?fields= like GET /api/listings.
+# Returns {"listings": {id: listing}, "missing": [ids not found or not visible]}.
+@listings_bp.route('/batch', methods=['POST'])
+@jwt_required
+def get_listings_batch():
+    marketplace_id = g.marketplace_id
+    data = request.get_json(silent=True) or {}
+    listing_ids = data.get('ids')
+    if not isinstance(listing_ids, list):
+        return jsonify({"error": "Request body must be {\"ids\": [listing ids]}"}), 400
+    logger.info(f"POST /listings/batch ({len(listing_ids)} ids) for marketplace {marketplace_id}")
+    try:
+        return jsonify(listing_service.get_listings_batch(marketplace_id, listing_ids, fields=_requested_fields())), 200
+    except ValidationError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        logger.error(f"Error in batch get of listings for marketplace {marketplace_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to retrieve listings"}), 500
+
+
 # Retrieve all listings for a specific user within their marketplace.
 @listings_bp.route('/user/<string:account_id>', methods=['GET'])
 @jwt_required
@@ -45,8 +225,16 @@ def get_account_listing(account_id):
     marketplace_id = g.marketplace_id
     logger.info(f"GET /listings/user/{account_id} for marketplace {marketplace_id}")
     try:
-        listing_data = listing_service.get_all_listings_user(marketplace_id, account_id)
-        return jsonify(listing_data or []), 200 
+        # Owners also see their listings whose images are still processing (flagged by ImageStatus)
+        include_pending = (account_id == g.user_id)
+        etag = listing_service.listings_etag(marketplace_id, variant=f"user-{account_id}-{int(include_pending)}")
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+        listing_data = listing_service.get_all_listings_user(marketplace_id, account_id,
+                                                             include_pending=include_pending,
+                                                             fields=_requested_fields())
+        return tag(jsonify(listing_data or []), etag), 200 
     except Exception as e:
          logger.error(f"Error fetching listings for user {account_id} in marketplace {marketplace_id}: {e}", exc_info=True)
          return jsonify({"error": "Failed to retrieve user listings"}), 500
@@ -71,8 +259,15 @@ def create_listing():
     elif not payload_user_id:
         listing_data['UserID'] = user_id 
 
+    # ?async=true: save the listing now and process its images in the background (202 Accepted)
+    async_images = request.args.get('async', '').lower() in ('1', 'true', 'yes')
+
     try:
-        new_listing_id = listing_service.add_listing(marketplace_id, listing_data)
+        new_listing_id = listing_service.add_listing(marketplace_id, listing_data, async_images=async_images)
+        if new_listing_id and async_images:
+             logger.info(f"Listing {new_listing_id} accepted in marketplace {marketplace_id}; images processing")
+             return jsonify({"message": "Listing accepted, images are processing", "listing_id": new_listing_id,
+                             "ImageStatus": listing_service.IMAGE_STATUS_PROCESSING}), 202
         if new_listing_id:
              logger.info(f"Listing created with ID {new_listing_id} in marketplace {marketplace_id}")
              return jsonify({"message": "Listing created successfully", "listing_id": new_listing_id}), 201
@@ -110,7 +305,7 @@ def update_listing(listing_id):
     except PermissionError as pe: 
          logger.warning(f"Permission denied for user {user_id} updating listing {listing_id}: {pe}")
          return jsonify({"error": str(pe)}), 403
-    except ValueError as ve:
+    except (ValueError, ValidationError) as ve:
          logger.error(f"Validation error updating listing {listing_id}: {ve}")
          return jsonify({"error": str(ve)}), 400
     except Exception as e:
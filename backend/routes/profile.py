@@ -0,0 +1,101 @@
+from flask import Blueprint, jsonify, request, g
+from services import listing_service
+from services.account_service import account_service, AVATAR_ETAG_WINDOW
+from services.review_service import review_service
+from services.exceptions import NotFoundError
+from services.fanout import fan_out
+from services.jwt_middleware import jwt_required
+from services.versions import not_modified, tag
+import hashlib
+import logging
+
+profiles_bp = Blueprint('profiles_bp', __name__)
+logger = logging.getLogger(__name__)
+
+SECTIONS = ('account', 'listings', 'rating', 'avatar')
+
+# Seconds a client may reuse a section before revalidating it with its ETag.
+# The avatar is a presigned URL good for an hour, so it can be kept for half of that.
+SECTION_MAX_AGE = {'account': 0, 'listings': 0, 'rating': 300, 'avatar': AVATAR_ETAG_WINDOW}
+
+# Largest ?limit= for the listings section
+MAX_LISTINGS_LIMIT = 100
+
+
+def _requested_sections():
+    raw = request.args.get('sections')
+    if not raw:
+        return list(SECTIONS)
+    wanted = {s.strip() for s in raw.split(',')}
+    return [s for s in SECTIONS if s in wanted]
+
+
+# Everything a profile page shows in one round trip: public account fields, a page of the user's
+# listings, their rating summary and their avatar URL, read concurrently.
+#   ?sections=account,rating      only these sections (e.g. to refresh the ones whose maxAge ran out)
+#   ?limit=24&after=<cursor>      listings page size and the previous page's "next" cursor
+# Each section in "sections" carries its own ETag and maxAge. A section that fails comes back null
+# with its error under "errors", and the response is then not cacheable.
+@profiles_bp.route('/<string:account_id>', methods=['GET'])
+@jwt_required
+def get_profile(account_id):
+    marketplace_id = g.marketplace_id
+    include_pending = (account_id == g.user_id)  # owners also see listings whose images are processing
+    sections = _requested_sections()
+    if not sections:
+        return jsonify({"error": f"sections must include one of {', '.join(SECTIONS)}"}), 400
+    try:
+        limit = min(int(request.args.get('limit', listing_service.USER_PAGE_SIZE)), MAX_LISTINGS_LIMIT)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    after = request.args.get('after')
+    logger.info(f"GET /profiles/{account_id} sections={sections} in marketplace {marketplace_id}")
+
+    try:
+        etags = {
+            'account': lambda: account_service.account_etag(account_id),
+            'listings': lambda: listing_service.listings_etag(
+                marketplace_id, variant=f"user-{account_id}-{int(include_pending)}-{limit}-{after or ''}"),
+            'rating': lambda: review_service.rating_etag(account_id),
+            'avatar': lambda: account_service.avatar_etag(account_id),
+        }
+        section_etags = {name: etags[name]() for name in sections}
+        etag = hashlib.sha1('|'.join(f"{n}={e}" for n, e in section_etags.items()).encode()).hexdigest()
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+
+        calls = {
+            'account': lambda: account_service.get_public_profile(account_id),
+            'listings': lambda: listing_service.get_listings_user_page(
+                marketplace_id, account_id, limit=limit, after=after, include_pending=include_pending),
+            'rating': lambda: review_service.get_seller_rating(account_id),
+            'avatar': lambda: account_service.get_avatar_url(account_id),
+        }
+        results = fan_out({name: calls[name] for name in sections})
+
+        account = results.get('account')
+        if account is not None and isinstance(account.error, NotFoundError):
+            return jsonify({"message": f"Account {account_id} not found"}), 404
+
+        profile = {"UserID": account_id, "sections": {}, "errors": {}}
+        for name, outcome in results.items():
+            if outcome.ok:
+                profile[name] = outcome.value
+                profile["sections"][name] = {"etag": section_etags[name], "maxAge": SECTION_MAX_AGE[name]}
+            else:
+                profile[name] = None
+                profile["errors"][name] = str(outcome.error)
+        logger.debug(f"Profile {account_id} timings: " +
+                     ", ".join(f"{name}={outcome.seconds * 1000:.0f}ms" for name, outcome in results.items()))
+
+        response = jsonify(profile)
+        if profile["errors"]:
+            response.headers['Cache-Control'] = 'no-store'  # don't let a partial page stand in for the full one
+            return response, 200
+        return tag(response, etag), 200
+    except Exception as e:
+        logger.error(f"Error building profile for {account_id} in marketplace {marketplace_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to retrieve profile"}), 500
@@ -1,14 +1,16 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, g
 from services import review_service
+from services.exceptions import NotFoundError, ValidationError
 
 reviews_bp = Blueprint('reviews_bp', __name__)
 
 from services.jwt_middleware import jwt_required
+from services.versions import not_modified, tag
 
 @reviews_bp.route('/<string:listing_id>', methods=['GET'])
 @jwt_required
-def get_review(current_user, listing_id):
-    review_data = review_service.get_review(int(listing_id))
+def get_review(listing_id):
+    review_data = review_service.get_review(listing_id)
     if review_data:
         return jsonify(review_data), 200
     else:
@@ -17,36 +19,59 @@ def get_review(current_user, listing_id):
 # api route to create a review, may reject if the particular listing does not exist
 @reviews_bp.route('/', methods=['POST'])
 @jwt_required
-def create_review(current_user):
+def create_review():
     review_data = request.json
     # Review data should have form:
     # {'ListingID': '121', 'Rating': 4, 'Review': 'Not bad, but buying process took a while.', 
     #  'ReviewDate': '2025-04-08T21:20:27.011530Z', 'ReviewerID': 18949, 'SellerID': 59130}
     try:
-        review_service.add_review(review_data)
+        review_service.add_review(review_data, marketplace_id=g.marketplace_id)
         return jsonify({"message": "Review created successfully", "listing_id": review_data.get('ListingID')}), 201
-    except ValueError as e:
+    except (ValueError, ValidationError) as e:
         return jsonify({"error": str(e)}), 400
+    except NotFoundError as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         return jsonify({"error": "An unexpected error occurred"}), 500
 
-# Get all reviews for a user (for profile star rating/count)
+# Get the reviews of a user as a seller, newest first. ?limit= pages the list; the cursor for the
+# next page comes back in the X-Next-Cursor header (absent on the last page) and goes in ?after=.
 @reviews_bp.route('/user/<string:user_id>', methods=['GET'])
 @jwt_required
-def get_reviews_for_user(current_user, user_id):
+def get_reviews_for_user(user_id):
     try:
-        # Get all reviews in DB
-        all_reviews = review_service.get_all_reviews()
-        # Filter reviews where SellerID == user_id (user is reviewee)
-        user_reviews = [r for r in all_reviews if str(r.get('SellerID')) == str(user_id)]
-        return jsonify(user_reviews), 200
+        limit = request.args.get('limit')
+        limit = int(limit) if limit else None
+        if limit is not None and limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    try:
+        user_reviews, next_cursor = review_service.get_seller_reviews(user_id, limit=limit, after=request.args.get('after'))
+        response = jsonify(user_reviews)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Star rating summary for a user as a seller: {"Count", "Average", "Histogram"}
+@reviews_bp.route('/user/<string:user_id>/rating', methods=['GET'])
+@jwt_required
+def get_rating_for_user(user_id):
+    try:
+        etag = review_service.rating_etag(user_id)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+        return tag(jsonify(review_service.get_seller_rating(user_id)), etag), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # Update review is not implemented in services yet
 @reviews_bp.route('/<string:listing_id>', methods=['PUT'])
 @jwt_required
-def update_review(current_user, listing_id):
+def update_review(listing_id):
     review_data = request.json
     # Note: The review service doesn't have an update_review function yet
     # This would need to be implemented in the review_service.py file
@@ -54,9 +79,9 @@ def update_review(current_user, listing_id):
 
 @reviews_bp.route('/<string:listing_id>', methods=['DELETE'])
 @jwt_required
-def delete_review(current_user, listing_id):
+def delete_review(listing_id):
     try:
-        review_service.del_review(int(listing_id))
+        review_service.del_review(listing_id)
         return jsonify({"message": f"Review for listing {listing_id} deleted successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -0,0 +1,31 @@
+from flask import Blueprint, jsonify, request, g
+from services.stats_service import stats_service
+from services.jwt_middleware import jwt_required
+from services.versions import not_modified, tag
+import logging
+
+stats_bp = Blueprint('stats_bp', __name__)
+logger = logging.getLogger(__name__)
+
+
+# Price guidance for the caller's marketplace.
+#   ?category=Furniture   {"category", "active", "sold", "trend"}: count, min/max/mean, p10-p90 and a
+#                         10-bin histogram of available listings' asking prices and of recent sale
+#                         prices, plus the median sale price of each of the last 8 weeks
+#   no category           {"categories": {category: available listing count}}
+# Categories are matched case-insensitively. Answered from in-memory NumPy buffers kept current on
+# every listing and transaction write.
+@stats_bp.route('/prices', methods=['GET'])
+@jwt_required
+def get_price_stats():
+    marketplace_id = g.marketplace_id
+    category = request.args.get('category', '').strip() or None
+    try:
+        etag = stats_service.price_stats_etag(marketplace_id, category)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+        return tag(jsonify(stats_service.get_price_stats(marketplace_id, category)), etag), 200
+    except Exception as e:
+        logger.error(f"Error getting price stats for {category} in marketplace {marketplace_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to get price statistics"}), 500
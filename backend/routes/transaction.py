@@ -1,51 +1,96 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, g
 from services import transaction_service
+from services.exceptions import NotFoundError, ValidationError, PermissionDeniedError, ConflictError
+import logging
 
 transactions_bp = Blueprint('transactions_bp', __name__)
+logger = logging.getLogger(__name__)
 
-# api route to get all transactions
 from services.jwt_middleware import jwt_required
 
+
+def _error_response(e, action):
+    if isinstance(e, (ValueError, ValidationError)):
+        return jsonify({"error": str(e)}), 400
+    if isinstance(e, PermissionDeniedError):
+        return jsonify({"error": str(e)}), 403
+    if isinstance(e, NotFoundError):
+        return jsonify({"error": str(e)}), 404
+    if isinstance(e, ConflictError):
+        return jsonify({"error": str(e)}), 409
+    logger.error(f"Failed to {action}: {e}", exc_info=True)
+    return jsonify({"error": "An unexpected error occurred"}), 500
+
+# api route to get the caller's transactions in their marketplace, newest first:
+#   ?role=buyer|seller    only purchases or only sales (default both)
+#   ?limit=20&after=<id>  page size and the previous page's "next" cursor
+# Returns {"transactions": [...], "next": cursor or null}
 @transactions_bp.route('/', methods=['GET'])
 @jwt_required
-def get_transactions(current_user):
-    # Mock implementation
-    return jsonify({"transactions": [
-        {"id": "trans1", "listing_id": "listing123", "buyer_id": "user456", "seller_id": "user123", "status": "pending", "created_at": "2025-04-07T10:00:00Z"},
-        {"id": "trans2", "listing_id": "listing456", "buyer_id": "user789", "seller_id": "user123", "status": "completed", "created_at": "2025-04-06T15:30:00Z"}
-    ]}), 200
+def get_transactions():
+    try:
+        limit = int(request.args.get('limit', transaction_service.DEFAULT_PAGE_SIZE))
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    try:
+        page = transaction_service.get_user_transactions(
+            g.marketplace_id, g.user_id, role=request.args.get('role'), limit=limit, after=request.args.get('after'))
+        return jsonify(page), 200
+    except Exception as e:
+        return _error_response(e, f"list transactions for {g.user_id}")
 
+# api route to get one transaction; only its buyer and seller can see it
 @transactions_bp.route('/<string:transaction_id>', methods=['GET'])
 @jwt_required
-def get_transaction(current_user, transaction_id):
-    transaction_data = transaction_service.get_transaction(int(transaction_id))
-    if transaction_data:
-        return jsonify(transaction_data), 200
-    else:
+def get_transaction(transaction_id):
+    try:
+        transaction_data = transaction_service.get_transaction(g.marketplace_id, transaction_id)
+    except NotFoundError:
         return jsonify({"message": f"Transaction {transaction_id} not found"}), 404
+    except Exception as e:
+        return _error_response(e, f"get transaction {transaction_id}")
+    if g.user_id not in (str(transaction_data.get('BuyerID')), str(transaction_data.get('SellerID'))):
+        return jsonify({"error": "Not a participant in this transaction"}), 403
+    return jsonify(transaction_data), 200
 
-# api route that creates a transaction
+# api route that creates a transaction. Body: {"ListingID", "BuyerID" (when the seller creates it),
+# "Price" (defaults to the listing's), "Status": "pending" (default) or "completed" (seller only)}
 @transactions_bp.route('/', methods=['POST'])
 @jwt_required
-def create_transaction(current_user):
-    transaction_data = request.json
-    # Mock implementation
-    # In a real implementation, would call: create_transaction(transaction_data)
-    return jsonify({"message": "Transaction created successfully", "transaction_id": "new_transaction_id"}), 201
+def create_transaction():
+    transaction_data = request.json or {}
+    try:
+        transaction = transaction_service.create_transaction(g.marketplace_id, g.user_id, transaction_data)
+        return jsonify({"message": "Transaction created successfully",
+                        "transaction_id": transaction['TransactionID'], "transaction": transaction}), 201
+    except Exception as e:
+        return _error_response(e, f"create transaction for listing {transaction_data.get('ListingID')}")
 
+# api route that moves a pending transaction on. Body: {"Status": "completed"} (seller only; marks
+# the listing sold) or {"Status": "cancelled"} (either participant)
 @transactions_bp.route('/<string:transaction_id>', methods=['PUT'])
 @jwt_required
-def update_transaction(current_user, transaction_id):
-    transaction_data = request.json
-    # Mock implementation
-    # In a real implementation, would call: update_transaction(transaction_id, transaction_data)
-    return jsonify({"message": f"Transaction {transaction_id} updated successfully"}), 200
+def update_transaction(transaction_id):
+    status = (request.json or {}).get('Status')
+    try:
+        if status == transaction_service.STATUS_COMPLETED:
+            transaction = transaction_service.complete_transaction(g.marketplace_id, transaction_id, g.user_id)
+        elif status == transaction_service.STATUS_CANCELLED:
+            transaction = transaction_service.cancel_transaction(g.marketplace_id, transaction_id, g.user_id)
+        else:
+            return jsonify({"error": "Status must be 'completed' or 'cancelled'"}), 400
+        return jsonify({"message": f"Transaction {transaction_id} updated successfully", "transaction": transaction}), 200
+    except Exception as e:
+        return _error_response(e, f"update transaction {transaction_id}")
 
+# api route that deletes a transaction that was never completed
 @transactions_bp.route('/<string:transaction_id>', methods=['DELETE'])
 @jwt_required
-def delete_transaction(current_user, transaction_id):
+def delete_transaction(transaction_id):
     try:
-        transaction_service.delete_transaction(int(transaction_id))
+        transaction_service.delete_transaction(g.marketplace_id, transaction_id, g.user_id)
         return jsonify({"message": f"Transaction {transaction_id} deleted successfully"}), 200
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
+        return _error_response(e, f"delete transaction {transaction_id}")
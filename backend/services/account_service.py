@@ -4,9 +4,17 @@
 import firebase_admin
 from firebase_admin import credentials, db
 from typing import Dict, Any
-from .exceptions import NotFoundError, DatabaseError
+from .exceptions import NotFoundError, DatabaseError, ConflictError, ValidationError
 from . import blob_storage
+from .job_queue import job_queue
+from .listing_service import listing_service
+from .versions import versions
 import re  # Import regex for domain extraction
+import time
+import base64
+import hashlib
+import io
+from PIL import Image
 import logging # Import logging
 
 # Configure logging (if not already done elsewhere)
@@ -52,44 +60,228 @@ def get_marketplace_id_from_email(email: str) -> str | None:
     return None
 
 
+# Avatar URLs are presigned for an hour; their ETags roll over every half hour (as listing ETags do)
+AVATAR_ETAG_WINDOW = 1800
+
+# Firebase fills these in on the server when the write is applied
+SERVER_TIMESTAMP = {'.sv': 'timestamp'}
+
+
+def increment(delta: int) -> dict:
+    return {'.sv': {'increment': delta}}
+
+
+# Characters Firebase doesn't allow in keys, escaped in UsernameIndex keys
+_KEY_ESCAPES = {c: f"%{ord(c):02X}" for c in '%.$#[]/'}
+
+
+def username_key(username: str) -> str:
+    """UsernameIndex key for a username: lowercased, with characters Firebase forbids in keys escaped."""
+    return ''.join(_KEY_ESCAPES.get(c, c) for c in username.strip().lower())
+
+
+def favorite_ids(raw) -> list:
+    """Listing IDs from a Favorites node, oldest first: a {listing_id: timestamp} map or a legacy list."""
+    if isinstance(raw, dict):
+        return [k for k, _ in sorted(raw.items(), key=lambda kv: (kv[1] if isinstance(kv[1], (int, float)) else 0, kv[0]))]
+    if isinstance(raw, list):
+        return list(dict.fromkeys(str(f) for f in raw if f))
+    return []
+
+
+def _favorites_map(raw):
+    """Transaction body converting a legacy Favorites list to a {listing_id: timestamp} map, keeping its order."""
+    if not isinstance(raw, list):
+        return raw
+    ids = favorite_ids(raw)
+    now = int(time.time() * 1000)
+    return {f: now - len(ids) + i for i, f in enumerate(ids)} or None
+
+
+# Account fields shown to other users on listing pages and profiles
+PUBLIC_ACCOUNT_FIELDS = ('UserID', 'First_Name', 'Last_Name', 'School', 'Username',
+                         'dateTime_creation', 'Pronouns', 'AboutMe')
+
+
 class AccountService:
     def __init__(self, db_ref=None):
         self.ref = db_ref or get_db_root()
+        self._username_index_complete = False # Set once migrate_usernames.py has run; never cleared
 
     def get_favorites(self, account_id: str) -> list:
         """
-        Retrieve the list of favorite listing IDs for a user.
+        Retrieve the list of favorite listing IDs for a user, oldest first. Reads only the Favorites node.
         """
-        acc = self.ref.child('Account').child(account_id).get()
-        if not acc:
-            raise NotFoundError(f"Account {account_id} not found.")
-        return acc.get('Favorites', [])
+        raw = self.ref.child('Account').child(account_id).child('Favorites').get()
+        if raw is None:
+            self._require_account(account_id)
+        return favorite_ids(raw)
+
+    def add_favorite(self, account_id: str, marketplace_id: str, listing_id: str) -> bool:
+        """
+        Favorite a listing. Sets Favorites/{listing_id} to the current time and increments the listing's
+        ListingFavorites count. Returns False if it was already a favorite; NotFoundError if the listing doesn't exist.
+        """
+        return self._set_favorites(account_id, marketplace_id, add=[listing_id], remove=[])
 
-    def update_favorites(self, account_id: str, favorites: list) -> list:
+    def remove_favorite(self, account_id: str, marketplace_id: str, listing_id: str) -> bool:
         """
-        Update the list of favorite listing IDs for a user. If the account does not have a Favorites field, add it.
+        Unfavorite a listing, decrementing its ListingFavorites count. Returns False if it wasn't a favorite.
         """
-        acc_ref = self.ref.child('Account').child(account_id)
-        existing = acc_ref.get()
-        if not existing:
+        return self._set_favorites(account_id, marketplace_id, add=[], remove=[listing_id])
+
+    def update_favorites(self, account_id: str, marketplace_id: str, favorites: list) -> list:
+        """
+        Replace a user's favorites with the given list of listing IDs. Only the difference is written,
+        so favorites added meanwhile from another tab are kept only if they are in the list.
+        """
+        current = set(self.get_favorites(account_id))
+        wanted = [str(f) for f in dict.fromkeys(favorites) if f]
+        self._set_favorites(account_id, marketplace_id,
+                            add=[f for f in wanted if f not in current],
+                            remove=[f for f in current if f not in set(wanted)])
+        return wanted
+
+    def _set_favorites(self, account_id: str, marketplace_id: str, add: list, remove: list) -> bool:
+        """
+        Flip each Favorites/{listing_id} child in its own transaction and move the listing's ListingFavorites
+        count only when that transaction changed it, so concurrent clicks from two tabs count once. Listings
+        being added must exist. A counter write that fails leaves the count off until migrate_favorites.py runs.
+        """
+        if not marketplace_id:
+            raise ValueError("marketplace_id cannot be empty")
+        add = [str(f) for f in dict.fromkeys(add) if f]
+        remove = [str(f) for f in dict.fromkeys(remove) if f and str(f) not in add]
+        try:
+            favorites_ref = self.ref.child('Account').child(account_id).child('Favorites')
+            raw = favorites_ref.get()
+            if raw is None:
+                self._require_account(account_id)
+            current = favorite_ids(raw)
+            add = [f for f in add if f not in current]
+            remove = [f for f in remove if f in current]
+            if not add and not remove:
+                return False
+            for listing_id in add:
+                if listing_service.get_listing_owner(marketplace_id, listing_id) is None:
+                    raise NotFoundError(f"Listing {listing_id} not found.")
+            if isinstance(raw, list):
+                favorites_ref.transaction(_favorites_map)
+
+            deltas = {}
+            for listing_id, favorited in [(f, True) for f in add] + [(f, False) for f in remove]:
+                if self._flip_favorite(favorites_ref.child(listing_id), favorited):
+                    deltas[listing_id] = 1 if favorited else -1
+            if not deltas:
+                return False
+            try:
+                self.ref.update({f"{marketplace_id}/ListingFavorites/{listing_id}": increment(delta)
+                                 for listing_id, delta in deltas.items()})
+            except Exception as e:
+                logger.error(f"Favorites of {account_id} changed but ListingFavorites counts were not updated: {e}")
+            versions.bump('account', account_id)
+            return True
+        except NotFoundError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to update favorites for {account_id}: {e}", exc_info=True)
+            raise DatabaseError(f"Failed to update favorites: {e}")
+
+    @staticmethod
+    def _flip_favorite(favorite_ref, favorited: bool) -> bool:
+        """Set (or clear) one Favorites child in a transaction. True if the committed attempt changed it."""
+        changed = {}
+
+        def flip(current):
+            changed['value'] = (current is None) == favorited
+            if not changed['value']:
+                return current
+            return int(time.time() * 1000) if favorited else None
+
+        favorite_ref.transaction(flip)
+        return changed.get('value', False)
+
+    def get_most_favorited(self, marketplace_id: str, limit: int = 20) -> list:
+        """
+        [{"ListingID", "Favorites"}] for the marketplace's most favorited listings, most first.
+        One indexed query (needs ".indexOn": ".value" on /{marketplace}/ListingFavorites).
+        """
+        try:
+            raw = self.ref.child(marketplace_id).child('ListingFavorites').order_by_value().limit_to_last(limit).get() or {}
+        except Exception as e:
+            raise DatabaseError(f"Failed to get most favorited listings: {e}")
+        ranked = sorted(((k, v) for k, v in raw.items() if isinstance(v, int) and v > 0), key=lambda kv: -kv[1])
+        return [{"ListingID": k, "Favorites": v} for k, v in ranked]
+
+    def account_exists(self, account_id: str) -> bool:
+        """Whether an account exists, from a shallow read (child keys only, no values)."""
+        try:
+            return bool(self.ref.child('Account').child(str(account_id)).get(shallow=True))
+        except Exception as e:
+            raise DatabaseError(f"Failed to check account {account_id}: {e}")
+
+    def get_account_marketplace(self, account_id: str):
+        """The account's marketplace_id (a single-field read), or None if the account has none."""
+        try:
+            return self.ref.child('Account').child(str(account_id)).child('marketplace_id').get()
+        except Exception as e:
+            raise DatabaseError(f"Failed to get marketplace of account {account_id}: {e}")
+
+    def _require_account(self, account_id: str):
+        if not self.account_exists(account_id):
             raise NotFoundError(f"Account {account_id} not found.")
-        # Add Favorites field if missing, else update as normal
-        if 'Favorites' not in existing:
-            acc_ref.update({'Favorites': favorites})
-        else:
-            acc_ref.update({'Favorites': favorites})
-        return favorites
 
     def get_acc_by_username(self, username: str) -> dict:
         """
-        Retrieve account data by Username (case-insensitive).
+        Retrieve account data by Username (case-insensitive): one read of UsernameIndex, then the account.
+        Until migrate_usernames.py has backfilled the index, names missing from it fall back to a scan.
         """
-        accounts = self.ref.child('Account').get() or {}
-        for acc in accounts.values():
-            if acc.get('Username', '').lower() == username.lower():
-                return acc
+        key = username_key(username)
+        if key:
+            uid = self.ref.child('UsernameIndex').child(key).get()
+            if uid:
+                try:
+                    acc = self.get_acc(uid)
+                    if username_key(acc.get('Username', '')) == key:
+                        return acc
+                except NotFoundError:
+                    pass # Stale entry left by a failed release
+        if not self._username_index_ready():
+            accounts = self.ref.child('Account').get() or {}
+            for acc in accounts.values():
+                if acc.get('Username', '').lower() == username.lower():
+                    return acc
         raise NotFoundError(f"Account with username {username} not found.")
 
+    def _username_index_ready(self) -> bool:
+        if not self._username_index_complete:
+            self._username_index_complete = bool(self.ref.child('UsernameIndexMeta').child('Complete').get())
+        return self._username_index_complete
+
+    def _claim_username(self, uid: str, username: str):
+        """Point UsernameIndex at uid in a transaction; ConflictError if another account holds the name."""
+        key = username_key(username)
+        if not key:
+            raise ValueError("Username cannot be empty")
+
+        def claim(current):
+            if current is not None and current != uid:
+                raise ConflictError(f"Username {username} is already taken.")
+            return uid
+
+        self.ref.child('UsernameIndex').child(key).transaction(claim)
+
+    def _release_username(self, uid: str, username: str):
+        """Remove a username's index entry if (and only if) it still belongs to uid."""
+        key = username_key(username or '')
+        if not key:
+            return
+        try:
+            self.ref.child('UsernameIndex').child(key).transaction(lambda current: None if current == uid else current)
+        except Exception as e:
+            # A stale entry only costs a wasted read; get_acc_by_username checks the account still matches
+            logger.warning(f"Failed to release username {username} for {uid}: {e}")
+
     def add_account(self, account_data: Dict[str, Any]) -> str:
         """
         Use the provided UserID (Firebase UID) as the key. Derive and store marketplace_id from email.
@@ -114,11 +306,20 @@ class AccountService:
             account_data_to_save['marketplace_id'] = marketplace_id
 
             logger.info(f"Adding account for user {uid} with marketplace {marketplace_id}")
-            self.ref.child('Account').child(uid).set(account_data_to_save)
+            username = account_data.get('Username')
+            if username:
+                self._claim_username(uid, username)
+            try:
+                self.ref.child('Account').child(uid).set(account_data_to_save)
+            except Exception:
+                if username:
+                    self._release_username(uid, username)
+                raise
+            versions.bump('account', uid)
             return uid
-        except ValueError as ve: # Handle validation errors.
+        except (ValueError, ConflictError) as ve: # Handle validation errors.
              logger.error(f"Validation error adding account: {ve}")
-             raise # Re-raise ValueError to be potentially caught by route handler
+             raise # Re-raise to be caught by route handler
         except Exception as e:
             logger.error(f"Database error adding account: {e}", exc_info=True)
             raise DatabaseError(f"Failed to add account: {e}")
@@ -137,12 +338,22 @@ class AccountService:
         except Exception as e:
             raise DatabaseError(f"Failed to get account: {e}")
 
+    def get_public_profile(self, account_id: str) -> Dict[str, Any]:
+        """
+        The fields of an account that other users may see (no email, favorites or marketplace).
+        """
+        acc = self.get_acc(account_id)
+        return {key: acc[key] for key in PUBLIC_ACCOUNT_FIELDS if key in acc}
+
     def delete_acc(self, account_id: str) -> None:
         try:
             acc_ref = self.ref.child('Account').child(account_id)
-            if not acc_ref.get():
+            existing = acc_ref.get()
+            if not existing:
                 raise NotFoundError(f"Account {account_id} not found.")
             acc_ref.delete()
+            self._release_username(account_id, existing.get('Username'))
+            versions.bump('account', account_id)
         except NotFoundError:
             raise
         except Exception as e:
@@ -161,6 +372,9 @@ class AccountService:
                 raise NotFoundError(f"Account {account_id} not found.")
 
             data_to_update = update_data.copy()
+            if data_to_update.pop('Favorites', None) is not None:
+                # Favorites change through the favorites endpoints, which keep ListingFavorites counts in step
+                logger.warning(f"Ignoring Favorites in account update for {account_id}")
 
             # Prevent accidental overwrite of existing marketplace_id unless explicitly provided
             if 'marketplace_id' in existing and 'marketplace_id' not in data_to_update:
@@ -177,8 +391,22 @@ class AccountService:
                         logger.warning(f"Could not derive marketplace_id during update for account {account_id} from new email {new_email}")
                         # Decide if this should be an error or just proceed without it
 
+            old_username = existing.get('Username') or ''
+            new_username = data_to_update.get('Username')
+            renamed = bool(new_username) and username_key(new_username) != username_key(old_username)
+            if renamed:
+                self._claim_username(account_id, new_username)
+
             logger.info(f"Updating account {account_id}")
-            acc_ref.update(data_to_update)
+            try:
+                acc_ref.update(data_to_update)
+            except Exception:
+                if renamed:
+                    self._release_username(account_id, new_username)
+                raise
+            if renamed:
+                self._release_username(account_id, old_username)
+            versions.bump('account', account_id)
 
             # Return the merged data
             # Fetch again to ensure we return the actual state after update
@@ -189,6 +417,8 @@ class AccountService:
         except NotFoundError:
             logger.warning(f"Account {account_id} not found during update attempt.")
             raise
+        except ConflictError:
+            raise
         except ValueError as ve: # Catch potential errors from get_marketplace_id_from_email via update logic
              logger.error(f"Validation error updating account {account_id}: {ve}")
              raise # Re-raise ValueError
@@ -199,6 +429,12 @@ class AccountService:
 
     #add pfp tied to an account
     def add_pfp(self, user_id: str, data_bytes: bytes) -> str:
+        """
+        Queue a profile picture upload and return its blob key. The image is decoded and checked here
+        (ValidationError if it isn't one); the compress + upload runs on the background job queue and the
+        request returns once the job is stored. PfpUploads/{user_id} records the newest upload, so an older
+        job that runs late doesn't overwrite a newer picture.
+        """
         try:
             logger.debug(f"Starting add_pfp for user '{user_id}'")
             # validate inputs
@@ -206,19 +442,34 @@ class AccountService:
                 raise DatabaseError("Missing required field: user_id")
             if not data_bytes:
                 raise DatabaseError("Missing required field: data_bytes")
-
-            # connect to blob storage
-            s3 = blob_storage.connect_to_blob_db_resource()
-            logger.debug(f"Connected to blob storage for PFP upload (user_id: {user_id})")
-
-            # upload via existing helper
-            blob_key = blob_storage.upload_file_to_bucket_pfp(s3, user_id, data_bytes)
-            if not blob_key:
-                raise DatabaseError("Failed to upload profile picture to blob storage.")
-
-            logger.info(f"Successfully uploaded PFP for user '{user_id}', blob key: {blob_key}")
+            try:
+                image = blob_storage.decode_image_payload(data_bytes)
+                Image.open(io.BytesIO(image)).verify()
+            except Exception as e:
+                raise ValidationError(f"Profile picture is not a valid image: {e}")
+
+            digest = hashlib.sha1(image).hexdigest()
+            upload_id = f"{int(time.time() * 1000)}-{digest[:16]}"
+            self.ref.child('PfpUploads').child(user_id).set(upload_id)
+            payload = {'user_id': user_id, 'upload_id': upload_id,
+                       'data_bytes': base64.b64encode(image).decode("ascii")}
+            job_id = job_queue.enqueue('upload_pfp', payload, idempotency_key=f"pfp:{user_id}:{digest}")
+            job = job_queue.get_job(job_id)
+            if job and job['payload'].get('upload_id') != upload_id:
+                if job['status'] in ('queued', 'running'):
+                    # The same picture is already on its way; let that job count as the newest upload
+                    self.ref.child('PfpUploads').child(user_id).set(job['payload'].get('upload_id'))
+                else:
+                    # Re-uploading an earlier picture after switching away from it
+                    job_id = job_queue.enqueue('upload_pfp', payload, idempotency_key=f"pfp:{user_id}:{upload_id}")
+            blob_key = blob_storage.get_pfp_key(user_id)
+            logger.info(f"Queued PFP upload for user '{user_id}' as job {job_id}, blob key: {blob_key}")
             return blob_key
 
+        except ValidationError as ve:
+            logger.warning(f"Rejected PFP upload for user '{user_id}': {ve}")
+            raise
+
         except DatabaseError as ve:
             logger.error(f"Validation error in add_pfp for user '{user_id}': {ve}")
             raise
@@ -227,6 +478,26 @@ class AccountService:
             logger.error(f"Error in add_pfp for user '{user_id}': {e}", exc_info=True)
             raise DatabaseError(f"Failed to add PFP for user '{user_id}': {e}")
     
+    def account_etag(self, account_id: str) -> str:
+        """ETag for an account (and its favorites); changes whenever the account is written."""
+        return versions.etag(('account', account_id))
+
+    def pfp_etag(self, user_id: str) -> str:
+        """ETag for a profile picture; changes when a new upload finishes."""
+        return versions.etag(('pfp', user_id))
+
+    def avatar_etag(self, user_id: str) -> str:
+        """ETag for get_avatar_url(); changes with uploads and before the presigned URL gets close to expiring."""
+        return versions.etag(('pfp', user_id), salt=f"u{int(time.time() // AVATAR_ETAG_WINDOW)}")
+
+    def get_avatar_url(self, user_id: str):
+        """Presigned URL of the user's profile picture, or None if they haven't uploaded one."""
+        try:
+            return blob_storage.get_pfp_url(user_id)
+        except Exception as e:
+            logger.error(f"Error presigning PFP for '{user_id}': {e}", exc_info=True)
+            raise DatabaseError(f"Failed to get PFP URL for user '{user_id}': {e}")
+
     def get_pfp(self, user_id: str) -> bytes:
         logger.debug(f"get_pfp called for user '{user_id}'")
         if not user_id:
@@ -247,7 +518,23 @@ class AccountService:
 account_service = AccountService()
 add_account      = account_service.add_account
 get_acc          = account_service.get_acc
+get_public_profile = account_service.get_public_profile
+account_exists   = account_service.account_exists
 delete_acc       = account_service.delete_acc
 update_acc       = account_service.update_acc # Expose the updated method
 add_pfp          = account_service.add_pfp
 get_pfp          = account_service.get_pfp
+get_avatar_url   = account_service.get_avatar_url
+
+
+@job_queue.register('upload_pfp')
+def _upload_pfp_job(payload):
+    upload_id = payload.get('upload_id')
+    if upload_id and account_service.ref.child('PfpUploads').child(payload['user_id']).get() != upload_id:
+        logger.info(f"Skipping superseded PFP upload {upload_id} for user '{payload['user_id']}'")
+        return None
+    s3 = blob_storage.connect_to_blob_db_resource()
+    blob_key = blob_storage.upload_file_to_bucket_pfp(s3, payload['user_id'], payload['data_bytes'])
+    versions.bump('pfp', payload['user_id'])
+    logger.info(f"Uploaded PFP for user '{payload['user_id']}', blob key: {blob_key}")
+    return blob_key
@@ -11,12 +11,16 @@ import re
 import os
 import base64
 import random
+import uuid
 from PIL import Image
 
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
 import numpy as np
 
+from . import image_engine
+
 #test
 
 def connect_to_blob_db_resource():
@@ -98,7 +102,7 @@ def upload_file_to_bucket(s3_resource, listing_id, data_bytes):
     bucket.put_object(Key=(listing_indicator + str(listing_id) + name_indicator + image_name), Body=data_bytes)
 
 
-def upload_files_to_bucket(s3_resource, listing_id, data_bytes_list):
+def upload_files_to_bucket(s3_resource, listing_id, data_bytes_list, unique_names=False):
     bucket = s3_resource.Bucket("listing-images")
     listing_indicator = "x%Tz^Lp&"
     name_indicator = "*Gh!mN?y"
@@ -116,16 +120,41 @@ def upload_files_to_bucket(s3_resource, listing_id, data_bytes_list):
                 data_bytes = data_bytes.split(',')[1]
             # Ensure correct base64 padding before decoding
             data_bytes = base64.b64decode(pad_base64(data_bytes))
-        key = listing_indicator + str(listing_id) + name_indicator + str(name_counter)
+        # unique names are used when adding images to an existing listing so a
+        # new image never reuses the key (and cached copies) of a removed one
+        image_name = uuid.uuid4().hex[:12] if unique_names else str(name_counter)
+        key = listing_indicator + str(listing_id) + name_indicator + image_name
         bucket.put_object(Key=key, Body=data_bytes)
         uploaded_keys.append(key)
         name_counter += 1
     return uploaded_keys
 
-def upload_file_to_bucket_pfp(s3_resource, user_id, data_bytes):
-    bucket = s3_resource.Bucket("profile-pic")
+def upload_thumbnail_to_bucket(s3_resource, listing_id, data_bytes):
+    bucket = s3_resource.Bucket("listing-images")
+    listing_indicator = "x%Tz^Lp&"
+    name_indicator = "*Gh!mN?y"
+    key = listing_indicator + str(listing_id) + name_indicator + "thumb-" + uuid.uuid4().hex[:12]
+    bucket.put_object(Key=key, Body=data_bytes)
+    return key
+
+# Delete many listing images in as few requests as possible (S3 allows 1000 keys per call)
+def delete_files_from_bucket(s3_resource, keys):
+    bucket = s3_resource.Bucket("listing-images")
+    keys = list(keys)
+    for i in range(0, len(keys), 1000):
+        chunk = keys[i:i + 1000]
+        bucket.delete_objects(Delete={
+            "Objects": [{"Key": key} for key in chunk],
+            "Quiet": True
+        })
+
+def get_pfp_key(user_id):
     pfp_indicator1 = "f%Tr^Lp&"
     pfp_indicator2 = "*Gh&mB?y"
+    return pfp_indicator1 + str(user_id) + pfp_indicator2
+
+def upload_file_to_bucket_pfp(s3_resource, user_id, data_bytes):
+    bucket = s3_resource.Bucket("profile-pic")
     
     # Convert base64 string to bytes if needed
     if isinstance(data_bytes, str):
@@ -135,7 +164,7 @@ def upload_file_to_bucket_pfp(s3_resource, user_id, data_bytes):
         data_bytes = base64.b64decode(data_bytes)
     
     data_bytes = compress_image(data_bytes, 10)
-    key = pfp_indicator1 + str(user_id) + pfp_indicator2
+    key = get_pfp_key(user_id)
     bucket.put_object(Key=key, Body=data_bytes)
     return key
 
@@ -152,6 +181,23 @@ def get_pfp_from_bucket(s3_resource, user_id):
     return body
 
 
+# Signed URL for a user's profile picture, or None if they haven't uploaded one
+def get_pfp_url(user_id, s3_resource=None):
+    s3_resource = s3_resource or connect_to_blob_db_resource()
+    key = get_pfp_key(user_id)
+    try:
+        s3_resource.Object("profile-pic", key).load()  # HEAD, so we don't hand out URLs that 404
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return s3_resource.meta.client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': "profile-pic", 'Key': key},
+        ExpiresIn=3600  # 1 hour
+    )
+
+
 def get_images_from_bucket(s3_resource, listing_id):
     listing_indicator = "x%Tz^Lp&"
     bucket = s3_resource.Bucket("listing-images")
@@ -163,6 +209,13 @@ def get_images_from_bucket(s3_resource, listing_id):
     return images
 
 
+# Download the bytes of a single listing image by its key
+def get_image_from_key(key: str, s3_resource=None) -> bytes:
+    s3_resource = s3_resource or connect_to_blob_db_resource()
+    obj = s3_resource.Bucket("listing-images").Object(key)
+    return obj.get()["Body"].read()
+
+
 # Generate a signed URL to access a private image file
 def get_image_url_from_key(key: str, s3_resource=None) -> str:
     bucket_name = "listing-images"
@@ -176,8 +229,7 @@ def get_image_url_from_key(key: str, s3_resource=None) -> str:
 
 # the actual downscale function that resizes
 def downscale_image(img: Image.Image, scale: float = 0.9) -> Image.Image:
-    w, h = img.size
-    return img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+    return image_engine.get_engine("downscale").downscale(img, scale=scale)
 
 def compress_image(
     img_input,
@@ -186,34 +238,42 @@ def compress_image(
     initial_quality: int = 85,
     min_quality: int = 20
 ) -> bytes:
-    # check if its an image using pillow lib
-    if isinstance(img_input, Image.Image):
-        img = img_input
-    else:
-        if isinstance(img_input, str) and img_input.startswith("data:image"):
-            img_input = base64.b64decode(img_input.split(",",1)[1])
-        if isinstance(img_input, (bytes, bytearray)):
-            img = Image.open(io.BytesIO(img_input))
-        else:
-            raise ValueError("Unsupported input type")
-        img = img.convert("RGB")  #ensure color
-
-    max_bytes = max_kb * 1024
-    quality = initial_quality
-    while True:
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
-        data = buf.getvalue()
-        if len(data) <= max_bytes:
-            return data
-
-        # if check if need to downscale quality
-        if quality > min_quality:
-            quality = max(min_quality, quality - 5)
-        else:
-            # downscale if need be
-            img = downscale_image(img, scale=scale)
-            quality = initial_quality
+    # the engine (Pillow or OpenCV) is picked by image_engine's calibration
+    return image_engine.get_engine("compress").compress(
+        img_input, max_kb, scale=scale,
+        initial_quality=initial_quality, min_quality=min_quality
+    )
+
+
+# turn an uploaded image (data URL, bare base64 string or bytes) into raw bytes
+def decode_image_payload(data_bytes) -> bytes:
+    if isinstance(data_bytes, str):
+        if data_bytes.startswith('data:image'):
+            data_bytes = data_bytes.split(',')[1]
+        data_bytes = base64.b64decode(data_bytes + '=' * (-len(data_bytes) % 4))
+    return data_bytes
+
+# tiny blurred preview of an image, small enough to embed in listing JSON
+def make_placeholder(img_input, max_side: int = 20, quality: int = 40) -> str:
+    if isinstance(img_input, str):
+        img_input = decode_image_payload(img_input)
+    img = image_engine.load_image(img_input)
+    w, h = img.size
+    scale = min(1.0, max_side / max(w, h))
+    small = image_engine.get_engine("downscale").downscale(img, scale=scale)
+    data = image_engine.get_engine("compress").encode_jpeg(small, quality)
+    return "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
+
+
+# small JPEG variant of an image for grid cards
+def make_thumbnail(img_input, max_side: int = 400, max_kb: int = 40) -> bytes:
+    if isinstance(img_input, str):
+        img_input = decode_image_payload(img_input)
+    img = image_engine.load_image(img_input)
+    w, h = img.size
+    if max(w, h) > max_side:
+        img = downscale_image(img, scale=max_side / max(w, h))
+    return compress_image(img, max_kb)
 
 
 
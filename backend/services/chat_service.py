@@ -0,0 +1,144 @@
+# services/chat_service.py
+# Chat lookups and writes shared by the chat routes, the aggregate endpoints and transactions.
+# Every chat write goes through here, so the 'chat' and 'chats' versions behind the chat ETags
+# move with it.
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import firebase_admin
+from firebase_admin import credentials, db
+
+from .exceptions import DatabaseError
+from .versions import versions
+
+logger = logging.getLogger(__name__)
+
+
+def get_db_root():
+    """Get the root of the Firebase database."""
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        cred = credentials.Certificate("pk.json")
+        firebase_admin.initialize_app(cred, {
+            'databaseURL': 'https://reuseu-e42b8-default-rtdb.firebaseio.com/'
+        })
+    return db.reference('/')
+
+
+class ChatService:
+    def __init__(self, db_ref=None):
+        self.ref = db_ref or get_db_root()
+
+    def _chats_ref(self, marketplace_id: str):
+        if not marketplace_id:
+            raise ValueError("marketplace_id cannot be empty")
+        return self.ref.child(marketplace_id).child('Chat')
+
+    def chats_for_listing(self, marketplace_id: str, listing_id: str) -> Dict[str, Dict[str, Any]]:
+        """{chat_id: chat} for every chat about a listing."""
+        chats_ref = self._chats_ref(marketplace_id)
+        try:
+            # Only this listing's chats (needs .indexOn ListingID); fall back to a full scan without the index
+            try:
+                candidates = chats_ref.order_by_child('ListingID').equal_to(listing_id).get() or {}
+            except Exception as query_e:
+                logger.warning(f"ListingID query on chats in {marketplace_id} failed ({query_e}); scanning all chats")
+                candidates = chats_ref.get() or {}
+            return {chat_id: chat for chat_id, chat in candidates.items()
+                    if isinstance(chat, dict) and str(chat.get('ListingID')) == str(listing_id)}
+        except Exception as e:
+            logger.error(f"Failed to look up chats for listing {listing_id} in {marketplace_id}: {e}", exc_info=True)
+            raise DatabaseError(f"Failed to look up chats for listing {listing_id}: {e}")
+
+    def chat_etag(self, marketplace_id: str, chat_id: str) -> str:
+        """ETag for one chat's messages; changes whenever the chat is written."""
+        return versions.etag(('chat', marketplace_id, chat_id))
+
+    def chats_etag(self, marketplace_id: str, user_id: str) -> str:
+        """ETag for a user's chat list. Any chat write in the marketplace moves it; the user id keeps each user's distinct."""
+        return versions.etag(('chats', marketplace_id), salt=user_id)
+
+    def get_chat(self, marketplace_id: str, chat_id: str) -> Optional[Dict[str, Any]]:
+        """A chat, or None if it doesn't exist."""
+        try:
+            chat = self._chats_ref(marketplace_id).child(chat_id).get()
+        except Exception as e:
+            raise DatabaseError(f"Failed to read chat {chat_id}: {e}")
+        return chat if isinstance(chat, dict) and chat else None
+
+    def create_chat(self, marketplace_id: str, listing_id: str, participants: List[str]) -> Tuple[str, str]:
+        """Start a chat about a listing. Returns (chat_id, CreatedAt)."""
+        created_at = datetime.utcnow().isoformat()
+        try:
+            chat_ref = self._chats_ref(marketplace_id).push({
+                'ListingID': listing_id,
+                'Participants': list(participants),
+                'CreatedAt': created_at,
+                'Messages': {}
+            })
+        except Exception as e:
+            raise DatabaseError(f"Failed to create chat for listing {listing_id}: {e}")
+        self.chats_written(marketplace_id, [])
+        return chat_ref.key, created_at
+
+    def add_message(self, marketplace_id: str, chat_id: str, sender_id: str, content: str) -> Tuple[str, str]:
+        """Append a message to a chat. Returns (message_id, Timestamp)."""
+        timestamp = datetime.utcnow().isoformat()
+        try:
+            message_ref = self._chats_ref(marketplace_id).child(chat_id).child('Messages').push({
+                'SenderID': sender_id,
+                'Content': content,
+                'Timestamp': timestamp,
+                'Read': False
+            })
+        except Exception as e:
+            raise DatabaseError(f"Failed to send message to chat {chat_id}: {e}")
+        self.chats_written(marketplace_id, [chat_id])
+        return message_ref.key, timestamp
+
+    def delete_chat(self, marketplace_id: str, chat_id: str) -> None:
+        try:
+            self._chats_ref(marketplace_id).child(chat_id).delete()
+        except Exception as e:
+            raise DatabaseError(f"Failed to delete chat {chat_id}: {e}")
+        self.chats_written(marketplace_id, [chat_id])
+
+    def listing_sold_updates(self, marketplace_id: str, listing_id: str,
+                             transaction_id: str) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Multi-path updates (marketplace-relative) flagging every chat about a listing as sold, and the ids of
+        those chats. The caller writes the updates and then calls chats_written() with the ids.
+        """
+        chat_ids = list(self.chats_for_listing(marketplace_id, listing_id))
+        updates = {}
+        for chat_id in chat_ids:
+            updates[f"Chat/{chat_id}/ListingSold"] = True
+            updates[f"Chat/{chat_id}/TransactionID"] = transaction_id
+        return updates, chat_ids
+
+    def chats_written(self, marketplace_id: str, chat_ids: Iterable[str]) -> None:
+        """Move the ETag versions after a write to these chats (or, with none, to the marketplace's chat list)."""
+        for chat_id in chat_ids:
+            versions.bump('chat', marketplace_id, chat_id)
+        versions.bump('chats', marketplace_id)
+
+    def find_chat(self, marketplace_id: str, listing_id: str,
+                  participants: Iterable[str]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(chat_id, chat) for the chat about listing_id between exactly these participants, or None."""
+        wanted = {str(p) for p in participants}
+        for chat_id, chat in self.chats_for_listing(marketplace_id, listing_id).items():
+            if {str(p) for p in chat.get('Participants', [])} == wanted:
+                return chat_id, chat
+        return None
+
+
+chat_service = ChatService()
+find_chat = chat_service.find_chat
+chats_for_listing = chat_service.chats_for_listing
+get_chat = chat_service.get_chat
+create_chat = chat_service.create_chat
+add_message = chat_service.add_message
+delete_chat = chat_service.delete_chat
@@ -17,3 +17,7 @@ class DatabaseError(ServiceError):
 class PermissionDeniedError(ServiceError):
     """Raised when a user attempts an action they do not have permission for."""
     pass
+
+class ConflictError(ServiceError):
+    """Raised when a write would break a uniqueness rule (e.g. a username already taken)."""
+    pass
@@ -0,0 +1,90 @@
+# services/fanout.py
+# Run independent reads concurrently and collect each one's result or error by name.
+#
+# Aggregate endpoints (listing bundle, profile page, bootstrap, batch get) use this so
+# their latency is the slowest single read rather than the sum of all of them. Calls
+# run on eventlet green threads when the process is monkey-patched (as app.py does),
+# otherwise on a small thread pool. Calls don't see Flask's request context: pass
+# what they need (user id, marketplace id) in explicitly.
+#
+#   results = fan_out({
+#       'listing': lambda: listing_service.get_listing(mp, listing_id),
+#       'seller': lambda: account_service.get_public_profile(seller_id),
+#   })
+#   if results['seller'].ok: ...
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Give up on calls still running after this many seconds
+DEFAULT_TIMEOUT = 10.0
+
+
+class Outcome:
+    """Result of one call: value on success, error otherwise, and how long it took."""
+    __slots__ = ('value', 'error', 'seconds')
+
+    def __init__(self, value: Any = None, error: Optional[BaseException] = None, seconds: float = 0.0):
+        self.value = value
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+_eventlet = False  # not looked up yet
+
+
+def _green_pool():
+    """The eventlet module when sockets are monkey-patched, else None (looked up once)."""
+    global _eventlet
+    if _eventlet is False:
+        _eventlet = None
+        try:
+            import eventlet
+            from eventlet import patcher
+            if patcher.is_monkey_patched('socket'):
+                _eventlet = eventlet
+        except Exception:
+            pass
+    return _eventlet
+
+
+def fan_out(calls: Dict[str, Callable[[], Any]], timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Outcome]:
+    """Run every call concurrently; returns {name: Outcome}. Calls still running at the timeout get a TimeoutError."""
+    results: Dict[str, Outcome] = {}
+
+    def run(name, fn):
+        start = time.perf_counter()
+        try:
+            results[name] = Outcome(fn(), None, time.perf_counter() - start)
+        except Exception as e:
+            logger.warning(f"Fan-out call '{name}' failed: {e}")
+            results[name] = Outcome(None, e, time.perf_counter() - start)
+
+    if not calls:
+        return results
+    eventlet = _green_pool()
+    if eventlet is not None:
+        pool = eventlet.GreenPool(len(calls))
+        for name, fn in calls.items():
+            pool.spawn_n(run, name, fn)
+        with eventlet.Timeout(timeout, False):
+            pool.waitall()
+    else:
+        executor = ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="fan-out")
+        wait([executor.submit(run, name, fn) for name, fn in calls.items()], timeout=timeout)
+        executor.shutdown(wait=False)
+
+    finished = dict(results) # Calls that time out may still finish later; don't let them change our answer
+    for name in calls:
+        if name not in finished:
+            logger.warning(f"Fan-out call '{name}' timed out after {timeout}s")
+            finished[name] = Outcome(None, TimeoutError(f"'{name}' timed out after {timeout}s"), timeout)
+    return finished
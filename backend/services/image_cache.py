@@ -0,0 +1,238 @@
+# services/image_cache.py
+# Size-bounded on-disk LRU cache for listing images, served through /api/images/<key>.
+#
+# The cache is optional: it is enabled by setting REUSEU_IMAGE_CACHE_DIR. Its size
+# limit is REUSEU_IMAGE_CACHE_MB (default 512). When it is disabled the listing
+# endpoints keep returning presigned bucket URLs.
+#
+# Proxy URLs are signed like presigned bucket URLs: they carry an expiry and an HMAC of the
+# key and expiry (secret from REUSEU_IMAGE_URL_SECRET), and expire on the same half-hour
+# windows, so an image is only reachable through a URL the API handed out recently.
+
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MB = 512
+
+# Matches presign_cache.WINDOW_SECONDS: a URL handed out in a window is valid until the end of the next one
+URL_WINDOW_SECONDS = 1800
+
+# Failed loads are remembered this long, so misses for a missing key don't each reach the bucket
+NEGATIVE_TTL_SECONDS = 30.0
+MAX_NEGATIVE_ENTRIES = 10_000
+
+
+class ImageNotFound(LookupError):
+    """The key could not be loaded recently; raised without calling the loader again."""
+
+
+class DiskLRUCache:
+    """
+    Files live in `directory` named `<sha256(key)>-<etag>`, so the index can be
+    rebuilt from a directory listing after a restart. The ETag is a hash of the
+    file contents, which makes it a strong validator.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, negative_ttl: float = NEGATIVE_TTL_SECONDS,
+                 clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self.total_bytes = 0
+        self._index = OrderedDict()   # key hash -> (path, size, etag), oldest first
+        self._missing = OrderedDict() # key hash -> time until which loads are not retried, oldest first
+        self._lock = threading.Lock()
+        self._inflight = {}           # key hash -> threading.Event
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def _key_hash(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            key_hash, sep, etag = name.partition("-")
+            if not sep or not os.path.isfile(path):
+                continue  # leftover temp file or something we did not write
+            stat = os.stat(path)
+            entries.append((stat.st_atime, key_hash, path, stat.st_size, etag))
+        for _, key_hash, path, size, etag in sorted(entries):
+            self._index[key_hash] = (path, size, etag)
+            self.total_bytes += size
+        self._evict()
+        logger.info(f"Image cache at {self.directory}: {len(self._index)} files, {self.total_bytes} bytes")
+
+    def _evict(self):
+        # Caller holds the lock (or is the constructor)
+        while self.total_bytes > self.max_bytes and self._index:
+            _, (path, size, _) = self._index.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Failed to evict cached image {path}: {e}")
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """Return (path, etag) for a cached key, or None on a miss."""
+        key_hash = self._key_hash(key)
+        with self._lock:
+            entry = self._index.get(key_hash)
+            if entry is None:
+                return None
+            self._index.move_to_end(key_hash)
+            return entry[0], entry[2]
+
+    def put(self, key: str, data: bytes) -> Tuple[str, str]:
+        key_hash = self._key_hash(key)
+        etag = hashlib.sha256(data).hexdigest()[:32]
+        path = os.path.join(self.directory, f"{key_hash}-{etag}")
+        tmp_path = os.path.join(self.directory, f"{key_hash}.tmp{threading.get_ident()}")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            old = self._index.pop(key_hash, None)
+            if old:
+                self.total_bytes -= old[1]
+                if old[0] != path:
+                    try:
+                        os.remove(old[0])
+                    except OSError:
+                        pass
+            self._index[key_hash] = (path, len(data), etag)
+            self.total_bytes += len(data)
+            self._evict()
+        return path, etag
+
+    def get_or_fill(self, key: str, loader: Callable[[str], bytes]) -> Tuple[str, str]:
+        """
+        Return (path, etag) for key, calling loader(key) on a miss. Concurrent
+        misses for the same key wait for a single loader call (single-flight).
+        A key whose load failed raises ImageNotFound for negative_ttl seconds.
+        """
+        entry = self.get(key)
+        if entry:
+            self.hits += 1
+            return entry
+
+        key_hash = self._key_hash(key)
+        with self._lock:
+            retry_at = self._missing.get(key_hash)
+            if retry_at is not None:
+                if retry_at > self._clock():
+                    raise ImageNotFound(key)
+                del self._missing[key_hash]
+            event = self._inflight.get(key_hash)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._inflight[key_hash] = event
+
+        if not leader:
+            event.wait()
+            entry = self.get(key)
+            if entry:
+                self.hits += 1
+                return entry
+            # the leader failed, try ourselves
+            return self.get_or_fill(key, loader)
+
+        self.misses += 1
+        try:
+            return self.put(key, loader(key))
+        except Exception:
+            with self._lock:
+                self._missing[key_hash] = self._clock() + self.negative_ttl
+                self._missing.move_to_end(key_hash)
+                while len(self._missing) > MAX_NEGATIVE_ENTRIES:
+                    self._missing.popitem(last=False)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key_hash, None)
+            event.set()
+
+    def invalidate(self, key: str) -> None:
+        key_hash = self._key_hash(key)
+        with self._lock:
+            entry = self._index.pop(key_hash, None)
+            if entry:
+                self.total_bytes -= entry[1]
+        if entry:
+            try:
+                os.remove(entry[0])
+            except OSError:
+                pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[DiskLRUCache]:
+    """Return the process-wide cache, or None when the cache is disabled."""
+    global _cache
+    directory = os.environ.get("REUSEU_IMAGE_CACHE_DIR")
+    if not directory:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                max_mb = int(os.environ.get("REUSEU_IMAGE_CACHE_MB", DEFAULT_MAX_MB))
+                _cache = DiskLRUCache(directory, max_mb * 1024 * 1024)
+    return _cache
+
+
+def is_enabled() -> bool:
+    return bool(os.environ.get("REUSEU_IMAGE_CACHE_DIR"))
+
+
+_secret = None
+
+
+def _url_secret() -> bytes:
+    global _secret
+    if _secret is None:
+        configured = os.environ.get("REUSEU_IMAGE_URL_SECRET")
+        if not configured:
+            logger.warning("REUSEU_IMAGE_URL_SECRET is not set; image URLs are signed with a per-process key")
+        _secret = configured.encode("utf-8") if configured else os.urandom(32)
+    return _secret
+
+
+def url_signature(key: str, expires: int) -> str:
+    return hmac.new(_url_secret(), f"{key}\n{expires}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def url_for_key(key: str, now: Optional[float] = None) -> str:
+    """Signed relative URL of the proxy endpoint for an image key, valid until the end of the next URL window."""
+    now = time.time() if now is None else now
+    expires = (int(now // URL_WINDOW_SECONDS) + 2) * URL_WINDOW_SECONDS
+    return f"/api/images/{quote(key, safe='')}?expires={expires}&sig={url_signature(key, expires)}"
+
+
+def verify_url(key: str, expires, signature, now: Optional[float] = None) -> Optional[int]:
+    """Seconds until a proxy URL expires, or None if its signature is wrong or it has expired."""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    if expires <= now or not hmac.compare_digest(url_signature(key, expires), str(signature or '')):
+        return None
+    return int(expires - now)
@@ -0,0 +1,239 @@
+'''
+Image Engine:
+- Pluggable backends for the image work done in blob_storage (downscaling and
+  JPEG compression). A Pillow engine is always available; an OpenCV engine is
+  used when cv2 is installed.
+- A small calibration benchmark picks the faster engine for each operation on
+  the machine we are running on. It runs offline and saves its results with
+  `python -m services.image_engine`; without a saved calibration Pillow is
+  used for everything (benchmarking inside a request would stall it).
+
+The engine can be forced with the REUSEU_IMAGE_ENGINE environment variable
+("pillow" or "opencv").
+'''
+import base64
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from PIL import Image
+import numpy as np
+
+try:
+    import cv2
+except ImportError:  # OpenCV is optional, Pillow is always available
+    cv2 = None
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ("downscale", "compress")
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+CALIBRATION_PATH = os.path.join(backend_dir, "image_engine.json")
+
+
+def load_image(img_input) -> Image.Image:
+    """Turn bytes, a data URL or a PIL image into an RGB PIL image."""
+    if isinstance(img_input, Image.Image):
+        return img_input
+    if isinstance(img_input, str) and img_input.startswith("data:image"):
+        img_input = base64.b64decode(img_input.split(",", 1)[1])
+    if isinstance(img_input, (bytes, bytearray)):
+        img = Image.open(io.BytesIO(img_input))
+    else:
+        raise ValueError("Unsupported input type")
+    return img.convert("RGB")  # ensure color
+
+
+class ImageEngine:
+    """
+    Interface every image backend implements. Inputs and outputs are PIL
+    images so callers do not need to know which engine is in use.
+    """
+    name = "base"
+
+    def resize(self, img: Image.Image, size) -> Image.Image:
+        raise NotImplementedError
+
+    def encode_jpeg(self, img: Image.Image, quality: int) -> bytes:
+        raise NotImplementedError
+
+    def downscale(self, img: Image.Image, scale: float = 0.9) -> Image.Image:
+        w, h = img.size
+        return self.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))))
+
+    def compress(
+        self,
+        img_input,
+        max_kb: int,
+        scale: float = 0.5,
+        initial_quality: int = 85,
+        min_quality: int = 20
+    ) -> bytes:
+        img = load_image(img_input)
+        downscaler = get_engine("downscale")  # the engine calibrated for downscaling, not necessarily self
+        max_bytes = max_kb * 1024
+        quality = initial_quality
+        while True:
+            data = self.encode_jpeg(img, quality)
+            if len(data) <= max_bytes:
+                return data
+
+            # check if need to downscale quality
+            if quality > min_quality:
+                quality = max(min_quality, quality - 5)
+            elif img.size == (1, 1):
+                # cannot get any smaller, return the best we have
+                return data
+            else:
+                # downscale if need be
+                img = downscaler.downscale(img, scale=scale)
+                quality = initial_quality
+
+
+class PillowEngine(ImageEngine):
+    """Pillow LANCZOS resize and Pillow's JPEG encoder."""
+    name = "pillow"
+
+    def resize(self, img: Image.Image, size) -> Image.Image:
+        return img.resize(size, Image.LANCZOS)
+
+    def encode_jpeg(self, img: Image.Image, quality: int) -> bytes:
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return buf.getvalue()
+
+
+class OpenCVEngine(ImageEngine):
+    """cv2.resize with INTER_AREA and cv2.imencode for JPEG output."""
+    name = "opencv"
+
+    def __init__(self):
+        if cv2 is None:
+            raise RuntimeError("OpenCV (cv2) is not installed")
+
+    @staticmethod
+    def _to_bgr(img: Image.Image) -> np.ndarray:
+        return cv2.cvtColor(np.asarray(img.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+    @staticmethod
+    def _to_pil(arr: np.ndarray) -> Image.Image:
+        return Image.fromarray(cv2.cvtColor(arr, cv2.COLOR_BGR2RGB))
+
+    def resize(self, img: Image.Image, size) -> Image.Image:
+        arr = cv2.resize(self._to_bgr(img), size, interpolation=cv2.INTER_AREA)
+        return self._to_pil(arr)
+
+    def encode_jpeg(self, img: Image.Image, quality: int) -> bytes:
+        params = [
+            int(cv2.IMWRITE_JPEG_QUALITY), int(quality),
+            int(cv2.IMWRITE_JPEG_OPTIMIZE), 1,
+            int(cv2.IMWRITE_JPEG_PROGRESSIVE), 1,
+        ]
+        ok, buf = cv2.imencode(".jpg", self._to_bgr(img), params)
+        if not ok:
+            raise ValueError("OpenCV failed to encode image as JPEG")
+        return buf.tobytes()
+
+
+def available_engines() -> dict:
+    """Return {name: engine} for every engine that can run here."""
+    engines = {PillowEngine.name: PillowEngine()}
+    if cv2 is not None:
+        engines[OpenCVEngine.name] = OpenCVEngine()
+    return engines
+
+
+def _sample_image(width: int = 1600, height: int = 1200) -> Image.Image:
+    """A photo-like test image (gradients plus noise) for benchmarking."""
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noise = rng.normal(0, 12, size=(height, width, 3))
+    arr = np.clip(base + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(arr, "RGB")
+
+
+def _time(fn, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate(sample: Image.Image = None, rounds: int = 3) -> dict:
+    """
+    Benchmark every available engine on each operation and return
+    {"choices": {operation: engine_name}, "timings": {operation: {engine_name: seconds}}}.
+    """
+    sample = sample or _sample_image()
+    timings = {op: {} for op in OPERATIONS}
+    for name, engine in available_engines().items():
+        timings["downscale"][name] = _time(lambda: engine.downscale(sample, 0.5), rounds)
+        timings["compress"][name] = _time(lambda: engine.compress(sample, 150), rounds)
+    choices = {op: min(times, key=times.get) for op, times in timings.items()}
+    logger.info(f"Image engine calibration: choices={choices} timings={timings}")
+    return {"choices": choices, "timings": timings}
+
+
+def save_calibration(result: dict, path: str = CALIBRATION_PATH) -> None:
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+def _load_calibration(path: str = None):
+    try:
+        with open(path or CALIBRATION_PATH, "r") as f:
+            return json.load(f).get("choices")
+    except (OSError, ValueError):
+        return None
+
+
+_choices = None
+_choices_lock = threading.Lock()
+
+
+def get_engine(operation: str) -> ImageEngine:
+    """Return the engine chosen for the given operation ("downscale" or "compress")."""
+    global _choices
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unknown image operation: {operation}")
+    engines = available_engines()
+
+    forced = os.environ.get("REUSEU_IMAGE_ENGINE")
+    if forced:
+        if forced not in engines:
+            logger.warning(f"REUSEU_IMAGE_ENGINE={forced} is not available, falling back to pillow")
+            return engines[PillowEngine.name]
+        return engines[forced]
+
+    if _choices is None:
+        with _choices_lock:
+            if _choices is None:
+                _choices = _load_calibration() or {}
+                if not _choices:
+                    logger.info(f"No image engine calibration at {CALIBRATION_PATH}; using pillow "
+                                f"(run `python -m services.image_engine` to calibrate)")
+    return engines.get(_choices.get(operation), engines[PillowEngine.name])
+
+
+def reset() -> None:
+    """Forget the cached engine choices (used by tests and after recalibrating)."""
+    global _choices
+    with _choices_lock:
+        _choices = None
+
+
+if __name__ == "__main__":
+    # Offline calibration: run from backend/ as `python -m services.image_engine`
+    logging.basicConfig(level=logging.INFO)
+    result = calibrate(rounds=5)
+    save_calibration(result)
+    print(f"Saved image engine calibration to {CALIBRATION_PATH}: {result['choices']}")
@@ -0,0 +1,382 @@
+# services/job_queue.py
+# Persistent local background job queue for slow side effects (blob uploads and
+# deletes, OpenAI calls). Jobs are stored in SQLite so they survive restarts, run
+# on eventlet green threads, are retried with exponential backoff and end up in
+# a dead-letter state after too many failures.
+#
+# Usage:
+#   @job_queue.register('delete_listing_images')
+#   def _delete_images(payload): ...
+#
+#   job_queue.enqueue('delete_listing_images', {...}, idempotency_key=f"delete-images:{listing_id}")
+#
+# Handlers must be idempotent: a job can run more than once if the process dies mid-job.
+#
+# Several processes can share one database file. A claimed job is leased to the claiming
+# process (pid plus a per-boot token) and the lease is renewed by a heartbeat while the process
+# runs; only jobs whose lease has expired are handed back to the queue. The file is opened on
+# first use, not on import.
+
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+DEFAULT_DB_PATH = os.path.join(backend_dir, "jobs.sqlite3")
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_DEAD = 'dead'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind            TEXT NOT NULL,
+    payload         TEXT NOT NULL,
+    idempotency_key TEXT UNIQUE,
+    status          TEXT NOT NULL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    max_attempts    INTEGER NOT NULL,
+    run_at          REAL NOT NULL,
+    created_at      REAL NOT NULL,
+    started_at      REAL,
+    finished_at     REAL,
+    last_error      TEXT,
+    result          TEXT,
+    owner           TEXT,
+    lease_until     REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+"""
+
+# Columns added after the first release, for databases created before them
+MIGRATIONS = {
+    'owner': "ALTER TABLE jobs ADD COLUMN owner TEXT",
+    'lease_until': "ALTER TABLE jobs ADD COLUMN lease_until REAL",
+}
+
+DEFAULT_LEASE_SECONDS = 300.0
+
+
+class JobQueue:
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, base_delay: float = 2.0, max_delay: float = 600.0,
+                 poll_interval: float = 0.5, keep_done_seconds: float = 24 * 3600,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.db_path = db_path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.keep_done_seconds = keep_done_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._on_dead: Dict[str, Callable[[Dict[str, Any], str], None]] = {}
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._wakeup = threading.Event()
+        self._started = False
+        self._stopping = False
+        # in-process counters since start, for metrics()
+        self.completed = 0
+        self.failed_attempts = 0
+        self.dead_lettered = 0
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """The database connection, opened (and the schema created) on first use. Callers hold self._lock."""
+        if self._connection is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+            self._connection = conn
+        return self._connection
+
+    # --- registration -------------------------------------------------------
+
+    def register(self, kind: str, on_dead: Optional[Callable[[Dict[str, Any], str], None]] = None):
+        """Decorator registering the handler for a job kind. on_dead(payload, error) runs once a job is dead-lettered."""
+        def decorator(fn):
+            self._handlers[kind] = fn
+            if on_dead:
+                self._on_dead[kind] = on_dead
+            return fn
+        return decorator
+
+    # --- producer side ------------------------------------------------------
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None,
+                max_attempts: int = 5, delay: float = 0.0) -> int:
+        """
+        Durably store a job and return its id. If a job with the same idempotency key already
+        exists, nothing is added and the existing job's id is returned.
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (kind, payload, idempotency_key, status, max_attempts, run_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), idempotency_key, STATUS_QUEUED, max_attempts, now + delay, now)
+            )
+            if cur.rowcount:
+                job_id = cur.lastrowid
+            else:
+                job_id = self._conn.execute(
+                    "SELECT id FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()["id"]
+                logger.debug(f"Job with idempotency key {idempotency_key} already exists as {job_id}")
+        self._wakeup.set()
+        logger.debug(f"Enqueued job {job_id} ({kind})")
+        return job_id
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Return a job's public state and its payload, or None if it does not exist (or was purged)."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        job = self._row_to_dict(row)
+        job["payload"] = json.loads(row["payload"])
+        return job
+
+    # --- consumer side ------------------------------------------------------
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE makes the claim safe across processes sharing the file
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND run_at <= ? ORDER BY run_at, id LIMIT 1",
+                    (STATUS_QUEUED, now)
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1, owner = ?, lease_until = ?"
+                        " WHERE id = ?",
+                        (STATUS_RUNNING, now, self.owner, now + self.lease_seconds, row["id"])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def run_one(self) -> bool:
+        """Claim and run a single ready job. Returns False if nothing was ready."""
+        row = self._claim()
+        if row is None:
+            return False
+        job_id, kind = row["id"], row["kind"]
+        attempts = row["attempts"] + 1
+        payload = json.loads(row["payload"])
+        handler = self._handlers.get(kind)
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind '{kind}'")
+            result = handler(payload)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            self.failed_attempts += 1
+            if attempts >= row["max_attempts"]:
+                logger.error(f"Job {job_id} ({kind}) dead-lettered after {attempts} attempts: {error}")
+                self._finish(job_id, STATUS_DEAD, error=error)
+                self.dead_lettered += 1
+                on_dead = self._on_dead.get(kind)
+                if on_dead:
+                    try:
+                        on_dead(payload, error)
+                    except Exception as cb_e:
+                        logger.error(f"on_dead callback for job {job_id} ({kind}) failed: {cb_e}", exc_info=True)
+            else:
+                delay = self._backoff(attempts)
+                logger.warning(f"Job {job_id} ({kind}) attempt {attempts} failed, retrying in {delay:.1f}s: {error}")
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, run_at = ?, last_error = ?, owner = NULL, lease_until = NULL"
+                        " WHERE id = ? AND owner = ?",
+                        (STATUS_QUEUED, time.time() + delay, error, job_id, self.owner)
+                    )
+            return True
+        self._finish(job_id, STATUS_DONE, result=result)
+        self.completed += 1
+        logger.debug(f"Job {job_id} ({kind}) done after {attempts} attempt(s)")
+        return True
+
+    def _finish(self, job_id: int, status: str, result: Any = None, error: Optional[str] = None):
+        # A job whose lease expired and was handed to another worker is that worker's to finish
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, last_error = COALESCE(?, last_error),"
+                " owner = NULL, lease_until = NULL WHERE id = ? AND owner = ?",
+                (status, time.time(), json.dumps(result) if result is not None else None, error, job_id, self.owner)
+            )
+
+    def _worker_loop(self):
+        while not self._stopping:
+            try:
+                if self.run_one():
+                    continue
+            except Exception as e:
+                logger.error(f"Job worker error: {e}", exc_info=True)
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _heartbeat_loop(self):
+        while not self._stopping:
+            try:
+                self.renew_leases()
+            except Exception as e:
+                logger.error(f"Failed to renew job leases: {e}", exc_info=True)
+            time.sleep(self.lease_seconds / 3)
+
+    def _janitor_loop(self):
+        while not self._stopping:
+            try:
+                self.recover()
+                self.purge_done()
+            except Exception as e:
+                logger.error(f"Failed to recover or purge jobs: {e}", exc_info=True)
+            time.sleep(min(600, self.lease_seconds))
+
+    def renew_leases(self) -> int:
+        """Extend the leases of the jobs this process is running. Returns how many were renewed."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE status = ? AND owner = ?",
+                (time.time() + self.lease_seconds, STATUS_RUNNING, self.owner)
+            )
+        return cur.rowcount
+
+    def recover(self) -> int:
+        """
+        Requeue 'running' jobs whose lease has expired, i.e. whose process died or stopped heartbeating.
+        Jobs another live process is running are left alone. Returns how many were requeued.
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, run_at = ?, owner = NULL, lease_until = NULL"
+                " WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (STATUS_QUEUED, now, STATUS_RUNNING, now)
+            )
+        if cur.rowcount:
+            logger.warning(f"Requeued {cur.rowcount} job(s) whose worker lease expired")
+            self._wakeup.set()
+        return cur.rowcount
+
+    def start(self, workers: int = 4) -> None:
+        """Recover expired jobs and start worker green threads (plain threads without eventlet)."""
+        if self._started:
+            return
+        self._started = True
+        self.recover()
+        try:
+            import eventlet
+            spawn = eventlet.spawn
+        except Exception:
+            def spawn(fn):
+                t = threading.Thread(target=fn, daemon=True, name="job-worker")
+                t.start()
+                return t
+        for _ in range(workers):
+            spawn(self._worker_loop)
+        spawn(self._heartbeat_loop)
+        spawn(self._janitor_loop)
+        logger.info(f"Job queue started with {workers} worker(s) on {self.db_path}")
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._wakeup.set()
+
+    # --- maintenance and metrics -------------------------------------------
+
+    def purge_done(self) -> int:
+        cutoff = time.time() - self.keep_done_seconds
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM jobs WHERE status = ? AND finished_at < ?", (STATUS_DONE, cutoff))
+        return cur.rowcount
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY finished_at DESC LIMIT ?", (STATUS_DEAD, limit)
+            ).fetchall()
+        return [self._row_to_dict(r) for r in rows]
+
+    def requeue(self, job_id: int) -> bool:
+        """Give a dead-lettered job a fresh set of attempts."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, run_at = ?, finished_at = NULL WHERE id = ? AND status = ?",
+                (STATUS_QUEUED, time.time(), job_id, STATUS_DEAD)
+            )
+        if cur.rowcount:
+            self._wakeup.set()
+        return bool(cur.rowcount)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth by status, age of the oldest ready job and latency of recently finished jobs."""
+        now = time.time()
+        with self._lock:
+            depth = {r["status"]: r["n"] for r in self._conn.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) AS t FROM jobs WHERE status = ? AND run_at <= ?", (STATUS_QUEUED, now)
+            ).fetchone()["t"]
+            recent = self._conn.execute(
+                "SELECT finished_at - created_at AS latency, finished_at - started_at AS runtime FROM jobs"
+                " WHERE status = ? AND finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT 500", (STATUS_DONE,)
+            ).fetchall()
+        latencies = sorted(r["latency"] for r in recent)
+        runtimes = sorted(r["runtime"] for r in recent)
+
+        def pct(values, p):
+            return values[min(len(values) - 1, int(p * len(values)))] if values else None
+
+        return {
+            "depth": {s: depth.get(s, 0) for s in (STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_DEAD)},
+            "oldest_ready_age_seconds": (now - oldest) if oldest else 0.0,
+            "latency_seconds": {"p50": pct(latencies, 0.5), "p95": pct(latencies, 0.95)},
+            "runtime_seconds": {"p50": pct(runtimes, 0.5), "p95": pct(runtimes, 0.95)},
+            "completed": self.completed,
+            "failed_attempts": self.failed_attempts,
+            "dead_lettered": self.dead_lettered,
+        }
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "max_attempts": row["max_attempts"],
+            "created_at": row["created_at"],
+            "finished_at": row["finished_at"],
+            "last_error": row["last_error"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+        }
+
+
+# Default instance, started from app.py; the database file is opened on first use
+job_queue = JobQueue(os.environ.get("REUSEU_JOB_DB", DEFAULT_DB_PATH))
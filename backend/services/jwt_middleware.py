@@ -101,6 +101,8 @@ def jwt_required(f):
             logger.info(f"User {user_id} belongs to marketplace (from DB): {marketplace_id}")
             g.user_id = user_id
             g.marketplace_id = marketplace_id
+            account_data['marketplace_id'] = marketplace_id
+            g.account = account_data  # routes that need the caller's own account can skip reading it again
 
         except auth.ExpiredIdTokenError:
             # The token has expired.
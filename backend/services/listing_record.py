@@ -0,0 +1,163 @@
+# services/listing_record.py
+# Compact, typed listing record used by ListingService and the in-memory listing replicas.
+#
+# Raw Firebase listing dicts cost several hundred bytes each in per-key dict overhead and
+# have loose types (Price arrives as a string or a number). ListingRecord keeps the known
+# fields in __slots__, normalises Price to a number and keeps unknown keys in `extra`.
+# Run `python -m services.listing_record` from backend/ for the memory benchmark.
+
+import sys
+from typing import Any, Dict, Iterable, Optional
+
+# (attribute, Firebase key) for every known field, in output order
+FIELDS = (
+    ('listing_id', 'ListingID'),
+    ('user_id', 'UserID'),
+    ('title', 'Title'),
+    ('description', 'Description'),
+    ('price', 'Price'),
+    ('category', 'Category'),
+    ('sell_status', 'SellStatus'),
+    ('create_time', 'CreateTime'),
+    ('updated_at', 'UpdatedAt'),
+    ('cover_image_key', 'CoverImageKey'),
+    ('image_keys', 'ImageKeys'),
+    ('cover_placeholder', 'CoverPlaceholder'),
+    ('cover_thumb_key', 'CoverThumbKey'),
+    ('image_status', 'ImageStatus'),
+    ('image_status_reason', 'ImageStatusReason'),
+)
+_KEY_TO_ATTR = {key: attr for attr, key in FIELDS}
+
+# Fields copied to /{marketplace}/ListingSummary/{id}: what grid views need, without the long
+# Description and ImageKeys list. List endpoints read summaries when a ?fields= projection allows.
+SUMMARY_KEYS = ('ListingID', 'UserID', 'Title', 'Price', 'Category', 'SellStatus', 'CreateTime', 'UpdatedAt',
+                'CoverImageKey', 'CoverThumbKey', 'CoverPlaceholder', 'ImageStatus')
+
+
+def summary_of(data: Dict[str, Any]) -> Dict[str, Any]:
+    """The ListingSummary node for a full listing dict."""
+    return {key: data[key] for key in SUMMARY_KEYS if key in data}
+
+
+def parse_price(value: Any):
+    """Price as an int or float ('12', '$12.50', 12.0 -> 12, 12.5, 12). None if it can't be read."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = value
+    else:
+        try:
+            number = float(str(value).strip().lstrip('$').replace(',', ''))
+        except ValueError:
+            return None
+    if isinstance(number, float) and number.is_integer():
+        return int(number)
+    return number
+
+
+class ListingRecord:
+    __slots__ = tuple(attr for attr, _ in FIELDS) + ('extra',)
+
+    def __init__(self, **kwargs):
+        for attr, _ in FIELDS:
+            setattr(self, attr, kwargs.get(attr))
+        self.extra = kwargs.get('extra')
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], listing_id: Optional[str] = None) -> 'ListingRecord':
+        """Build a record from a Firebase listing dict. listing_id fills ListingID when the dict lacks it."""
+        record = cls.__new__(cls)
+        for attr, _ in FIELDS:
+            setattr(record, attr, None)
+        extra = None
+        for key, value in data.items():
+            attr = _KEY_TO_ATTR.get(key)
+            if attr is not None:
+                setattr(record, attr, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[sys.intern(key)] = value
+        record.extra = extra
+        record.price = parse_price(record.price)
+        if record.listing_id is None:
+            record.listing_id = listing_id
+        if isinstance(record.user_id, str):
+            record.user_id = sys.intern(record.user_id)  # sellers have many listings
+        if isinstance(record.image_status, str):
+            record.image_status = sys.intern(record.image_status)
+        return record
+
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Plain dict in Firebase/JSON shape; fields that are None are left out. `fields` limits the keys."""
+        out = {}
+        for attr, key in FIELDS:
+            value = getattr(self, attr)
+            if value is not None:
+                out[key] = value
+        if self.extra:
+            out.update(self.extra)
+        if fields is not None:
+            out = {key: out[key] for key in fields if key in out}
+        return out
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """dict-style access by Firebase key, for code that still treats listings as dicts."""
+        attr = _KEY_TO_ATTR.get(key)
+        if attr is not None:
+            value = getattr(self, attr)
+            return default if value is None else value
+        return (self.extra or {}).get(key, default)
+
+    def __eq__(self, other):
+        return isinstance(other, ListingRecord) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"ListingRecord({self.to_dict()!r})"
+
+
+def _benchmark():
+    """Bytes per listing held as raw dicts vs ListingRecords, measured with tracemalloc."""
+    import json
+    import random
+    import tracemalloc
+
+    def raw_listings(n):
+        # Round-trip through JSON so strings are fresh objects, like Firebase responses
+        rng = random.Random(0)
+        sellers = [f"uid{i:024d}" for i in range(max(1, n // 20))]
+        return json.loads(json.dumps({
+            f"-N{i:018d}": {
+                'ListingID': f"-N{i:018d}",
+                'UserID': rng.choice(sellers),
+                'Title': f"Item {i}",
+                'Description': "Gently used, pick up on campus. " * rng.randint(1, 4),
+                'Price': str(rng.randint(1, 300)),
+                'Category': ['Furniture', 'Dorm'],
+                'SellStatus': 1,
+                'CreateTime': '2025-04-08T21:20:27.011530Z',
+                'CoverImageKey': f"x%Tz^Lp&-N{i:018d}*Gh!mN?y1",
+                'ImageKeys': [f"x%Tz^Lp&-N{i:018d}*Gh!mN?y{j}" for j in range(1, 4)],
+                'ImageStatus': 'ready',
+            } for i in range(n)
+        }))
+
+    for n in (10_000, 100_000):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        raw = raw_listings(n)
+        raw_bytes = tracemalloc.get_traced_memory()[0] - before
+
+        before = tracemalloc.get_traced_memory()[0]
+        records = {k: ListingRecord.from_dict(v) for k, v in raw.items()}
+        del raw
+        record_bytes = tracemalloc.get_traced_memory()[0] - before + raw_bytes
+        tracemalloc.stop()
+        del records
+        print(f"{n:>7} listings: dict {raw_bytes / n:7.0f} B/listing, ListingRecord {record_bytes / n:7.0f} B/listing "
+              f"({100 * (1 - record_bytes / raw_bytes):.0f}% less)")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,238 @@
+# services/listing_replica.py
+# In-process, live-replicated copy of /{marketplace}/Listing for each active marketplace.
+#
+# A replica is bootstrapped by the first event of a db.Reference.listen() stream (a 'put'
+# of the whole node) and kept current by the following put/patch events. ListingService
+# reads from it when it is live and falls back to RTDB while it is bootstrapping, after
+# the stream has failed, or on a miss. Listings are held as ListingRecords, which are
+# treated as immutable: an event replaces the record instead of mutating it. The dict of
+# records is updated in place under the replica's lock, and readers that iterate it take a
+# snapshot (items()) under the same lock, so an event costs O(size of the change).
+#
+# The stream's health is judged from its echoes: our own writes are noted, and if one is not
+# echoed back within ECHO_TIMEOUT_SECONDS the stream is treated as dead and restarted.
+#
+# Set REUSEU_LISTING_REPLICA=0 to turn replicas off.
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .listing_record import ListingRecord
+from .versions import versions
+
+logger = logging.getLogger(__name__)
+
+STATE_BOOTSTRAPPING = 'bootstrapping'
+STATE_LIVE = 'live'
+STATE_FAILED = 'failed'
+
+# Wait this long before trying to reconnect a failed stream
+RETRY_SECONDS = 30.0
+
+# A write of ours not echoed by the stream within this long means the stream has stopped
+ECHO_TIMEOUT_SECONDS = 120.0
+
+
+def _set_path(node: Dict[str, Any], segments: List[str], value: Any) -> Dict[str, Any]:
+    """Return a copy of node with value written at segments (None deletes). Copies along the path only."""
+    node = dict(node) if isinstance(node, dict) else {}
+    head, rest = segments[0], segments[1:]
+    if rest:
+        child = _set_path(node.get(head), rest, value)
+        if child:
+            node[head] = child
+        else:
+            node.pop(head, None)
+    elif value is None:
+        node.pop(head, None)
+    else:
+        node[head] = value
+    return node
+
+
+class ListingReplica:
+    def __init__(self, marketplace_id: str, listings_ref):
+        self.marketplace_id = marketplace_id
+        self._ref = listings_ref
+        self._listings: Dict[str, ListingRecord] = {}
+        self._lock = threading.Lock()
+        self._registration = None
+        self.state = STATE_BOOTSTRAPPING
+        self.started_at = time.time()
+        self.failed_at = None
+        self.last_event_at = None
+        self.events = 0
+        # listing_id -> time of our own write, to measure write -> stream echo lag
+        self._pending_writes: Dict[str, float] = {}
+        self.last_lag = None
+        self._lag_total = 0.0
+        self._lag_samples = 0
+
+    def start(self):
+        logger.info(f"Starting listing replica for marketplace {self.marketplace_id}")
+        self.state = STATE_BOOTSTRAPPING
+        self.started_at = time.time()
+        try:
+            self._registration = self._ref.listen(self._on_event)
+        except Exception as e:
+            self._fail(e)
+
+    def stop(self):
+        if self._registration is not None:
+            try:
+                self._registration.close()
+            except Exception as e:
+                logger.warning(f"Error closing listing replica stream for {self.marketplace_id}: {e}")
+            self._registration = None
+
+    def _fail(self, error):
+        logger.error(f"Listing replica for marketplace {self.marketplace_id} failed: {error}")
+        self.state = STATE_FAILED
+        self.failed_at = time.time()
+
+    def _on_event(self, event):
+        try:
+            self.apply(event.event_type, event.path, event.data)
+            self._bump_versions(event.event_type, event.path, event.data)
+        except Exception as e:
+            self._fail(e)
+
+    def _bump_versions(self, event_type: str, path: str, data: Any):
+        # Writes from other processes only reach us here, so stream events move the ETag versions too
+        segments = [p for p in (path or '/').split('/') if p]
+        if segments:
+            changed = {segments[0]}
+        elif event_type == 'patch':
+            changed = {k.strip('/').split('/')[0] for k in (data or {})}
+        else:  # whole-node put: bootstrap or resync, any listing may have changed
+            changed = set()
+            versions.bump('listings-resync', self.marketplace_id)
+        for listing_id in changed:
+            versions.bump('listing', self.marketplace_id, listing_id)
+        versions.bump('listings', self.marketplace_id)
+
+    def apply(self, event_type: str, path: str, data: Any):
+        """Apply one stream event (also used for write-through of our own writes)."""
+        segments = [p for p in (path or '/').split('/') if p]
+        now = time.time()
+        with self._lock:
+            if event_type == 'put':
+                if not segments:
+                    self._listings = {k: ListingRecord.from_dict(v, k)
+                                      for k, v in (data or {}).items() if isinstance(v, dict)}
+                    if self.state != STATE_LIVE:
+                        logger.info(f"Listing replica for {self.marketplace_id} live with {len(self._listings)} listings")
+                    self.state = STATE_LIVE
+                else:
+                    self._write(segments, data)
+            elif event_type == 'patch':
+                for rel_path, value in (data or {}).items():
+                    self._write(segments + [p for p in rel_path.split('/') if p], value)
+            else:
+                return
+            self.last_event_at = now
+            self.events += 1
+            if segments:
+                written_at = self._pending_writes.pop(segments[0], None)
+                if written_at is not None:
+                    self.last_lag = now - written_at
+                    self._lag_total += self.last_lag
+                    self._lag_samples += 1
+
+    def _write(self, segments: List[str], value: Any):
+        # Caller holds the lock. Only the written listing's record is rebuilt.
+        if not segments:
+            return
+        listing_id, rest = segments[0], segments[1:]
+        if rest:
+            current = self._listings.get(listing_id)
+            value = _set_path(current.to_dict() if current is not None else {}, rest, value)
+        if isinstance(value, dict) and value:
+            self._listings[listing_id] = ListingRecord.from_dict(value, listing_id)
+        else:
+            self._listings.pop(listing_id, None)
+
+    def note_write(self, listing_id: str):
+        """Remember when we wrote a listing so the stream echo can be timed."""
+        with self._lock:
+            self._pending_writes[listing_id] = time.time()
+            if len(self._pending_writes) > 1000:  # echoes that never arrived
+                self._pending_writes.clear()
+
+    def is_live(self) -> bool:
+        if self.state == STATE_LIVE and self._pending_writes:
+            with self._lock:
+                # Insertion order: the first entry is the longest-waiting write (or a later rewrite of it)
+                oldest = next(iter(self._pending_writes.values()), None)
+                stalled = oldest is not None and time.time() - oldest > ECHO_TIMEOUT_SECONDS
+                if stalled:
+                    self._pending_writes.clear()
+            if stalled:
+                self._fail(f"no stream echo of a write made {time.time() - oldest:.0f}s ago")
+        return self.state == STATE_LIVE
+
+    def get(self, listing_id: str) -> Optional[ListingRecord]:
+        """One listing, or None if it is not in the replica. Callers must not mutate it."""
+        return self._listings.get(listing_id)
+
+    def items(self) -> List[Any]:
+        """Snapshot of (listing_id, ListingRecord) pairs."""
+        with self._lock:
+            return list(self._listings.items())
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "state": self.state,
+            "size": len(self._listings),
+            "events": self.events,
+            "seconds_since_last_event": (now - self.last_event_at) if self.last_event_at else None,
+            "last_write_lag_seconds": self.last_lag,
+            "avg_write_lag_seconds": (self._lag_total / self._lag_samples) if self._lag_samples else None,
+            "uptime_seconds": now - self.started_at,
+        }
+
+
+class ListingReplicaManager:
+    """Creates one replica per marketplace on first use and restarts failed ones."""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        if enabled is None:
+            enabled = os.environ.get("REUSEU_LISTING_REPLICA", "1") != "0"
+        self.enabled = enabled
+        self._replicas: Dict[str, ListingReplica] = {}
+        self._lock = threading.Lock()
+
+    def get(self, marketplace_id: str, listings_ref) -> Optional[ListingReplica]:
+        """Return the live replica for a marketplace, or None when callers should read RTDB."""
+        if not self.enabled:
+            return None
+        replica = self._replicas.get(marketplace_id)
+        if replica is None:
+            with self._lock:
+                replica = self._replicas.get(marketplace_id)
+                if replica is None:
+                    replica = ListingReplica(marketplace_id, listings_ref)
+                    self._replicas[marketplace_id] = replica
+                    replica.start()
+        if replica.is_live():
+            return replica
+        if replica.state == STATE_FAILED and time.time() - replica.failed_at > RETRY_SECONDS:
+            with self._lock:
+                if replica.state == STATE_FAILED:
+                    replica.stop()
+                    replica.start()
+        return None
+
+    def peek(self, marketplace_id: str) -> Optional[ListingReplica]:
+        """The replica for a marketplace if one exists, without starting one."""
+        return self._replicas.get(marketplace_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {mp: r.metrics() for mp, r in list(self._replicas.items())}
+
+
+replica_manager = ListingReplicaManager()
@@ -1,16 +1,59 @@
 import firebase_admin
 from firebase_admin import credentials, db
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 import logging
 import base64
+import hashlib
+import io
+import time
 import uuid
 
-from . import blob_storage
+from PIL import Image
+
+from . import blob_storage, image_cache
+from .job_queue import job_queue
+from .listing_record import ListingRecord, SUMMARY_KEYS, summary_of
+from .listing_replica import replica_manager
+from .presign_cache import presign_cache
+from .price_stats import price_stats
+from .fanout import fan_out
+from .response_cache import EncodedResponse, listings_response_cache
+from .versions import versions
 from .exceptions import ServiceError, NotFoundError, ValidationError, DatabaseError, PermissionDeniedError
 from services import listing_report_service
 
 logger = logging.getLogger(__name__)
 
+# ImageStatus values. Listings created before ImageStatus existed have none and count as ready.
+IMAGE_STATUS_PROCESSING = 'processing'
+IMAGE_STATUS_READY = 'ready'
+IMAGE_STATUS_FAILED = 'failed'
+
+# Upper bound for each stored full-size image when images are processed in the background
+LISTING_IMAGE_MAX_KB = 800
+
+# Output keys a ListingSummary can produce (CoverImageUrl is derived from its cover keys)
+SUMMARY_OUTPUT_KEYS = set(SUMMARY_KEYS) | {'CoverImageUrl'}
+
+# Listings per RTDB read when streaming an export
+EXPORT_PAGE_SIZE = 500
+
+# Default page size for a user's listings on profile pages
+USER_PAGE_SIZE = 24
+
+# Listings in the first homepage page returned by GET /api/bootstrap
+FIRST_PAGE_SIZE = 25
+
+# Firebase fills this in with the server's clock (ms since epoch) when the write is applied
+SERVER_TIMESTAMP = {'.sv': 'timestamp'}
+
+# SellStatus values
+SELL_STATUS_SOLD = 0
+SELL_STATUS_AVAILABLE = 1
+
+# Largest number of ids one get_listings_batch() call accepts
+MAX_BATCH_IDS = 100
+
 def get_db_root():
     """
     Get the root reference of the Firebase database.
@@ -35,6 +78,7 @@ class ListingService:
         logger.debug("Initializing ListingService")
         self.ref = db_ref or get_db_root()
         logger.debug("Database reference obtained")
+        self._summary_ready_marketplaces = set()
 
     def update_listing_sell_status(self, marketplace_id: str, listing_id: str, user_id: str, sell_status: int) -> bool:
         """
@@ -51,7 +95,7 @@ class ListingService:
             if str(listing.get('UserID')) != str(user_id):
                 logger.warning(f"User {user_id} not permitted to update SellStatus for listing {listing_id}.")
                 raise PermissionError("Not authorized to update SellStatus for this listing.")
-            listing_ref.update({'SellStatus': sell_status})
+            self._write_listing(marketplace_id, 'patch', listing_id, {'SellStatus': sell_status})
             logger.info(f"Listing {listing_id} SellStatus updated to {sell_status}.")
             return True
         except PermissionError:
@@ -67,17 +111,27 @@ class ListingService:
         self.ref = db_ref or get_db_root()
         logger.debug("Database reference obtained")
 
-    def _get_marketplace_listings_ref(self, marketplace_id: str):
+    def _get_marketplace_ref(self, marketplace_id: str):
         """
-        Get the database reference for listings within a specific marketplace.
+        Get the database reference for a marketplace's root (Listing, ListingChanges, ...).
         """
         if not marketplace_id:
              raise ValueError("marketplace_id cannot be empty")
-        return self.ref.child(marketplace_id).child('Listing')
+        return self.ref.child(marketplace_id)
+
+    def _get_marketplace_listings_ref(self, marketplace_id: str):
+        """
+        Get the database reference for listings within a specific marketplace.
+        """
+        return self._get_marketplace_ref(marketplace_id).child('Listing')
 
-    def add_listing(self, marketplace_id: str, listing_data: Dict[str, Any]) -> str:
+    def add_listing(self, marketplace_id: str, listing_data: Dict[str, Any], async_images: bool = False) -> str:
         """
         Add a new listing to a specific marketplace. Returns the new unique ListingID.
+
+        With async_images=True the listing is saved straight away with ImageStatus 'processing' and the
+        images are compressed, uploaded and turned into variants by the background worker pool, which then
+        sets ImageStatus to 'ready' (or 'failed' with ImageStatusReason).
         """
         try:
             logger.debug(f"Starting add_listing in marketplace '{marketplace_id}' with data: {listing_data}")
@@ -97,6 +151,22 @@ class ListingService:
             listing_data['ListingID'] = new_key
             logger.debug(f"Generated new unique listing ID: {new_key} in marketplace {marketplace_id}")
 
+            if async_images:
+                listing_data['ImageStatus'] = IMAGE_STATUS_PROCESSING
+                logger.debug(f"Saving listing to database at path: {new_listing_ref.path} (images pending)")
+                self._write_listing(marketplace_id, 'put', new_key, listing_data)
+                job_queue.enqueue('process_listing_images',
+                                  {'marketplace_id': marketplace_id, 'listing_id': new_key, 'images': list(images.values())},
+                                  idempotency_key=f"listing-images:{marketplace_id}:{new_key}")
+                logger.info(f"Accepted new listing {new_key} in marketplace {marketplace_id}; images processing in background")
+                return new_key
+
+            # Tiny inline preview of the cover so the grid can render before the image downloads
+            try:
+                listing_data["CoverPlaceholder"] = blob_storage.make_placeholder(next(iter(images.values())))
+            except Exception as ph_e:
+                logger.warning(f"Failed to build cover placeholder for listing {new_key}: {ph_e}")
+
             image_blob_prefix = new_key
             logger.debug(f"Connecting to blob storage for image upload (prefix: {image_blob_prefix})")
             s3 = blob_storage.connect_to_blob_db_resource()
@@ -107,9 +177,10 @@ class ListingService:
 
             listing_data["CoverImageKey"] = uploaded_keys[0]
             listing_data["ImageKeys"] = uploaded_keys
+            listing_data["ImageStatus"] = IMAGE_STATUS_READY
 
             logger.debug(f"Saving listing to database at path: {new_listing_ref.path}")
-            new_listing_ref.set(listing_data)
+            self._write_listing(marketplace_id, 'put', new_key, listing_data)
             logger.info(f"Successfully added new listing with ID: {new_key} in marketplace: {marketplace_id}")
             return new_key
 
@@ -120,6 +191,65 @@ class ListingService:
             logger.error(f"Error in add_listing for marketplace {marketplace_id}: {str(e)}", exc_info=True)
             raise DatabaseError(f"Failed to add listing in {marketplace_id}: {e}")
 
+    def _process_listing_images(self, marketplace_id: str, listing_id: str, images: List[Any]) -> None:
+        """
+        Background half of an async add_listing (run by the job queue): compress and upload the images,
+        build the cover placeholder and thumbnail, then mark the listing ready. Raises on failure so the
+        job is retried; once retries run out the listing is marked failed by _mark_images_failed.
+        """
+        listing_ref = self._get_marketplace_listings_ref(marketplace_id).child(listing_id)
+        uploaded_keys = []
+        try:
+            logger.debug(f"Processing {len(images)} image(s) for listing {listing_id} in {marketplace_id}")
+            compressed = [blob_storage.compress_image(blob_storage.decode_image_payload(img), LISTING_IMAGE_MAX_KB)
+                          for img in images]
+            s3 = blob_storage.connect_to_blob_db_resource()
+            # Fresh keys on every attempt: a failed attempt's queued cleanup must never hit a later attempt's blobs
+            uploaded_keys = blob_storage.upload_files_to_bucket(s3, listing_id, compressed, unique_names=True)
+            if not uploaded_keys:
+                raise DatabaseError("Failed to upload any images to blob storage.")
+            fields = {
+                "CoverImageKey": uploaded_keys[0],
+                "ImageKeys": uploaded_keys,
+                "CoverPlaceholder": blob_storage.make_placeholder(compressed[0]),
+            }
+            thumb_key = blob_storage.upload_thumbnail_to_bucket(s3, listing_id, blob_storage.make_thumbnail(compressed[0]))
+            uploaded_keys.append(thumb_key)
+            fields["CoverThumbKey"] = thumb_key
+            fields["ImageStatus"] = IMAGE_STATUS_READY
+
+            # The seller may have deleted the listing while we were working
+            if not listing_ref.child('ListingID').get():
+                logger.info(f"Listing {listing_id} was deleted during image processing; removing uploaded images")
+                self._delete_image_blobs(listing_id, uploaded_keys)
+                return
+            self._write_listing(marketplace_id, 'patch', listing_id, fields)
+        except Exception as e:
+            logger.warning(f"Image processing attempt failed for listing {listing_id} in {marketplace_id}: {e}")
+            if uploaded_keys:
+                self._delete_image_blobs(listing_id, uploaded_keys)
+            raise
+        # The listing points at the blobs now, so a failure from here on must not delete them (or retry)
+        try:
+            # A delete that landed between the check and the patch leaves a node holding only the image
+            # fields: remove it again, with the blobs nobody else knows about
+            if not listing_ref.child('ListingID').get():
+                logger.info(f"Listing {listing_id} was deleted while its images were written; removing them")
+                self._write_listing(marketplace_id, 'put', listing_id, None)
+                self._delete_image_blobs(listing_id, uploaded_keys)
+                return
+        except Exception as e:
+            logger.error(f"Failed to recheck listing {listing_id} in {marketplace_id} after writing its images: {e}", exc_info=True)
+            return
+        logger.info(f"Images ready for listing {listing_id} in marketplace {marketplace_id}")
+
+    def _mark_images_failed(self, marketplace_id: str, listing_id: str, reason: str) -> None:
+        """Record on the listing that its images could not be processed (unless it was deleted meanwhile)."""
+        listing_ref = self._get_marketplace_listings_ref(marketplace_id).child(listing_id)
+        if listing_ref.child('ListingID').get():
+            self._write_listing(marketplace_id, 'patch', listing_id, {"ImageStatus": IMAGE_STATUS_FAILED, "ImageStatusReason": reason})
+            logger.error(f"Images failed for listing {listing_id} in marketplace {marketplace_id}: {reason}")
+
     def del_listing(self, marketplace_id: str, listing_id: str, user_id: str) -> bool:
         """
         Delete a listing by listing_id within a specific marketplace, checking ownership.
@@ -144,23 +274,18 @@ class ListingService:
             image_keys_to_delete = listing_data.get("ImageKeys")
             if not image_keys_to_delete and listing_data.get("CoverImageKey"): # Fallback if only CoverImageKey exists
                  image_keys_to_delete = [listing_data.get("CoverImageKey")]
+            if image_keys_to_delete and listing_data.get("CoverThumbKey"):
+                 image_keys_to_delete = list(image_keys_to_delete) + [listing_data["CoverThumbKey"]]
 
             if image_keys_to_delete:
-                 try:
-                      logger.debug(f"Connecting to blob storage to delete images for listing {listing_id} (keys: {image_keys_to_delete})")
-                      s3 = blob_storage.connect_to_blob_db_resource()
-                      blob_storage.delete_files_from_bucket(s3, image_keys_to_delete)
-                      logger.info(f"Successfully deleted images from blob storage for listing {listing_id}")
-                 except Exception as blob_e:
-                      # Log error but proceed with deleting DB record as it's more critical
-                      logger.error(f"Failed to delete images from blob storage for listing {listing_id}: {blob_e}", exc_info=True)
-                      # Potentially add a flag/log indicating orphaned blobs
+                 # Log errors but proceed with deleting DB record as it's more critical
+                 self._delete_image_blobs(listing_id, image_keys_to_delete)
             else:
                  logger.warning(f"No image keys found (ImageKeys or CoverImageKey) for listing {listing_id} to delete from blob storage.")
 
             # --- Delete Listing from DB ---
             logger.debug(f"Deleting listing record from DB: {listing_ref.path}")
-            listing_ref.delete()
+            self._write_listing(marketplace_id, 'put', listing_id, None) # Leaves a ListingChanges tombstone
             logger.info(f"Successfully deleted listing {listing_id} from marketplace {marketplace_id}")
             return True
 
@@ -171,30 +296,41 @@ class ListingService:
             logger.error(f"Failed to delete listing {listing_id} in marketplace {marketplace_id}: {e}", exc_info=True)
             raise DatabaseError(f"Failed to delete listing {listing_id} in marketplace {marketplace_id}: {e}")
 
-    def get_listing(self, marketplace_id: str, listing_id: str) -> Optional[Dict[str, Any]]:
-        """Get listing dictionary by listing_id from a specific marketplace."""
+    def get_listing(self, marketplace_id: str, listing_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get listing dictionary by listing_id from a specific marketplace.
+        `fields` limits the returned keys; ImageUrls are only presigned when requested.
+        """
         try:
             logger.debug(f"Attempting to get listing {listing_id} from marketplace {marketplace_id}")
-            listing_ref = self._get_marketplace_listings_ref(marketplace_id).child(listing_id)
-            listing_data = listing_ref.get()
-
-            if not listing_data:
+            replica = self._replica(marketplace_id)
+            record = replica.get(listing_id) if replica else None
+            if record is None: # Cold or missing replica: read RTDB
+                listing_ref = self._get_marketplace_listings_ref(marketplace_id).child(listing_id)
+                raw = listing_ref.get()
+                record = ListingRecord.from_dict(raw, listing_id) if isinstance(raw, dict) and raw else None
+
+            if record is None:
                  logger.warning(f"Listing {listing_id} not found in marketplace {marketplace_id}")
                  # Return None as the route likely expects this for a 404
                  return None
+            listing_data = record.to_dict(fields)
+            listing_data['ListingID'] = listing_id
+            if fields is not None and 'ImageUrls' not in fields:
+                 return listing_data
 
             # --- Add Image URLs using stored keys ---
             image_urls = []
-            image_keys = listing_data.get("ImageKeys") # Preferentially use list of all keys
-            if not image_keys and listing_data.get("CoverImageKey"): # Fallback to CoverImageKey
-                 image_keys = [listing_data.get("CoverImageKey")]
+            image_keys = record.image_keys # Preferentially use list of all keys
+            if not image_keys and record.cover_image_key: # Fallback to CoverImageKey
+                 image_keys = [record.cover_image_key]
 
             if image_keys:
                  try:
                       logger.debug(f"Getting image URLs for listing {listing_id} (keys: {image_keys})")
-                      s3 = blob_storage.connect_to_blob_db_resource()
-                      # Generate signed URLs for all keys found
-                      image_urls = [blob_storage.get_image_url_from_key(key, s3_resource=s3) for key in image_keys]
+                      s3 = self._connect_for_urls()
+                      # Generate signed (or cached proxy) URLs for all keys found
+                      image_urls = [self._image_url(key, s3) for key in image_keys]
                       logger.debug(f"Generated {len(image_urls)} image URLs for listing {listing_id}")
                  except Exception as blob_e:
                       logger.error(f"Failed to generate signed URLs for listing {listing_id}: {blob_e}", exc_info=True)
@@ -212,47 +348,83 @@ class ListingService:
             # Raise a more specific error if possible, otherwise DatabaseError
             raise DatabaseError(f"Failed to get listing {listing_id} in marketplace {marketplace_id}: {e}")
 
-    def get_all_listings_user(self, marketplace_id: str, account_id: str) -> List[Dict[str, Any]]:
-        """Get all listings for a particular user within a specific marketplace."""
+    def get_listing_owner(self, marketplace_id: str, listing_id: str) -> Optional[str]:
+        """UserID of a listing's seller, or None if the listing doesn't exist. Reads one field, not the listing."""
         try:
-            logger.debug(f"Getting all listings for user {account_id} in marketplace {marketplace_id}")
-            listings_ref = self._get_marketplace_listings_ref(marketplace_id)
+            replica = self._replica(marketplace_id)
+            record = replica.get(listing_id) if replica else None
+            if record is not None:
+                return record.user_id
+            owner = self._get_marketplace_listings_ref(marketplace_id).child(listing_id).child('UserID').get()
+            return str(owner) if owner else None
+        except Exception as e:
+            logger.error(f"Error reading owner of listing {listing_id} in marketplace {marketplace_id}: {e}", exc_info=True)
+            raise DatabaseError(f"Failed to get owner of listing {listing_id}: {e}")
+
+    def get_listings_batch(self, marketplace_id: str, listing_ids: List[str],
+                           fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Several listings by id: {"listings": {id: listing}, "missing": [ids]}, listings in list-endpoint shape
+        (CoverImageUrl, no ImageUrls). Replica hits are free; the rest are read from RTDB concurrently.
+        Listings whose images aren't ready count as missing.
+        """
+        ids = list(dict.fromkeys(str(i) for i in listing_ids if i)) # Dedupe, keep order
+        if len(ids) > MAX_BATCH_IDS:
+            raise ValidationError(f"At most {MAX_BATCH_IDS} listing ids per batch.")
+        try:
+            replica = self._replica(marketplace_id)
+            records = {k: replica.get(k) for k in ids} if replica else {}
+            to_read = [k for k in ids if records.get(k) is None]
+            if to_read:
+                source_ref = self._listing_source_ref(marketplace_id, fields)
+                results = fan_out({k: (lambda k=k: source_ref.child(k).get()) for k in to_read})
+                for k, outcome in results.items():
+                    if not outcome.ok:
+                        raise outcome.error
+                    raw = outcome.value
+                    records[k] = ListingRecord.from_dict(raw, k) if isinstance(raw, dict) and raw else None
+
+            found = [k for k in ids if records.get(k) is not None and self._images_ready(records[k])]
+            try:
+                s3 = self._connect_for_urls() if found and self._wants(fields, 'CoverImageUrl') else None
+            except Exception as s3_e:
+                logger.error(f"Failed to connect to S3 for listing batch in {marketplace_id}: {s3_e}")
+                s3 = None
+            listings = {k: self._list_item(k, records[k], s3, fields) for k in found}
+            missing = [k for k in ids if k not in listings]
+            logger.info(f"Batch get of {len(ids)} listings in {marketplace_id}: {len(listings)} found, "
+                        f"{len(missing)} missing, {len(to_read)} read from RTDB")
+            return {"listings": listings, "missing": missing}
+        except Exception as e:
+            logger.error(f"Failed batch get of listings in marketplace {marketplace_id}: {e}", exc_info=True)
+            raise DatabaseError(f"Failed to get listings in marketplace {marketplace_id}: {e}")
 
-            # Query Firebase for listings where UserID matches account_id within the marketplace
-            # Ensure the UserID type matches how it's stored (string vs int)
-            query = listings_ref.order_by_child('UserID').equal_to(str(account_id)) # Assuming UserID is stored as string
+    def get_all_listings_user(self, marketplace_id: str, account_id: str, include_pending: bool = False,
+                              fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Get all listings for a particular user within a specific marketplace.
+        Listings whose images are not ready are left out unless include_pending is set (the owner's own view).
+        `fields` limits the returned keys; when the summary nodes cover them only summaries are read.
+        """
+        try:
+            logger.debug(f"Getting all listings for user {account_id} in marketplace {marketplace_id}")
 
-            all_user_listings_dict = query.get()
+            all_user_listings_dict = self._user_records(marketplace_id, account_id, fields)
             found_listings = []
 
             if all_user_listings_dict: # Firebase returns a dict {listing_id: data} when querying
                  logger.debug(f"Found raw listings for user {account_id} in {marketplace_id}: {len(all_user_listings_dict)}")
                  try:
-                     s3 = blob_storage.connect_to_blob_db_resource() # Connect once for all listings
+                     s3 = self._connect_for_urls() if self._wants(fields, 'CoverImageUrl') else None # Connect once for all listings
                  except Exception as s3_e:
                      logger.error(f"Failed to connect to S3 for user listings {account_id} in {marketplace_id}: {s3_e}")
                      s3 = None # Proceed without URLs if S3 fails
 
-                 for listing_id, listing_data in all_user_listings_dict.items():
-                      if listing_data and isinstance(listing_data, dict): # Basic validation
-                            # Add CoverImageUrl using CoverImageKey
-                            cover_key = listing_data.get("CoverImageKey")
-                            if cover_key and s3:
-                                try:
-                                    listing_data["CoverImageUrl"] = blob_storage.get_image_url_from_key(
-                                        cover_key, s3_resource=s3
-                                    )
-                                except Exception as url_e:
-                                     logger.warning(f"Failed to get cover image URL for key {cover_key} (listing {listing_id}): {url_e}")
-                                     listing_data["CoverImageUrl"] = None # Assign None on error
-                            else:
-                                 listing_data["CoverImageUrl"] = None # No key or no S3 connection
-
-                            # Ensure ListingID is present (it's the key, but good practice)
-                            if 'ListingID' not in listing_data:
-                                listing_data['ListingID'] = listing_id
-
-                            found_listings.append(listing_data)
+                 for listing_id, record in all_user_listings_dict.items():
+                      if record is not None: # Basic validation
+                            if not include_pending and not self._images_ready(record):
+                                continue # Only the owner sees listings whose images are not ready (flagged by ImageStatus)
+                            found_listings.append(self._list_item(listing_id, record, s3, fields))
                       else:
                           logger.warning(f"Skipping invalid data found for user {account_id} at listing ID {listing_id} in marketplace {marketplace_id}")
 
@@ -269,41 +441,86 @@ class ListingService:
             logger.error(f"Failed to get user's listings for {account_id} in {marketplace_id}: {e}", exc_info=True)
             raise DatabaseError(f"Failed to get listings for user {account_id} in marketplace {marketplace_id}: {e}")
 
-    def get_all_listings_total(self, marketplace_id: str) -> List[Dict[str, Any]]:
-        """Get all listings within a specific marketplace."""
+    def get_listings_user_page(self, marketplace_id: str, account_id: str, limit: int = USER_PAGE_SIZE,
+                               after: Optional[str] = None, include_pending: bool = False,
+                               fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        One page of a user's listings, newest first: {"listings": [...], "next": cursor or None}.
+        Pass the previous page's cursor as `after`. Only the page's cover images are presigned.
+        """
+        try:
+            records = self._user_records(marketplace_id, account_id, fields)
+            # Push IDs sort by creation time, so newest first is descending key order
+            ids = sorted((k for k, v in records.items()
+                          if v is not None and (include_pending or self._images_ready(v))), reverse=True)
+            if after:
+                ids = [k for k in ids if k < after]
+            page_ids = ids[:limit]
+            try:
+                s3 = self._connect_for_urls() if page_ids and self._wants(fields, 'CoverImageUrl') else None
+            except Exception as s3_e:
+                logger.error(f"Failed to connect to S3 for user listings {account_id} in {marketplace_id}: {s3_e}")
+                s3 = None
+            listings = [self._list_item(k, records[k], s3, fields) for k in page_ids]
+            return {"listings": listings, "next": page_ids[-1] if len(ids) > limit else None}
+        except Exception as e:
+            logger.error(f"Failed to get listing page for user {account_id} in {marketplace_id}: {e}", exc_info=True)
+            raise DatabaseError(f"Failed to get listings for user {account_id} in marketplace {marketplace_id}: {e}")
+
+    def get_listings_page(self, marketplace_id: str, limit: int = FIRST_PAGE_SIZE,
+                          fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        The newest `limit` listings in the marketplace, newest first, in get_all_listings_total()'s shape.
+        Without a live replica only those listings are read (a limit_to_last key query), which keeps cold
+        page loads fast. Listings whose images aren't ready are left out, so a page can come up short.
+        """
+        try:
+            replica = self._replica(marketplace_id)
+            if replica:
+                records = dict(replica.items())
+            else:
+                query = self._listing_source_ref(marketplace_id, fields).order_by_key().limit_to_last(limit)
+                records = self._to_records(query.get())
+            # Push IDs sort by creation time
+            ids = sorted((k for k, v in records.items() if v is not None and self._images_ready(v)), reverse=True)[:limit]
+            try:
+                s3 = self._connect_for_urls() if ids and self._wants(fields, 'CoverImageUrl') else None
+            except Exception as s3_e:
+                logger.error(f"Failed to connect to S3 for listing page in {marketplace_id}: {s3_e}")
+                s3 = None
+            return [self._list_item(k, records[k], s3, fields) for k in ids]
+        except Exception as e:
+            logger.error(f"Failed to get first listing page for marketplace {marketplace_id}: {e}", exc_info=True)
+            raise DatabaseError(f"Failed to get listings in marketplace {marketplace_id}: {e}")
+
+    def get_all_listings_total(self, marketplace_id: str, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Get all listings within a specific marketplace.
+        `fields` limits the returned keys; when the summary nodes cover them only summaries are read.
+        """
         try:
             logger.debug(f"Getting all listings for marketplace {marketplace_id}")
-            listings_ref = self._get_marketplace_listings_ref(marketplace_id)
-            all_listings_dict = listings_ref.get() # Get all listings under the marketplace path
+            replica = self._replica(marketplace_id)
+            if replica:
+                all_listings_dict = dict(replica.items())
+            else:
+                # Get all listings (or just their summaries) under the marketplace path
+                all_listings_dict = self._to_records(self._listing_source_ref(marketplace_id, fields).get())
             found_listings = []
 
-            if all_listings_dict and isinstance(all_listings_dict, dict): # Check if marketplace has any listings (returns dict)
+            if all_listings_dict: # Check if marketplace has any listings
                  logger.debug(f"Found raw listings for marketplace {marketplace_id}: {len(all_listings_dict)}")
                  try:
-                     s3 = blob_storage.connect_to_blob_db_resource() # Connect once
+                     s3 = self._connect_for_urls() if self._wants(fields, 'CoverImageUrl') else None # Connect once
                  except Exception as s3_e:
                       logger.error(f"Failed to connect to S3 for all listings in {marketplace_id}: {s3_e}")
                       s3 = None
 
-                 for listing_id, listing_data in all_listings_dict.items():
-                      if listing_data and isinstance(listing_data, dict): # Basic validation
-                            # Add CoverImageUrl
-                            cover_key = listing_data.get("CoverImageKey")
-                            if cover_key and s3:
-                                try:
-                                    listing_data["CoverImageUrl"] = blob_storage.get_image_url_from_key(
-                                        cover_key, s3_resource=s3
-                                    )
-                                except Exception as url_e:
-                                     logger.warning(f"Failed to get cover image URL for key {cover_key} (listing {listing_id}): {url_e}")
-                                     listing_data["CoverImageUrl"] = None
-                            else:
-                                 listing_data["CoverImageUrl"] = None # No key or no S3
-
-                            if 'ListingID' not in listing_data:
-                                listing_data['ListingID'] = listing_id
-
-                            found_listings.append(listing_data)
+                 for listing_id, record in all_listings_dict.items():
+                      if record is not None: # Basic validation
+                            if not self._images_ready(record):
+                                continue # Hide listings whose images are still processing or failed
+                            found_listings.append(self._list_item(listing_id, record, s3, fields))
                       else:
                             logger.warning(f"Skipping invalid data found at listing ID {listing_id} in marketplace {marketplace_id}")
 
@@ -318,8 +535,128 @@ class ListingService:
             logger.error(f"Failed to get all listings for marketplace {marketplace_id}: {e}", exc_info=True)
             raise DatabaseError(f"Failed to get all listings in marketplace {marketplace_id}: {e}")
 
+    def iter_listings(self, marketplace_id: str, fields: Optional[List[str]] = None,
+                      page_size: int = EXPORT_PAGE_SIZE, include_pending: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every visible listing in the list-endpoint shape, one at a time, for exports. include_pending
+        also yields listings whose images are still processing or failed.
+
+        Reads RTDB a page at a time with order_by_key() cursors (or walks the replica when it is live),
+        so memory stays flat however large the marketplace is.
+        """
+        replica = self._replica(marketplace_id)
+        s3 = self._connect_for_urls() if self._wants(fields, 'CoverImageUrl') else None
+        if replica:
+            pages = [replica.items()]
+        else:
+            pages = self._listing_pages(self._listing_source_ref(marketplace_id, fields), page_size)
+        count = 0
+        for page in pages:
+            for listing_id, record in page:
+                if record is not None and (include_pending or self._images_ready(record)):
+                    count += 1
+                    yield self._list_item(listing_id, record, s3, fields)
+        logger.info(f"Exported {count} listings from marketplace {marketplace_id}")
+
+    def _listing_pages(self, source_ref, page_size: int) -> Iterator[List[Tuple[str, Optional[ListingRecord]]]]:
+        """Pages of (listing_id, record) in key order; each page starts after the previous page's last key."""
+        cursor = None
+        while True:
+            query = source_ref.order_by_key()
+            if cursor is None:
+                raw = query.limit_to_first(page_size).get() or {}
+            else: # start_at is inclusive, so fetch one extra and drop the cursor itself
+                raw = query.start_at(cursor).limit_to_first(page_size + 1).get() or {}
+                raw.pop(cursor, None)
+            if not raw:
+                return
+            page = list(self._to_records(raw).items()) # The SDK returns keys in RTDB order; keep it for the cursor
+            yield page
+            if len(page) < page_size:
+                return
+            cursor = page[-1][0]
+
+    def get_listing_changes(self, marketplace_id: str, since: Optional[int] = None,
+                            fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Listings created, updated, sold or deleted since a version token from an earlier call.
+
+        Versions are Firebase server timestamps from the ListingChanges index (UpdatedAt, or a tombstone
+        for deletes). Without `since` this is a full sync: every visible listing plus the current version.
+        Returns {"full", "version", "listings", "deleted"}; "deleted" also lists listings that were
+        hidden since, e.g. whose images failed. The query is inclusive, so clients may see the last
+        change again; they should treat "listings" as upserts.
+        """
+        try:
+            changes_ref = self._get_marketplace_ref(marketplace_id).child('ListingChanges')
+            if since is None:
+                # Read the version before the listings so a write in between is sent again next time
+                latest = changes_ref.order_by_child('UpdatedAt').limit_to_last(1).get() or {}
+                version = max((c.get('UpdatedAt', 0) for c in latest.values() if isinstance(c, dict)), default=0)
+                return {"full": True, "version": str(version),
+                        "listings": self.get_all_listings_total(marketplace_id, fields), "deleted": []}
+
+            changed = changes_ref.order_by_child('UpdatedAt').start_at(since).get() or {}
+            version = since
+            listings, deleted = [], []
+            replica = self._replica(marketplace_id)
+            s3 = self._connect_for_urls() if changed and self._wants(fields, 'CoverImageUrl') else None
+            for listing_id, change in changed.items():
+                if not isinstance(change, dict):
+                    continue
+                changed_at = change.get('UpdatedAt', 0)
+                version = max(version, changed_at)
+                record = None
+                if not change.get('Deleted'):
+                    record = replica.get(listing_id) if replica else None
+                    if record is None or (record.updated_at or 0) < changed_at: # Replica has not caught up
+                        raw = self._get_marketplace_listings_ref(marketplace_id).child(listing_id).get()
+                        record = ListingRecord.from_dict(raw, listing_id) if isinstance(raw, dict) and raw else None
+                if record is None or not self._images_ready(record):
+                    deleted.append(listing_id)
+                else:
+                    listings.append(self._list_item(listing_id, record, s3, fields))
+            logger.info(f"Listing changes since {since} in {marketplace_id}: {len(listings)} changed, {len(deleted)} removed")
+            return {"full": False, "version": str(version), "listings": listings, "deleted": deleted}
+        except Exception as e:
+            logger.error(f"Failed to get listing changes for marketplace {marketplace_id}: {e}", exc_info=True)
+            raise DatabaseError(f"Failed to get listing changes in marketplace {marketplace_id}: {e}")
+
+    def listing_etag(self, marketplace_id: str, listing_id: str) -> str:
+        """ETag for get_listing(); changes whenever the listing is written."""
+        return versions.etag(('listing', marketplace_id, listing_id), ('listings-resync', marketplace_id),
+                             salt=self._url_epoch())
+
+    def listings_etag(self, marketplace_id: str, variant: str = '') -> str:
+        """ETag for the marketplace list endpoints; changes whenever any listing in the marketplace is written."""
+        salt = '-'.join(p for p in (variant, self._url_epoch()) if p)
+        return versions.etag(('listings', marketplace_id), salt=salt or None)
+
+    def _url_epoch(self) -> str:
+        # Presigned URLs live for an hour and are reused for half of it (presign_cache); signed proxy URLs
+        # expire on the same windows (image_cache). ETags roll over with the window: a 304 never leaves a
+        # client holding URLs with less than 30 minutes to run.
+        return f"u{presign_cache.current_window()}"
+
+    def get_all_listings_encoded(self, marketplace_id: str, shape: Tuple = (),
+                                 fields: Optional[List[str]] = None) -> EncodedResponse:
+        """
+        get_all_listings_total() as pre-serialized, pre-compressed JSON, cached per (marketplace, query shape).
+        Cached entries are tied to the replica's event count, so writes seen on the stream invalidate them.
+        """
+        replica = self._replica(marketplace_id)
+        generation = replica.events if replica else None
+        return listings_response_cache.get_or_build(
+            marketplace_id, shape, lambda: self.get_all_listings_total(marketplace_id, fields), generation)
+
     def update_listing(self, marketplace_id: str, listing_id: str, user_id: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-         """Update a listing within a specific marketplace, checking ownership. (Currently does not support image updates)."""
+         """
+         Update a listing within a specific marketplace, checking ownership.
+
+         To change images, send 'Images' as the desired ordered list: existing image keys are kept,
+         any other entry is treated as a new base64 image and uploaded. Keys left out are deleted.
+         The first entry becomes the cover.
+         """
          try:
             logger.info(f"Attempting update for listing {listing_id} in marketplace {marketplace_id} by user {user_id}")
             listing_ref = self._get_marketplace_listings_ref(marketplace_id).child(listing_id)
@@ -336,26 +673,44 @@ class ListingService:
                 raise PermissionDeniedError(f"User {user_id} does not have permission to update listing {listing_id}.")
 
             # --- Prepare Update Payload ---
-            # Prevent critical fields like ListingID, UserID, ImageKeys, CoverImageKey from being changed via this endpoint
-            # Image updates would require a more complex flow (delete old blobs, upload new, update keys)
-            protected_keys = ['ListingID', 'UserID', 'ImageKeys', 'CoverImageKey']
+            # Prevent critical fields like ListingID, UserID, ImageKeys, CoverImageKey from being changed directly;
+            # image changes go through the 'Images' list instead
+            protected_keys = ['ListingID', 'UserID', 'ImageKeys', 'CoverImageKey', 'CoverPlaceholder', 'CoverThumbKey',
+                              'ImageStatus', 'ImageStatusReason', 'Images']
             payload = {k: v for k, v in update_data.items() if k not in protected_keys}
 
+            removed_keys, uploaded_keys = [], []
+            if 'Images' in update_data:
+                image_payload, removed_keys, uploaded_keys = self._apply_image_changes(listing_id, listing_data, update_data['Images'])
+                payload.update(image_payload)
+
             if not payload:
                  # Changed to warning as maybe the request only contained protected keys, which isn't an error per se, just no-op.
                  # Or raise ValidationError if any update data MUST be provided. Let's warn for now.
                  logger.warning(f"No valid fields provided for update on listing {listing_id} after filtering protected keys.")
                  # Return the original data or None? Returning original seems reasonable for a no-op update.
                  # Add ImageUrls to original data before returning
+                 listing_data = ListingRecord.from_dict(listing_data, listing_id).to_dict()
                  self._add_image_urls_to_listing(listing_data) # Use a helper for clarity
                  return listing_data
                  # raise ValidationError("No valid fields provided for update.")
 
             logger.debug(f"Updating listing {listing_id} at {listing_ref.path} with payload: {payload}")
-            listing_ref.update(payload) # Update only the allowed fields
+            try:
+                self._write_listing(marketplace_id, 'patch', listing_id, payload) # Update only the allowed fields
+            except Exception:
+                if uploaded_keys: # Nothing points at the new images
+                    self._delete_image_blobs(listing_id, uploaded_keys)
+                raise
+
+            # Delete removed images only after the listing stops pointing at them
+            if removed_keys:
+                self._delete_image_blobs(listing_id, removed_keys)
 
             # Fetch the updated data to return it
             updated_listing_data = listing_ref.get()
+            if updated_listing_data:
+                updated_listing_data = ListingRecord.from_dict(updated_listing_data, listing_id).to_dict()
             if not updated_listing_data:
                  # This shouldn't normally happen if update was successful, but check defensively
                  logger.error(f"Failed to retrieve listing {listing_id} immediately after update in {marketplace_id}.")
@@ -374,6 +729,231 @@ class ListingService:
             logger.error(f"Failed to update listing {listing_id} in marketplace {marketplace_id}: {e}", exc_info=True)
             raise DatabaseError(f"Failed to update listing {listing_id} in marketplace {marketplace_id}: {e}")
 
+    def _apply_image_changes(self, listing_id: str, listing_data: Dict[str, Any], images: List[Any]):
+        """
+        Work out the image part of an update from the desired ordered image list. Validates every entry,
+        then compresses and uploads only the new images. Returns (fields_to_write, keys_to_delete, uploaded_keys);
+        the caller deletes uploaded_keys if the listing write fails.
+        """
+        if not isinstance(images, list) or not images:
+            raise ValidationError("'Images' must be a non-empty list of image keys or new images.")
+        if listing_data.get("ImageStatus") == IMAGE_STATUS_PROCESSING:
+            raise ValidationError("Images for this listing are still processing; try again shortly.")
+
+        current_keys = listing_data.get("ImageKeys") or []
+        if not current_keys and listing_data.get("CoverImageKey"):
+            current_keys = [listing_data.get("CoverImageKey")]
+        current = set(current_keys)
+
+        # Positions in the final list that need a freshly uploaded image. Validate everything before uploading:
+        # an entry that isn't a current key (say one a concurrent edit just removed) must decode to a real image
+        new_positions = [i for i, item in enumerate(images) if item not in current]
+        kept = [item for i, item in enumerate(images) if i not in new_positions]
+        if len(set(kept)) != len(kept):
+            raise ValidationError("'Images' contains the same image more than once.")
+        compressed = {i: blob_storage.compress_image(self._decode_new_image(i, images[i]), LISTING_IMAGE_MAX_KB)
+                      for i in new_positions}
+
+        new_keys = list(images)
+        uploaded = []
+        if new_positions:
+            s3 = blob_storage.connect_to_blob_db_resource()
+            uploaded = blob_storage.upload_files_to_bucket(
+                s3, listing_id, [compressed[i] for i in new_positions], unique_names=True
+            )
+            if len(uploaded) != len(new_positions):
+                if uploaded:
+                    self._delete_image_blobs(listing_id, uploaded)
+                raise DatabaseError("Failed to upload new images to blob storage.")
+            for i, key in zip(new_positions, uploaded):
+                new_keys[i] = key
+            logger.info(f"Uploaded {len(uploaded)} new image(s) for listing {listing_id}")
+
+        fields = {"ImageKeys": new_keys, "CoverImageKey": new_keys[0]}
+        removed = [key for key in current_keys if key not in set(new_keys)]
+        if new_keys[0] != listing_data.get("CoverImageKey"):
+            # The old cover thumbnail no longer matches; list views fall back to the full cover image
+            if listing_data.get("CoverThumbKey"):
+                fields["CoverThumbKey"] = None
+                removed.append(listing_data["CoverThumbKey"])
+            try:
+                cover_source = compressed[0] if 0 in compressed else blob_storage.get_image_from_key(new_keys[0])
+                fields["CoverPlaceholder"] = blob_storage.make_placeholder(cover_source)
+            except Exception as ph_e:
+                logger.warning(f"Failed to rebuild cover placeholder for listing {listing_id}: {ph_e}")
+
+        return fields, removed, uploaded
+
+    def _decode_new_image(self, position: int, item: Any) -> bytes:
+        """Raw bytes of a new image entry (data URL or base64), or ValidationError if it isn't an image."""
+        if not isinstance(item, str) or not item:
+            raise ValidationError(f"Image at position {position} is neither an existing key nor base64 data.")
+        try:
+            data = blob_storage.decode_image_payload(item)
+            Image.open(io.BytesIO(data)).verify()
+            return data
+        except Exception:
+            raise ValidationError(f"Image at position {position} is neither an existing key nor a valid image.")
+
+    def _delete_image_blobs(self, listing_id: str, keys: List[str]):
+        """Queue a batch delete of image blobs and drop them from the local image cache right away."""
+        keys = list(keys)
+        digest = hashlib.sha1("\n".join(sorted(keys)).encode("utf-8")).hexdigest()
+        job_queue.enqueue('delete_listing_images', {'listing_id': listing_id, 'keys': keys},
+                          idempotency_key=f"delete-images:{listing_id}:{digest}")
+        cache = image_cache.get_cache()
+        if cache:
+            for key in keys:
+                cache.invalidate(key)
+
+    def _replica(self, marketplace_id: str):
+        """The live in-memory replica of this marketplace's listings, or None to read RTDB."""
+        return replica_manager.get(marketplace_id, self._get_marketplace_listings_ref(marketplace_id))
+
+    def patch_listing_with(self, marketplace_id: str, listing_id: str, data: Dict[str, Any],
+                           extra_updates: Dict[str, Any]):
+        """
+        Merge fields into a listing in the same atomic multi-path update as extra_updates (paths relative to
+        the marketplace), for writes in other services that must land together with a listing change.
+        """
+        self._write_listing(marketplace_id, 'patch', listing_id, data, extra_updates)
+
+    def probe_listing(self, marketplace_id: str, listing_id: str) -> Optional[Dict[str, Any]]:
+        """
+        {'UserID', 'SellStatus', 'Price', 'Category'} of a listing for validators, or None if it doesn't exist. Served by the
+        replica when it is live, else by the small ListingSummary node once summaries are backfilled.
+        """
+        try:
+            replica = self._replica(marketplace_id)
+            record = replica.get(listing_id) if replica else None
+            if record is None:
+                if self._summaries_ready(marketplace_id):
+                    raw = self._get_marketplace_ref(marketplace_id).child('ListingSummary').child(listing_id).get()
+                else:
+                    raw = self._get_marketplace_listings_ref(marketplace_id).child(listing_id).get()
+                record = ListingRecord.from_dict(raw, listing_id) if isinstance(raw, dict) and raw else None
+            if record is None:
+                return None
+            return {'UserID': record.user_id, 'SellStatus': record.sell_status, 'Price': record.price,
+                    'Category': record.category}
+        except Exception as e:
+            logger.error(f"Error probing listing {listing_id} in marketplace {marketplace_id}: {e}", exc_info=True)
+            raise DatabaseError(f"Failed to read listing {listing_id}: {e}")
+
+    def _write_listing(self, marketplace_id: str, event_type: str, listing_id: str, data: Any,
+                       extra_updates: Optional[Dict[str, Any]] = None):
+        """
+        Write a listing ('put' replaces it, or deletes it when data is None; 'patch' merges fields) in one
+        multi-path update that also keeps its ListingSummary in step, stamps UpdatedAt and writes its
+        ListingChanges entry (a tombstone for deletes), so neither can drift from the listing. Then runs the _listing_written bookkeeping.
+        extra_updates (marketplace-relative paths) are written in the same update.
+        """
+        change = {'UpdatedAt': SERVER_TIMESTAMP}
+        if event_type == 'put' and data is None:
+            updates = {f"Listing/{listing_id}": None, f"ListingSummary/{listing_id}": None,
+                       f"ListingFavorites/{listing_id}": None}
+            change['Deleted'] = True
+        elif event_type == 'put':
+            full = dict(data, UpdatedAt=SERVER_TIMESTAMP)
+            updates = {f"Listing/{listing_id}": full, f"ListingSummary/{listing_id}": summary_of(full)}
+        else:
+            updates = {}
+            for key, value in dict(data, UpdatedAt=SERVER_TIMESTAMP).items():
+                updates[f"Listing/{listing_id}/{key}"] = value
+                if key in SUMMARY_KEYS:
+                    updates[f"ListingSummary/{listing_id}/{key}"] = value
+        updates[f"ListingChanges/{listing_id}"] = change
+        if extra_updates:
+            updates.update(extra_updates)
+        self._get_marketplace_ref(marketplace_id).update(updates)
+
+        # The replica gets our clock until the stream echoes the server timestamp
+        if data is not None:
+            data = dict(data, UpdatedAt=int(time.time() * 1000))
+        self._listing_written(marketplace_id, event_type, listing_id, data)
+
+    def _listing_written(self, marketplace_id: str, event_type: str, listing_id: str, data: Any):
+        """
+        Called after every listing write: drops the marketplace's cached list responses, bumps the
+        listing versions behind ETags and applies the write to the replica right away (read-your-writes);
+        the stream echo is timed for lag. The price statistics are updated too.
+        """
+        listings_response_cache.invalidate(marketplace_id)
+        price_stats.listing_written(marketplace_id, event_type, listing_id, data)
+        versions.bump('listing', marketplace_id, listing_id)
+        versions.bump('listings', marketplace_id)
+        replica = replica_manager.peek(marketplace_id)
+        if replica:
+            replica.apply(event_type, f"/{listing_id}", data)
+            replica.note_write(listing_id)
+
+    def _images_ready(self, listing_data) -> bool:
+        """True unless the listing's images are still processing or failed (legacy listings have no ImageStatus)."""
+        return listing_data.get("ImageStatus", IMAGE_STATUS_READY) == IMAGE_STATUS_READY
+
+    def _list_item(self, listing_id: str, record: ListingRecord, s3, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """List-endpoint shape of a listing: its fields plus CoverImageUrl (grid thumbnail when one exists)."""
+        listing_data = record.to_dict(fields)
+        listing_data['ListingID'] = listing_id
+        if not self._wants(fields, 'CoverImageUrl'):
+            return listing_data
+        cover_key = record.cover_thumb_key or record.cover_image_key
+        if cover_key and (s3 or image_cache.is_enabled()):
+            try:
+                listing_data["CoverImageUrl"] = self._image_url(cover_key, s3)
+            except Exception as url_e:
+                 logger.warning(f"Failed to get cover image URL for key {cover_key} (listing {listing_id}): {url_e}")
+                 listing_data["CoverImageUrl"] = None # Assign None on error
+        else:
+             listing_data["CoverImageUrl"] = None # No key or no S3 connection
+        return listing_data
+
+    def _wants(self, fields: Optional[List[str]], key: str) -> bool:
+        return fields is None or key in fields
+
+    def _user_records(self, marketplace_id: str, account_id: str,
+                      fields: Optional[List[str]] = None) -> Dict[str, Optional[ListingRecord]]:
+        """{listing_id: record} for a user's listings, from the replica or a UserID query."""
+        replica = self._replica(marketplace_id)
+        if replica:
+            return {k: v for k, v in replica.items() if str(v.user_id) == str(account_id)}
+        # Query Firebase for listings where UserID matches account_id within the marketplace
+        # Ensure the UserID type matches how it's stored (string vs int)
+        source_ref = self._listing_source_ref(marketplace_id, fields)
+        query = source_ref.order_by_child('UserID').equal_to(str(account_id)) # Assuming UserID is stored as string
+        return self._to_records(query.get())
+
+    def _listing_source_ref(self, marketplace_id: str, fields: Optional[List[str]]):
+        """ListingSummary when it holds every requested field (and has been backfilled), else Listing."""
+        if fields is not None and set(fields) <= SUMMARY_OUTPUT_KEYS and self._summaries_ready(marketplace_id):
+            return self._get_marketplace_ref(marketplace_id).child('ListingSummary')
+        return self._get_marketplace_listings_ref(marketplace_id)
+
+    def _summaries_ready(self, marketplace_id: str) -> bool:
+        """True once migrate_listing_summaries.py has backfilled summaries for the marketplace's older listings."""
+        if marketplace_id not in self._summary_ready_marketplaces:
+            if self._get_marketplace_ref(marketplace_id).child('ListingSummaryMeta').child('Complete').get():
+                self._summary_ready_marketplaces.add(marketplace_id) # The flag is never cleared
+        return marketplace_id in self._summary_ready_marketplaces
+
+    def _to_records(self, raw: Any) -> Dict[str, Optional[ListingRecord]]:
+        """Parse an RTDB {listing_id: data} result into ListingRecords; malformed entries map to None."""
+        if not isinstance(raw, dict):
+            return {}
+        return {k: ListingRecord.from_dict(v, k) if isinstance(v, dict) and v else None for k, v in raw.items()}
+
+    def _connect_for_urls(self):
+        """Blob storage connection for presigning, or None when URLs point at the local image cache."""
+        if image_cache.is_enabled():
+            return None
+        return blob_storage.connect_to_blob_db_resource()
+
+    def _image_url(self, key: str, s3=None) -> str:
+        """URL for an image key: the /api/images proxy if the disk cache is enabled, else a presigned URL."""
+        if image_cache.is_enabled():
+            return image_cache.url_for_key(key)
+        return presign_cache.get_or_sign(key, lambda k: blob_storage.get_image_url_from_key(k, s3_resource=s3))
+
     def _add_image_urls_to_listing(self, listing_data: Dict[str, Any]):
         """Adds 'ImageUrls' list to listing data dict based on stored keys. Mutates the dict."""
         if not listing_data or not isinstance(listing_data, dict):
@@ -388,8 +968,8 @@ class ListingService:
         if image_keys:
              try:
                   # Consider caching S3 resource if called frequently
-                  s3 = blob_storage.connect_to_blob_db_resource()
-                  image_urls = [blob_storage.get_image_url_from_key(key, s3_resource=s3) for key in image_keys]
+                  s3 = self._connect_for_urls()
+                  image_urls = [self._image_url(key, s3) for key in image_keys]
              except Exception as blob_e:
                   logger.error(f"Failed to generate signed URLs for listing {listing_id_for_log} during URL addition: {blob_e}", exc_info=True)
                   listing_data["ImageError"] = "Could not load images"
@@ -402,7 +982,31 @@ listing_service = ListingService()
 add_listing = listing_service.add_listing
 del_listing = listing_service.del_listing
 get_listing = listing_service.get_listing
+get_listing_owner = listing_service.get_listing_owner
+get_listings_batch = listing_service.get_listings_batch
 get_all_listings_user = listing_service.get_all_listings_user
+get_listings_user_page = listing_service.get_listings_user_page
 get_all_listings_total = listing_service.get_all_listings_total
+get_listings_page = listing_service.get_listings_page
+get_all_listings_encoded = listing_service.get_all_listings_encoded
+get_listing_changes = listing_service.get_listing_changes
+iter_listings = listing_service.iter_listings
+listing_etag = listing_service.listing_etag
+listings_etag = listing_service.listings_etag
 update_listing = listing_service.update_listing
 update_listing_sell_status = listing_service.update_listing_sell_status
+
+
+# --- Background jobs ---
+def _mark_listing_images_failed(payload, error):
+    listing_service._mark_images_failed(payload['marketplace_id'], payload['listing_id'], error)
+
+@job_queue.register('process_listing_images', on_dead=_mark_listing_images_failed)
+def _process_listing_images_job(payload):
+    listing_service._process_listing_images(payload['marketplace_id'], payload['listing_id'], payload['images'])
+
+@job_queue.register('delete_listing_images')
+def _delete_listing_images_job(payload):
+    s3 = blob_storage.connect_to_blob_db_resource()
+    blob_storage.delete_files_from_bucket(s3, payload['keys'])
+    logger.info(f"Deleted {len(payload['keys'])} image(s) from blob storage for listing {payload['listing_id']}")
@@ -8,10 +8,19 @@ something for.
 Author: Sofia DiCarlo, Class of 2025
 '''
 from openai import OpenAI
+from .job_queue import job_queue
+from .listing_service import listing_service
+from .price_cache import prediction_cache, prediction_key
+from .price_estimator import estimator_manager, price_fill_metrics, MIN_CONFIDENCE
+from .transaction_service import transaction_service
+import logging
+import time
 import json #< For private OPENAI_API_KEY
 import os #< OS routines for NT or Posix depending on what system we're on.
 import re #< regular expressions library
 
+logger = logging.getLogger(__name__)
+
 # Get the absolute path to the credentials file
 current_dir = os.path.dirname(os.path.abspath(__file__))
 backend_dir = os.path.dirname(current_dir)
@@ -43,8 +52,27 @@ price that is good for college student.
 RETURNS: 
 Once the price has been returned, returns a upper-range price and lower-range 
 in format [lower_price, upper_price]
+
+Answers are cached in prediction_cache under the normalised (name, sorted
+categories, description digest), and concurrent identical requests share one
+OpenAI call.
 '''
 def get_price_prediction(category, name, description):
+    return _cached_price_prediction(category, name, description)[0]
+
+
+def _cached_price_prediction(category, name, description):
+    # (prediction, whether prediction_cache answered it)
+    return prediction_cache.get_or_compute(
+        prediction_key(category, name, description),
+        lambda: _request_price_prediction(category, name, description))
+
+'''
+_request_price_prediction
+
+The OpenAI call behind get_price_prediction (same parameters and result).
+'''
+def _request_price_prediction(category, name, description):
     
     # A fall-back for when a description is not provided, and is 'None'.
     description_text = description if description else "no description provided"
@@ -82,6 +110,60 @@ def get_price_prediction(category, name, description):
     "minPrice": lower_bound,
     "maxPrice": upper_bound}
 
+'''
+_training_docs
+
+The marketplace's listings as (title, category, description, price) for the
+local price estimator. Listings sold through a transaction use the sale price.
+'''
+def _training_docs(marketplace_id):
+    sold = transaction_service.get_sold_prices(marketplace_id)
+    for item in listing_service.iter_listings(marketplace_id, fields=['Title', 'Category', 'Description', 'Price']):
+        price = sold.get(item['ListingID'], item.get('Price'))
+        yield item.get('Title'), item.get('Category'), item.get('Description'), price
+
+'''
+suggest_price
+
+Price range for a listing, answered by the marketplace's local estimator
+(nearest listings by title, category and description) when it is confident
+enough, and by get_price_prediction (OpenAI) otherwise.
+
+RETURNS:
+{"minPrice", "maxPrice", "source"} where source is "local" or "llm"; local
+answers also carry "confidence". Each answer's path and latency is recorded
+in price_fill_metrics ("llm_fallback" means the local estimate was too weak,
+"cache" that the LLM's answer came from prediction_cache).
+'''
+def suggest_price(marketplace_id, category, name, description):
+    started = time.perf_counter()
+    model = estimator_manager.get(marketplace_id, _training_docs) if marketplace_id else None
+    path = "llm"
+    if model is not None:
+        try:
+            local = model.estimate(name, category, description)
+        except Exception as e:
+            logger.warning(f"Local price estimate failed for {name!r} in {marketplace_id}: {e}")
+            local = None
+        if local is not None and local["confidence"] >= MIN_CONFIDENCE:
+            price_fill_metrics.record("local", time.perf_counter() - started)
+            return {"minPrice": local["minPrice"], "maxPrice": local["maxPrice"],
+                    "source": "local", "confidence": local["confidence"]}
+        path = "llm_fallback"
+    prediction, cached = _cached_price_prediction(category, name, description)
+    if cached:
+        path = "cache"  # the LLM priced this item recently
+    price_fill_metrics.record(path, time.perf_counter() - started)
+    return dict(prediction, source="llm")
+
+'''
+Background version of suggest_price for the job queue
+(POST /api/ai_price_fill/?async=true). The result dict is stored on the job.
+'''
+@job_queue.register('price_prediction')
+def _price_prediction_job(payload):
+    return suggest_price(payload.get('marketplace_id'), payload.get('category'), payload.get('name'), payload.get('description'))
+
 '''
 Test function to test OpenAI prompting. Feel free to edit the test inputs.
 '''
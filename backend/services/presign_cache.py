@@ -0,0 +1,55 @@
+# services/presign_cache.py
+# Reuse presigned image URLs instead of signing the same key on every request.
+#
+# Presigned URLs live for an hour. Time is cut into half-hour windows (the same windows that
+# listing ETags roll over on) and a URL is reused only within the window it was signed in,
+# so a URL handed out always has at least 30 minutes left. Besides saving the signing work,
+# this keeps list responses byte-identical within a window.
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+# Matches the presigned URL lifetime in blob_storage (3600s): reuse for half of it
+WINDOW_SECONDS = 1800
+DEFAULT_MAX_ENTRIES = 20_000
+
+
+class PresignCache:
+    def __init__(self, window: float = WINDOW_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 clock: Callable[[], float] = time.time):
+        self.window = window
+        self.max_entries = max_entries
+        self._clock = clock
+        self._urls: 'OrderedDict[str, tuple]' = OrderedDict()  # key -> (window, url), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def current_window(self) -> int:
+        return int(self._clock() // self.window)
+
+    def get_or_sign(self, key: str, sign: Callable[[str], str]) -> str:
+        """URL for key from this window's cache, or sign(key) and remember it."""
+        window = self.current_window()
+        with self._lock:
+            entry = self._urls.get(key)
+            if entry is not None and entry[0] == window:
+                self._urls.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        url = sign(key)  # outside the lock: signing can be slow, and two signers of one key is harmless
+        with self._lock:
+            self._urls[key] = (window, url)
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+        return url
+
+    def metrics(self):
+        return {"entries": len(self._urls), "hits": self.hits, "misses": self.misses}
+
+
+presign_cache = PresignCache()
@@ -0,0 +1,162 @@
+# services/price_cache.py
+# Cache of OpenAI price predictions keyed on the normalised request.
+#
+# Many students list the same things, so get_price_prediction() is answered from here when the
+# same (name, categories, description) was priced recently. Keys ignore case, punctuation,
+# spacing and category order; descriptions are keyed by a digest. Entries expire after
+# REUSEU_PRICE_CACHE_TTL seconds (default 3 days) and the least recently used are evicted past
+# REUSEU_PRICE_CACHE_SIZE entries. Set REUSEU_PRICE_CACHE_PATH to a JSON file to keep the cache
+# across restarts. Concurrent misses for one key share a single upstream call (single-flight).
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .price_stats import category_keys
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 3 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def _normalise(text: Any) -> str:
+    return _NON_WORD.sub(' ', str(text).lower()).strip() if text else ''
+
+
+def prediction_key(category: Any, name: Any, description: Any) -> str:
+    """'name|category,category|description digest' with categories sorted and all text normalised."""
+    categories = ','.join(sorted(category_keys(category))) if category else ''
+    description = _normalise(description)
+    digest = hashlib.sha1(description.encode()).hexdigest()[:16] if description else ''
+    return f"{_normalise(name)}|{categories}|{digest}"
+
+
+class _Flight:
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class PredictionCache:
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 path: Optional[str] = None, clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self._clock = clock
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()  # key -> (expires_at, value), LRU first
+        self._inflight: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if path:
+            self._load()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """A copy of the cached value, or None on a miss (expired entries are dropped)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry[1])
+
+    def put(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.path:
+            self._save()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        (value, hit): the cached value for key, or compute() it and cache it; hit is True when it came from
+        the cache. Callers that miss while another caller is computing the same key wait for that result
+        (or its error) instead of calling compute() again.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value, True
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            self.coalesced += 1
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return dict(flight.value), False
+
+        self.misses += 1
+        try:
+            flight.value = compute()
+            self.put(key, flight.value)
+            return dict(flight.value), False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable price cache file {self.path}: {e}")
+            return
+        now = self._clock()
+        live = sorted((entry for entry in stored if entry[1] > now), key=lambda entry: entry[1])
+        for key, expires_at, value in live[-self.max_entries:]:
+            self._entries[key] = (expires_at, value)
+        logger.info(f"Loaded {len(self._entries)} cached price predictions from {self.path}")
+
+    def _save(self):
+        """Write the cache to self.path (atomically, via a temp file). Failures only cost persistence."""
+        with self._lock:
+            snapshot = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items()]
+        with self._save_lock:
+            tmp_path = f"{self.path}.tmp{threading.get_ident()}"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(snapshot, f, separators=(',', ':'))
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Failed to save price cache to {self.path}: {e}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "coalesced": self.coalesced, "persistent": bool(self.path)}
+
+
+prediction_cache = PredictionCache(
+    ttl=float(os.environ.get("REUSEU_PRICE_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+    max_entries=int(os.environ.get("REUSEU_PRICE_CACHE_SIZE", DEFAULT_MAX_ENTRIES)),
+    path=os.environ.get("REUSEU_PRICE_CACHE_PATH") or None,
+)
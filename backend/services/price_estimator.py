@@ -0,0 +1,277 @@
+# services/price_estimator.py
+# Local price-range estimates from a marketplace's own listings and sales, so most price-fill
+# requests can be answered without the OpenAI round trip.
+#
+# Every listing becomes a sparse TF-IDF vector over hashed tokens of its title (with bigrams),
+# category tags and description. The vectors are kept as an inverted index (postings sorted by
+# hash bucket), so scoring a query is one np.bincount over the postings of its few buckets.
+# The k most similar listings give a similarity-weighted price range; the estimate is used only
+# when its confidence (how similar the neighbours are and how much their prices agree) is high
+# enough, and otherwise the caller asks the LLM.
+#
+# Set REUSEU_PRICE_ESTIMATOR=0 to always use the LLM, and REUSEU_PRICE_ESTIMATOR_MIN_CONFIDENCE
+# to change the gate.
+#
+# Training reads the listings on a background (green) thread and builds the model in eventlet's
+# OS thread pool when eventlet has patched threading, so the CPU-bound build doesn't stall the hub.
+
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .listing_record import parse_price
+from .price_stats import category_keys
+
+logger = logging.getLogger(__name__)
+
+HASH_BUCKETS = 1 << 18
+
+# Feature weights: the title says most about what an item is
+TITLE_WEIGHT = 2.0
+BIGRAM_WEIGHT = 1.0
+CATEGORY_WEIGHT = 1.5
+DESCRIPTION_WEIGHT = 1.0
+MAX_DESCRIPTION_TOKENS = 60
+
+K_NEIGHBORS = 10
+MIN_SIMILARITY = 0.2   # neighbours less similar than this are ignored
+MIN_NEIGHBORS = 3
+MIN_CONFIDENCE = float(os.environ.get('REUSEU_PRICE_ESTIMATOR_MIN_CONFIDENCE', 0.3))
+
+# Marketplaces with fewer priced listings than this always use the LLM
+MIN_TRAINING_DOCS = 20
+
+# Retrain a marketplace's model in the background once it is this old, or this long after a failed training
+RETRAIN_SECONDS = 1800.0
+RETRY_SECONDS = 60.0
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text: Any) -> List[str]:
+    if not text:
+        return []
+    return [t for t in _TOKEN.findall(str(text).lower()) if len(t) > 1 or t.isdigit()]
+
+
+def _bucket(feature: str) -> int:
+    return zlib.crc32(feature.encode()) % HASH_BUCKETS  # stable across processes, unlike hash()
+
+
+def features(title: Any, category: Any, description: Any) -> Dict[int, float]:
+    """{hash bucket: weighted, sublinear term frequency} of one listing or query."""
+    counts: Counter = Counter()
+    title_tokens = _tokens(title)
+    for t in title_tokens:
+        counts[t] += TITLE_WEIGHT
+    for a, b in zip(title_tokens, title_tokens[1:]):
+        counts[f"{a}_{b}"] += BIGRAM_WEIGHT
+    if category:
+        for key in category_keys(category):
+            counts[f"c:{key}"] += CATEGORY_WEIGHT
+    for t in _tokens(description)[:MAX_DESCRIPTION_TOKENS]:
+        counts[t] += DESCRIPTION_WEIGHT
+    buckets: Dict[int, float] = {}
+    for feature, weight in counts.items():
+        b = _bucket(feature)
+        buckets[b] = buckets.get(b, 0.0) + weight
+    return {b: 1.0 + math.log(w) if w > 1.0 else w for b, w in buckets.items()}
+
+
+def run_off_hub(fn: Callable, *args):
+    """fn(*args) in a real OS thread (eventlet.tpool) when eventlet has monkey patched threading, else inline."""
+    try:
+        from eventlet import patcher, tpool
+    except Exception:
+        return fn(*args)
+    if patcher.is_monkey_patched('thread'):
+        return tpool.execute(fn, *args)
+    return fn(*args)
+
+
+def weighted_quantiles(values: np.ndarray, weights: np.ndarray, qs: Tuple[float, ...]) -> np.ndarray:
+    order = np.argsort(values)
+    values, weights = values[order], weights[order]
+    positions = (np.cumsum(weights) - weights / 2) / weights.sum()
+    return np.interp(qs, positions, values)
+
+
+class PriceEstimator:
+    """A TF-IDF kNN model over one marketplace's listings. Immutable once built."""
+
+    def __init__(self, docs: Iterable[Tuple[Any, Any, Any, Any]]):
+        """docs: (title, category, description, price) tuples; unpriced ones are skipped."""
+        doc_ids, buckets, values, prices = [], [], [], []
+        for title, category, description, price in docs:
+            price = parse_price(price)
+            if price is None or price < 0:
+                continue
+            feats = features(title, category, description)
+            if not feats:
+                continue
+            doc = len(prices)
+            prices.append(price)
+            doc_ids.extend([doc] * len(feats))
+            buckets.extend(feats.keys())
+            values.extend(feats.values())
+        self.size = len(prices)
+        self.prices = np.asarray(prices, dtype=np.float32)
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        buckets = np.asarray(buckets, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32)
+
+        df = np.bincount(buckets, minlength=HASH_BUCKETS) if len(buckets) else np.zeros(HASH_BUCKETS)
+        self.idf = (np.log((1.0 + self.size) / (1.0 + df)) + 1.0).astype(np.float32)
+        values *= self.idf[buckets]
+        norms = np.sqrt(np.bincount(doc_ids, weights=values ** 2, minlength=self.size)).astype(np.float32)
+        values /= norms[doc_ids]
+
+        order = np.argsort(buckets, kind='stable')
+        self._post_buckets = buckets[order]
+        self._post_docs = doc_ids[order]
+        self._post_values = values[order]
+
+    def similarities(self, title: Any, category: Any, description: Any) -> np.ndarray:
+        """Cosine similarity of the query to every listing."""
+        feats = features(title, category, description)
+        if not feats or not self.size:
+            return np.zeros(self.size, dtype=np.float32)
+        q_buckets = np.fromiter(feats.keys(), dtype=np.int64, count=len(feats))
+        q_values = np.fromiter(feats.values(), dtype=np.float32, count=len(feats)) * self.idf[q_buckets]
+        q_values /= np.linalg.norm(q_values)
+        starts = np.searchsorted(self._post_buckets, q_buckets, side='left')
+        ends = np.searchsorted(self._post_buckets, q_buckets, side='right')
+        lengths = ends - starts
+        if not lengths.sum():
+            return np.zeros(self.size, dtype=np.float32)
+        postings = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends) if e > s])
+        weights = self._post_values[postings] * np.repeat(q_values, lengths)
+        return np.bincount(self._post_docs[postings], weights=weights, minlength=self.size)
+
+    def estimate(self, title: Any, category: Any, description: Any, k: int = K_NEIGHBORS) -> Optional[Dict[str, Any]]:
+        """
+        {"minPrice", "maxPrice", "estimate", "confidence", "neighbors"} from the similarity-weighted 25th-75th
+        percentiles of the k nearest listings' prices, or None when too few listings are similar enough.
+        """
+        scores = self.similarities(title, category, description)
+        if not self.size:
+            return None
+        k = min(k, self.size)
+        nearest = np.argpartition(-scores, k - 1)[:k]
+        nearest = nearest[scores[nearest] >= MIN_SIMILARITY]
+        if len(nearest) < MIN_NEIGHBORS:
+            return None
+        sims = scores[nearest].astype(np.float64)
+        low, mid, high = weighted_quantiles(self.prices[nearest].astype(np.float64), sims, (0.25, 0.5, 0.75))
+        agreement = 1.0 / (1.0 + (high - low) / max(mid, 1.0))  # 1 when the neighbours agree on a price
+        return {
+            "minPrice": int(math.floor(low)),
+            "maxPrice": int(math.ceil(high)),
+            "estimate": round(float(mid), 2),
+            "confidence": round(float(sims.mean() * agreement), 3),
+            "neighbors": int(len(nearest)),
+        }
+
+
+class EstimatorManager:
+    """
+    One PriceEstimator per marketplace, trained in a background thread from `load(marketplace_id)`
+    (an iterable of (title, category, description, price)) on first use and again every retrain_seconds.
+    Until a marketplace's first model is ready, get() returns None and callers use the LLM.
+    """
+
+    def __init__(self, retrain_seconds: float = RETRAIN_SECONDS, enabled: Optional[bool] = None,
+                 clock: Callable[[], float] = time.time):
+        if enabled is None:
+            enabled = os.environ.get('REUSEU_PRICE_ESTIMATOR', '1') != '0'
+        self.enabled = enabled
+        self.retrain_seconds = retrain_seconds
+        self._clock = clock
+        self._models: Dict[str, Tuple[Optional[PriceEstimator], float]] = {}  # mp -> (model, trained_at)
+        self._training = set()
+        self._lock = threading.Lock()
+
+    def get(self, marketplace_id: str, load: Callable[[str], Iterable]) -> Optional[PriceEstimator]:
+        if not self.enabled:
+            return None
+        model, trained_at = self._models.get(marketplace_id, (None, None))
+        if trained_at is None or self._clock() - trained_at >= self.retrain_seconds:
+            with self._lock:
+                start = marketplace_id not in self._training
+                self._training.add(marketplace_id)
+            if start:
+                threading.Thread(target=self.train, args=(marketplace_id, load), daemon=True,
+                                 name=f"price-estimator-{marketplace_id}").start()
+        return model
+
+    def train(self, marketplace_id: str, load: Callable[[str], Iterable]) -> Optional[PriceEstimator]:
+        """Build the marketplace's model now. Too little data leaves it without one (the LLM answers)."""
+        started = time.perf_counter()
+        try:
+            docs = list(load(marketplace_id))  # I/O: stays on this thread, where it yields to the hub
+            model = run_off_hub(PriceEstimator, docs)
+            if model.size < MIN_TRAINING_DOCS:
+                model = None
+            self._models[marketplace_id] = (model, self._clock())
+            logger.info(f"Trained price estimator for {marketplace_id} on {model.size if model else 0} listings "
+                        f"in {time.perf_counter() - started:.2f}s")
+            return model
+        except Exception as e:
+            logger.error(f"Failed to train price estimator for {marketplace_id}: {e}", exc_info=True)
+            previous = self._models.get(marketplace_id, (None, None))[0]
+            self._models[marketplace_id] = (previous, self._clock() - self.retrain_seconds + RETRY_SECONDS)
+            return None
+        finally:
+            with self._lock:
+                self._training.discard(marketplace_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        now = self._clock()
+        return {mp: {"listings": model.size if model else 0, "age_seconds": round(now - trained_at, 1)}
+                for mp, (model, trained_at) in list(self._models.items())}
+
+
+class PathMetrics:
+    """How often each answer path is taken and how long it takes (percentiles over the last `window` calls)."""
+
+    def __init__(self, window: int = 500):
+        self._window = window
+        self._paths: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, path: str, seconds: float):
+        with self._lock:
+            entry = self._paths.get(path)
+            if entry is None:
+                entry = self._paths[path] = {"count": 0, "total": 0.0, "recent": deque(maxlen=self._window)}
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["recent"].append(seconds)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            paths = {name: (e["count"], e["total"], np.array(e["recent"])) for name, e in self._paths.items()}
+        total = sum(count for count, _, _ in paths.values())
+        result = {}
+        for name, (count, seconds, recent) in paths.items():
+            p50, p95 = np.percentile(recent, (50, 95)) if len(recent) else (0.0, 0.0)
+            result[name] = {
+                "count": count,
+                "share": round(count / total, 3) if total else 0.0,
+                "avg_ms": round(seconds / count * 1000, 1) if count else None,
+                "p50_ms": round(float(p50) * 1000, 1),
+                "p95_ms": round(float(p95) * 1000, 1),
+            }
+        return result
+
+
+estimator_manager = EstimatorManager()
+price_fill_metrics = PathMetrics()
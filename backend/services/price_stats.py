@@ -0,0 +1,362 @@
+# services/price_stats.py
+# Per-marketplace, per-category price statistics held in NumPy buffers.
+#
+# A listing counts in each of its Category tags once its images are ready (as in the list views;
+# listings still processing are tracked and enter the statistics when they turn ready). Each
+# category keeps the asking prices of its available listings (one float32 slot per listing, removed by swapping the last slot in) and a
+# ring of its most recent sale prices with their times.
+# A marketplace is loaded once from a full read and then kept current by ListingService and
+# TransactionService calling listing_written() / sale_recorded() on every write, so a stats request
+# is a handful of vectorised passes over one category's prices instead of a scan of every listing.
+# Writes from other processes are picked up when the marketplace is reloaded (every REFRESH_SECONDS).
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .listing_record import parse_price
+from .versions import versions
+
+logger = logging.getLogger(__name__)
+
+# SellStatus of a sold listing (listing_service.SELL_STATUS_SOLD; not imported to avoid a cycle)
+SOLD = 0
+
+# ImageStatus of a listing shown in list views (listing_service.IMAGE_STATUS_READY); legacy listings have none
+READY = 'ready'
+
+# Sales kept per category for the sold percentiles and the trend
+MAX_SALES = 4096
+
+# Reload a marketplace from RTDB after this long, to pick up writes made by other processes
+REFRESH_SECONDS = 600.0
+
+PERCENTILES = (10, 25, 50, 75, 90)
+HISTOGRAM_BINS = 10
+
+# Trend: median sale price per week over the last TREND_WEEKS weeks
+TREND_WEEKS = 8
+WEEK_SECONDS = 7 * 24 * 3600
+
+UNCATEGORIZED = 'uncategorized'
+
+# Version key of the whole marketplace (the category list)
+ALL = '*'
+
+
+def category_key(category: Any) -> str:
+    """Normalised category name: 'Furniture ' and 'furniture' share statistics."""
+    key = str(category).strip().lower() if category is not None else ''
+    return key or UNCATEGORIZED
+
+
+def category_keys(category: Any) -> Tuple[str, ...]:
+    """Keys of a listing's Category, which is a list of tags (a dict once RTDB has keyed it) or a single string."""
+    if isinstance(category, dict):
+        category = list(category.values())
+    if not isinstance(category, (list, tuple)):
+        category = [category]
+    keys = tuple(dict.fromkeys(category_key(c) for c in category if c is not None))
+    return keys or (UNCATEGORIZED,)
+
+
+class ActivePrices:
+    """Asking prices of available listings: a growable float32 buffer with an id -> slot map."""
+
+    def __init__(self, capacity: int = 16):
+        self._values = np.empty(capacity, dtype=np.float32)
+        self._ids: List[str] = []
+        self._slots: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def set(self, listing_id: str, price: float):
+        slot = self._slots.get(listing_id)
+        if slot is None:
+            slot = len(self._ids)
+            if slot == len(self._values):
+                self._values = np.concatenate([self._values, np.empty(len(self._values), dtype=np.float32)])
+            self._ids.append(listing_id)
+            self._slots[listing_id] = slot
+        self._values[slot] = price
+
+    def remove(self, listing_id: str):
+        slot = self._slots.pop(listing_id, None)
+        if slot is None:
+            return
+        last = len(self._ids) - 1
+        if slot != last:  # move the last listing into the freed slot
+            moved = self._ids[last]
+            self._values[slot] = self._values[last]
+            self._ids[slot] = moved
+            self._slots[moved] = slot
+        self._ids.pop()
+
+    def values(self) -> np.ndarray:
+        return self._values[:len(self._ids)]
+
+
+class SalePrices:
+    """
+    The last `capacity` sales: prices (float32) and completion times (float64 epoch seconds) in a ring.
+    The buffers start small and double until they reach capacity, then the oldest sale is overwritten.
+    """
+
+    def __init__(self, capacity: int = MAX_SALES, initial: int = 16):
+        self.capacity = capacity
+        size = min(initial, capacity)
+        self._prices = np.empty(size, dtype=np.float32)
+        self._times = np.empty(size, dtype=np.float64)
+        self._ids: List[Optional[str]] = [None] * size
+        self._seen = set()
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, transaction_id: str, price: float, at: float):
+        if transaction_id in self._seen:
+            return
+        size = len(self._prices)
+        if self._count == size and size < self.capacity:  # full but not wrapped yet: grow
+            grow = min(size, self.capacity - size)
+            self._prices = np.concatenate([self._prices, np.empty(grow, dtype=np.float32)])
+            self._times = np.concatenate([self._times, np.empty(grow, dtype=np.float64)])
+            self._ids.extend([None] * grow)
+            self._next = size
+            size += grow
+        slot = self._next
+        evicted = self._ids[slot]
+        if evicted is not None:
+            self._seen.discard(evicted)
+        self._prices[slot] = price
+        self._times[slot] = at
+        self._ids[slot] = transaction_id
+        self._seen.add(transaction_id)
+        self._next = (slot + 1) % size
+        self._count = min(self._count + 1, size)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self._prices[:self._count], self._times[:self._count]
+
+
+class CategoryPrices:
+    def __init__(self):
+        self.active = ActivePrices()
+        self.sales = SalePrices()
+
+
+def summarize(values: np.ndarray) -> Dict[str, Any]:
+    """Count, min/max/mean, percentiles and a histogram of a price array."""
+    if len(values) == 0:
+        return {"count": 0}
+    points = np.percentile(values, (2, 98) + PERCENTILES)
+    # Bin between the 2nd and 98th percentiles so one mispriced listing doesn't squash every bin;
+    # prices outside fall into the end bins
+    low, high = float(points[0]), float(points[1])
+    if high <= low:
+        high = low + 1.0
+    counts, edges = np.histogram(np.clip(values, low, high), bins=HISTOGRAM_BINS, range=(low, high))
+    return {
+        "count": int(len(values)),
+        "min": round(float(values.min()), 2),
+        "max": round(float(values.max()), 2),
+        "mean": round(float(values.mean()), 2),
+        "percentiles": {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, points[2:])},
+        "histogram": {"edges": [round(float(e), 2) for e in edges], "counts": counts.tolist()},
+    }
+
+
+def trend(prices: np.ndarray, times: np.ndarray, now: float) -> Dict[str, Any]:
+    """Median sale price for each of the last TREND_WEEKS weeks (oldest first) and the weekly slope of a fit."""
+    week = np.floor((now - times) / WEEK_SECONDS).astype(np.int64)  # 0 = the last seven days
+    recent = (week >= 0) & (week < TREND_WEEKS)
+    weeks = []
+    for w in range(TREND_WEEKS - 1, -1, -1):
+        in_week = prices[recent & (week == w)]
+        weeks.append({
+            "weeksAgo": w,
+            "count": int(len(in_week)),
+            "median": round(float(np.median(in_week)), 2) if len(in_week) else None,
+        })
+    slope = None
+    if np.count_nonzero(recent) >= 2 and len(np.unique(times[recent])) >= 2:
+        slope = float(np.polyfit(times[recent] / WEEK_SECONDS, prices[recent].astype(np.float64), 1)[0])
+    return {"weeks": weeks, "slopePerWeek": round(slope, 2) if slope is not None else None}
+
+
+class MarketplacePrices:
+    """All categories of one marketplace, plus what is needed to apply partial listing writes."""
+
+    def __init__(self):
+        self.categories: Dict[str, CategoryPrices] = {}
+        # id -> (category keys, price, SellStatus, ImageStatus)
+        self._listings: Dict[str, Tuple[Tuple[str, ...], Optional[float], Any, Any]] = {}
+        self.loaded_at = time.time()
+
+    def _category(self, key: str) -> CategoryPrices:
+        prices = self.categories.get(key)
+        if prices is None:
+            prices = self.categories[key] = CategoryPrices()
+        return prices
+
+    def apply_listing(self, event_type: str, listing_id: str, data: Any) -> List[str]:
+        """Apply a listing 'put' (None deletes) or 'patch'. Returns the category keys that changed."""
+        previous = self._listings.get(listing_id)
+        if event_type == 'patch':
+            if previous is None or not isinstance(data, dict):
+                return []
+            keys = category_keys(data['Category']) if 'Category' in data else previous[0]
+            price = parse_price(data['Price']) if 'Price' in data else previous[1]
+            status = data['SellStatus'] if 'SellStatus' in data else previous[2]
+            images = data['ImageStatus'] if 'ImageStatus' in data else previous[3]
+        elif isinstance(data, dict):
+            keys, price, status = category_keys(data.get('Category')), parse_price(data.get('Price')), data.get('SellStatus')
+            images = data.get('ImageStatus')
+        else:
+            keys = price = status = images = None
+
+        changed = []
+        if previous is not None:
+            for key in previous[0]:
+                self._category(key).active.remove(listing_id)
+                changed.append(key)
+        if keys is None:
+            self._listings.pop(listing_id, None)
+            return changed
+        self._listings[listing_id] = (keys, price, status, images)
+        if price is not None and price >= 0 and status != SOLD and (images or READY) == READY:
+            for key in keys:
+                self._category(key).active.set(listing_id, price)
+                if key not in changed:
+                    changed.append(key)
+        return changed
+
+    def apply_sale(self, transaction_id: str, category: Any, price: Any, at: float) -> List[str]:
+        price = parse_price(price)
+        if price is None or price < 0:
+            return []
+        keys = category_keys(category)
+        for key in keys:
+            self._category(key).sales.add(transaction_id, price, at)
+        return list(keys)
+
+
+class PriceStats:
+    """
+    Marketplace price statistics, loaded on first use with `load(marketplace_id)`, which returns
+    (listings, sales): iterables of (listing_id, listing_dict) and (transaction_id, category, price, epoch_seconds).
+    """
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS, clock: Callable[[], float] = time.time):
+        self.refresh_seconds = refresh_seconds
+        self._clock = clock
+        self._markets: Dict[str, MarketplacePrices] = {}
+        self._loading: Dict[str, List[Tuple]] = {}  # writes seen while a marketplace loads, replayed after
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def listing_written(self, marketplace_id: str, event_type: str, listing_id: str, data: Any):
+        """Apply a listing write. Marketplaces that haven't been loaded are skipped: their load reads it."""
+        self._apply(marketplace_id, ('listing', event_type, listing_id, data))
+
+    def sale_recorded(self, marketplace_id: str, transaction_id: str, category: Any, price: Any,
+                      at: Optional[float] = None):
+        self._apply(marketplace_id, ('sale', transaction_id, category, price, at if at is not None else self._clock()))
+
+    def _apply(self, marketplace_id: str, op: Tuple):
+        with self._lock:
+            pending = self._loading.get(marketplace_id)
+            if pending is not None:
+                pending.append(op)
+            market = self._markets.get(marketplace_id)
+            if market is not None:
+                self._apply_op(marketplace_id, market, op)
+
+    def _apply_op(self, marketplace_id: str, market: MarketplacePrices, op: Tuple):
+        changed = market.apply_listing(*op[1:]) if op[0] == 'listing' else market.apply_sale(*op[1:])
+        for key in changed:
+            versions.bump('price_stats', marketplace_id, key)
+        if changed:
+            versions.bump('price_stats', marketplace_id, ALL)
+
+    def ensure_loaded(self, marketplace_id: str, load: Callable[[str], Tuple[Iterable, Iterable]]):
+        """
+        Load the marketplace if it hasn't been, or reload it if it is older than refresh_seconds. Callers
+        wait for a first load; while a stale copy is being reloaded they keep using the stale copy.
+        """
+        if self._is_fresh(marketplace_id):
+            return
+        with self._lock:
+            load_lock = self._load_locks.setdefault(marketplace_id, threading.Lock())
+            has_copy = marketplace_id in self._markets
+        if not load_lock.acquire(blocking=not has_copy):
+            return
+        try:
+            if self._is_fresh(marketplace_id):
+                return  # loaded by the caller we waited for
+            with self._lock:
+                self._loading[marketplace_id] = []
+            started = time.perf_counter()
+            market = MarketplacePrices()
+            market.loaded_at = self._clock()
+            listings, sales = load(marketplace_id)
+            for listing_id, data in listings:
+                market.apply_listing('put', listing_id, data)
+            for sale in sales:
+                market.apply_sale(*sale)
+            with self._lock:
+                for op in self._loading.pop(marketplace_id):  # writes that raced the read; all are idempotent
+                    self._apply_op(marketplace_id, market, op)
+                self._markets[marketplace_id] = market
+                for key in list(market.categories) + [ALL]:
+                    versions.bump('price_stats', marketplace_id, key)
+            logger.info(f"Loaded price stats for {marketplace_id}: {len(market.categories)} categories "
+                        f"in {time.perf_counter() - started:.2f}s")
+        finally:
+            with self._lock:
+                self._loading.pop(marketplace_id, None)
+            load_lock.release()
+
+    def _is_fresh(self, marketplace_id: str) -> bool:
+        market = self._markets.get(marketplace_id)
+        return market is not None and self._clock() - market.loaded_at < self.refresh_seconds
+
+    def etag(self, marketplace_id: str, category: str) -> str:
+        return versions.etag(('price_stats', marketplace_id, category_key(category)))
+
+    def categories(self, marketplace_id: str) -> Dict[str, int]:
+        """{category key: available listing count}"""
+        with self._lock:
+            market = self._markets.get(marketplace_id)
+            if market is None:
+                return {}
+            return {key: len(prices.active) for key, prices in sorted(market.categories.items())}
+
+    def summary(self, marketplace_id: str, category: str) -> Dict[str, Any]:
+        """Statistics of one category: "active" asking prices, "sold" prices and the weekly sale "trend"."""
+        key = category_key(category)
+        with self._lock:  # copy out under the lock; the NumPy work runs outside it
+            market = self._markets.get(marketplace_id)
+            prices = market.categories.get(key) if market is not None else None
+            active = prices.active.values().copy() if prices else np.empty(0, dtype=np.float32)
+            sold, sold_at = [a.copy() for a in prices.sales.arrays()] if prices else (np.empty(0), np.empty(0))
+        return {
+            "category": key,
+            "active": summarize(active),
+            "sold": summarize(sold),
+            "trend": trend(sold, sold_at, self._clock()),
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {mp: {"categories": len(m.categories), "age_seconds": round(self._clock() - m.loaded_at, 1)}
+                    for mp, m in self._markets.items()}
+
+
+price_stats = PriceStats()
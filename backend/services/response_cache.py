@@ -0,0 +1,146 @@
+# services/response_cache.py
+# In-memory cache of pre-serialized, pre-compressed JSON responses.
+#
+# GET /api/listings keeps one entry per (marketplace, query shape) holding the JSON bytes
+# plus gzip and brotli encodings of them, so a hot page load is a dict lookup and a socket
+# write. ListingService invalidates a marketplace's entries on every listing write; each
+# entry also carries the generation of the listing replica it was built from, so changes
+# made by other instances (seen on the replica stream) invalidate it too. Entries expire
+# after REUSEU_LISTINGS_CACHE_TTL seconds (default 600), well inside the one hour life
+# of the presigned image URLs they contain. REUSEU_LISTINGS_CACHE=0 turns the cache off.
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 600
+DEFAULT_MAX_ENTRIES = 256
+
+
+class EncodedResponse:
+    """One serialized body and its compressed variants. Immutable once built."""
+    __slots__ = ('identity', 'gzip', 'br', 'etag', 'generation', 'created_at')
+
+    def __init__(self, body: bytes, generation: Any = None):
+        self.identity = body
+        self.gzip = gzip.compress(body, compresslevel=6)
+        self.br = brotli.compress(body, quality=5) if brotli is not None else None
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.generation = generation
+        self.created_at = time.time()
+
+    @classmethod
+    def from_data(cls, data: Any, generation: Any = None) -> 'EncodedResponse':
+        body = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        return cls(body, generation)
+
+    def negotiate(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        """(body, Content-Encoding) for an Accept-Encoding header; brotli preferred, then gzip."""
+        content_encoding = choose_encoding(accept_encoding)
+        return self.body_for(content_encoding), content_encoding
+
+    def body_for(self, content_encoding: Optional[str]) -> bytes:
+        if content_encoding == 'br' and self.br is not None:
+            return self.br
+        if content_encoding == 'gzip':
+            return self.gzip
+        return self.identity
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Content-Encoding to use for an Accept-Encoding header ('br', 'gzip' or None for identity)."""
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES, enabled: bool = True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: 'OrderedDict[Tuple[str, Hashable], EncodedResponse]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, marketplace_id: str, shape: Hashable, generation: Any = None) -> Optional[EncodedResponse]:
+        key = (marketplace_id, shape)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.generation != generation or time.time() - entry.created_at > self.ttl):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, marketplace_id: str, shape: Hashable, entry: EncodedResponse):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[(marketplace_id, shape)] = entry
+            self._entries.move_to_end((marketplace_id, shape))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, marketplace_id: str, shape: Hashable, builder: Callable[[], Any],
+                     generation: Any = None) -> EncodedResponse:
+        """Cached entry, or serialize and compress builder()'s result and cache it."""
+        entry = self.get(marketplace_id, shape, generation) if self.enabled else None
+        if entry is None:
+            entry = EncodedResponse.from_data(builder(), generation)
+            self.put(marketplace_id, shape, entry)
+        return entry
+
+    def invalidate(self, marketplace_id: str):
+        """Drop every cached shape for a marketplace."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == marketplace_id]:
+                del self._entries[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "brotli": brotli is not None}
+
+
+listings_response_cache = ResponseCache(
+    ttl=float(os.environ.get("REUSEU_LISTINGS_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+    enabled=os.environ.get("REUSEU_LISTINGS_CACHE", "1") != "0",
+)
@@ -1,8 +1,14 @@
 import firebase_admin
 from firebase_admin import credentials, db
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
+from .account_service import account_service, increment
 from .exceptions import ServiceError, NotFoundError, ValidationError, DatabaseError
-from .listing_service import get_listing
+from .fanout import fan_out
+from .listing_service import listing_service
+from .versions import versions
+
+# Star ratings a review can give
+STARS = range(1, 6)
 
 def get_db_root():
     """Get the root of the Firebase database."""
@@ -19,33 +25,51 @@ class ReviewService:
     def __init__(self, db_ref=None):
         """Initialize ReviewService with optional database reference for testability."""
         self.ref = db_ref or get_db_root()
+        self._indexes_complete = False # Set once migrate_seller_reviews.py has run; never cleared
 
-    def add_review(self, review_data: Dict[str, Any]) -> str:
-        """Add a review for a listing. Returns the ListingID."""
+    def add_review(self, review_data: Dict[str, Any], marketplace_id: Optional[str] = None) -> str:
+        """
+        Add (or replace) the review for a listing. Returns the ListingID.
+        The reviewer must exist and the listing must belong to SellerID. marketplace_id is the listing's
+        marketplace; without it the seller's is used.
+        The review is swapped in with a transaction, and its SellerReviews index entry and the seller's
+        SellerRating counters are then moved by the difference from the review the transaction replaced, so
+        concurrent submissions for one listing are each counted against the review they actually overwrote.
+        If that follow-up update fails the aggregates drift until migrate_seller_reviews.py rebuilds them.
+        """
         required = ['ListingID', 'Rating', 'Review', 'ReviewDate', 'ReviewerID', 'SellerID']
         for field in required:
             if field not in review_data:
                 raise ValidationError(f"Missing field '{field}' in review_data.")
         listing_id = str(review_data['ListingID'])
+        if _stars(review_data) is None:
+            raise ValidationError("Rating must be a whole number from 1 to 5.")
+        self._verify_review_refs(listing_id, str(review_data['SellerID']), str(review_data['ReviewerID']),
+                                 marketplace_id)
         try:
-            get_listing(listing_id)
-        except NotFoundError:
-            raise NotFoundError(f"Listing {listing_id} not found.")
-        except ServiceError as e:
-            raise DatabaseError(f"Failed to verify listing: {e}")
-        try:
-            self.ref.child('Review').child(listing_id).set(review_data)
+            old = self._swap_review(listing_id, review_data)
+            seller_id = str(review_data['SellerID'])
+            updates = {f"SellerReviews/{seller_id}/{listing_id}": str(review_data['ReviewDate'])}
+            if isinstance(old, dict) and str(old.get('SellerID')) != seller_id:
+                updates[f"SellerReviews/{old.get('SellerID')}/{listing_id}"] = None
+            updates.update(_rating_updates(old if isinstance(old, dict) else None, review_data))
+            self.ref.update(updates)
+            self._bump(old, review_data)
             return listing_id
         except Exception as e:
             raise DatabaseError(f"Failed to add review: {e}")
 
     def del_review(self, listing_id: str) -> None:
-        """Delete a review by its ListingID."""
+        """Delete a review by its ListingID, along with its index entry and its share of the seller's rating."""
         try:
-            review_ref = self.ref.child('Review').child(str(listing_id))
-            if not review_ref.get():
+            listing_id = str(listing_id)
+            review = self._swap_review(listing_id, None)
+            if not isinstance(review, dict):
                 raise NotFoundError(f"Review for listing {listing_id} not found.")
-            review_ref.delete()
+            updates = {f"SellerReviews/{review.get('SellerID')}/{listing_id}": None}
+            updates.update(_rating_updates(review, None))
+            self.ref.update(updates)
+            self._bump(review, None)
         except ServiceError:
             raise
         except Exception as e:
@@ -75,9 +99,160 @@ class ReviewService:
         except Exception as e:
             raise DatabaseError(f"Failed to get all reviews: {e}")
 
+    def get_seller_reviews(self, seller_id: str, limit: Optional[int] = None,
+                           after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Reviews of a seller, newest first, and the cursor for the next page (None on the last page).
+        Pass a page's cursor as `after`. Only the page's reviews are read, concurrently.
+        """
+        seller_id = str(seller_id)
+        try:
+            if self._indexes_ready():
+                dates = self.ref.child('SellerReviews').child(seller_id).get() or {}
+                order = sorted(dates, key=lambda k: (str(dates[k]), k), reverse=True)
+                page, next_cursor = _page(order, limit, after)
+                results = fan_out({k: (lambda k=k: self.ref.child('Review').child(k).get()) for k in page})
+                for outcome in results.values():
+                    if not outcome.ok:
+                        raise outcome.error
+                reviews = [results[k].value for k in page if results[k].value]
+                return reviews, next_cursor
+            # Until migrate_seller_reviews.py has run, query (or scan) Review for the seller
+            found = self._scan_seller_reviews(seller_id)
+            order = sorted(found, key=lambda k: (str(found[k].get('ReviewDate', '')), k), reverse=True)
+            page, next_cursor = _page(order, limit, after)
+            return [found[k] for k in page], next_cursor
+        except ServiceError:
+            raise
+        except Exception as e:
+            raise DatabaseError(f"Failed to get reviews for seller {seller_id}: {e}")
+
+    def rating_etag(self, seller_id: str) -> str:
+        """ETag for get_seller_rating(); changes when a review of the seller is added or deleted."""
+        return versions.etag(('reviews', str(seller_id)))
+
+    def get_seller_rating(self, seller_id: str) -> Dict[str, Any]:
+        """Rating summary for a seller: review count, average rating and a 1-5 star histogram. One small read."""
+        seller_id = str(seller_id)
+        try:
+            if self._indexes_ready():
+                rating = self.ref.child('SellerRating').child(seller_id).get() or {}
+                count = rating.get('Count', 0) or 0
+                total = rating.get('Sum', 0) or 0
+                stored = rating.get('Histogram') or {}
+                if isinstance(stored, list): # RTDB returns small integer-keyed maps as lists
+                    stored = {str(i): v for i, v in enumerate(stored) if v is not None}
+                histogram = {str(star): stored.get(str(star), 0) or 0 for star in STARS}
+            else:
+                histogram = {str(star): 0 for star in STARS}
+                for review in self._scan_seller_reviews(seller_id).values():
+                    star = _stars(review)
+                    if star is not None:
+                        histogram[str(star)] += 1
+                count = sum(histogram.values())
+                total = sum(star * histogram[str(star)] for star in STARS)
+        except Exception as e:
+            raise DatabaseError(f"Failed to get rating for seller {seller_id}: {e}")
+        return {"SellerID": seller_id, "Count": count,
+                "Average": round(total / count, 2) if count else None, "Histogram": histogram}
+
+    def _scan_seller_reviews(self, seller_id: str) -> Dict[str, Dict[str, Any]]:
+        reviews_ref = self.ref.child('Review')
+        try: # Needs .indexOn SellerID; fall back to scanning every review without it
+            reviews = reviews_ref.order_by_child('SellerID').equal_to(seller_id).get() or {}
+        except Exception:
+            reviews = reviews_ref.get() or {}
+        if isinstance(reviews, list):
+            reviews = {str(i): r for i, r in enumerate(reviews)}
+        return {str(k): r for k, r in reviews.items() if isinstance(r, dict) and str(r.get('SellerID')) == seller_id}
+
+    def _verify_review_refs(self, listing_id: str, seller_id: str, reviewer_id: str, marketplace_id: Optional[str]):
+        """Probe (concurrently, reading single fields) that the reviewer exists and the listing is the seller's."""
+        try:
+            if not marketplace_id:
+                marketplace_id = account_service.get_account_marketplace(seller_id)
+                if not marketplace_id:
+                    raise NotFoundError(f"Account {seller_id} not found.")
+            probes = fan_out({
+                'reviewer': lambda: account_service.account_exists(reviewer_id),
+                'owner': lambda: listing_service.get_listing_owner(marketplace_id, listing_id),
+            })
+            for outcome in probes.values():
+                if not outcome.ok:
+                    raise outcome.error
+        except NotFoundError:
+            raise
+        except ServiceError as e:
+            raise DatabaseError(f"Failed to verify listing: {e}")
+        if not probes['reviewer'].value:
+            raise NotFoundError(f"Account {reviewer_id} not found.")
+        owner = probes['owner'].value
+        if owner is None:
+            raise NotFoundError(f"Listing {listing_id} not found.")
+        if str(owner) != seller_id:
+            raise ValidationError(f"Listing {listing_id} does not belong to seller {seller_id}.")
+
+    def _swap_review(self, listing_id: str, review: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Replace (or with None, delete) Review/{listing_id} in a transaction and return the value it replaced.
+        The transaction function reruns on contention; the value seen by the committed attempt is returned.
+        """
+        replaced = {}
+
+        def swap(current):
+            replaced['value'] = current
+            return review
+
+        self.ref.child('Review').child(listing_id).transaction(swap)
+        return replaced.get('value')
+
+    def _indexes_ready(self) -> bool:
+        """True once migrate_seller_reviews.py has backfilled SellerReviews and SellerRating."""
+        if not self._indexes_complete:
+            self._indexes_complete = bool(self.ref.child('SellerReviewsMeta').child('Complete').get())
+        return self._indexes_complete
+
+    def _bump(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]):
+        for review in (old, new):
+            if isinstance(review, dict):
+                versions.bump('reviews', str(review.get('SellerID')))
+
+
+def _stars(review: Optional[Dict[str, Any]]) -> Optional[int]:
+    """A review's Rating as a whole number of stars, or None if it isn't one of 1-5."""
+    try:
+        rating = float(review.get('Rating'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+    return int(rating) if rating.is_integer() and int(rating) in STARS else None
+
+
+def _rating_updates(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Multi-path SellerRating increments that take the counters from reflecting `old` to reflecting `new`."""
+    deltas: Dict[str, int] = {}
+    for review, sign in ((old, -1), (new, 1)):
+        star = _stars(review)
+        if star is None:
+            continue
+        base = f"SellerRating/{review.get('SellerID')}"
+        for path, amount in ((f"{base}/Count", 1), (f"{base}/Sum", star), (f"{base}/Histogram/{star}", 1)):
+            deltas[path] = deltas.get(path, 0) + sign * amount
+    return {path: increment(delta) for path, delta in deltas.items() if delta}
+
+
+def _page(keys: List[str], limit: Optional[int], after: Optional[str]) -> Tuple[List[str], Optional[str]]:
+    if after:
+        keys = keys[keys.index(after) + 1:] if after in keys else []
+    if limit is None or len(keys) <= limit:
+        return keys, None
+    return keys[:limit], keys[limit - 1]
+
 # Default instance
 review_service = ReviewService()
 add_review = review_service.add_review
 del_review = review_service.del_review
 get_review = review_service.get_review
 get_all_reviews = review_service.get_all_reviews
+get_seller_rating = review_service.get_seller_rating
+get_seller_reviews = review_service.get_seller_reviews
+rating_etag = review_service.rating_etag
@@ -0,0 +1,51 @@
+# services/stats_service.py
+# Marketplace statistics served from the in-memory price_stats buffers, loaded from RTDB on first use.
+
+import logging
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .exceptions import DatabaseError
+from .listing_service import listing_service
+from .price_stats import price_stats
+from .transaction_service import transaction_service
+
+logger = logging.getLogger(__name__)
+
+# What price_stats needs from each listing
+STATS_FIELDS = ['Category', 'Price', 'SellStatus', 'ImageStatus']
+
+
+class StatsService:
+    def _load(self, marketplace_id: str) -> Tuple[Iterable, Iterable]:
+        """
+        Every listing, including those whose images are still processing (price_stats counts them once they
+        are ready), from the replica or else ListingSummary pages, and every completed sale.
+        """
+        listings = ((item['ListingID'], item)
+                    for item in listing_service.iter_listings(marketplace_id, fields=STATS_FIELDS, include_pending=True))
+        return listings, transaction_service.get_completed_sales(marketplace_id)
+
+    def _ensure_loaded(self, marketplace_id: str):
+        try:
+            price_stats.ensure_loaded(marketplace_id, self._load)
+        except Exception as e:
+            logger.error(f"Failed to load price stats for marketplace {marketplace_id}: {e}", exc_info=True)
+            raise DatabaseError(f"Failed to load price statistics: {e}")
+
+    def price_stats_etag(self, marketplace_id: str, category: Optional[str]) -> str:
+        self._ensure_loaded(marketplace_id)
+        return price_stats.etag(marketplace_id, category or '*')
+
+    def get_price_stats(self, marketplace_id: str, category: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Price statistics of one category, or without a category the marketplace's categories with their
+        available listing counts.
+        """
+        self._ensure_loaded(marketplace_id)
+        if not category:
+            return {"categories": price_stats.categories(marketplace_id)}
+        return price_stats.summary(marketplace_id, category)
+
+
+stats_service = StatsService()
+get_price_stats = stats_service.get_price_stats
@@ -129,22 +129,24 @@ def load_dummy_transactions(listing_id_min,listing_id_max):
 
 
 # print all transaction content from the database
-def print_all_transactions():
-    transactions = ref.child('Transaction').get()
+def print_all_transactions(marketplace_id):
+    transactions = ref.child(marketplace_id).child('Transaction').get()
     if not transactions:
         print("no transactions found")
         return
-    for idx, transaction in enumerate(transactions, start=0):
+    for key, transaction in transactions.items():
         if transaction is not None:
-            print("transaction key: " + str(idx))
+            print("transaction key: " + str(key))
             for field, value in transaction.items():
                 print("  " + field + ": " + str(value))
             print("-" * 20)
 
-# delete all transactions in a certain listing id range
-def delete_transaction_range(min,max):
-    for i in range(min,max):
-        delete_transaction(i)
+# delete every transaction in a marketplace that was never completed
+def delete_open_transactions(marketplace_id):
+    transactions = ref.child(marketplace_id).child('Transaction').get() or {}
+    for key, transaction in transactions.items():
+        if transaction.get('Status') != 'completed':
+            delete_transaction(marketplace_id, key, transaction['BuyerID'])
 
 # **********MESSAGES**********
 '''
@@ -502,15 +504,15 @@ def intro_menu():
             pass
         elif user_input == "5":
             # Print all transactions
-            print_all_transactions()
+            marketplace_id = input("Enter marketplace id: ")
+            print_all_transactions(marketplace_id)
             exit_testing_program()
             pass
         elif user_input == "6":
-            # Delete n->m transactions
-            min_id = int(input("Enter min account id delete range for transactions: "))
-            max_id = int(input("Enter max account id delete range for transactions: "))
-            delete_transaction_range(min_id, max_id)
-            print(f"Listings ids {min_id} though {max_id} were deleted in the transaction table. Navigate to database to see additions.")
+            # Delete open transactions (completed sales can't be deleted)
+            marketplace_id = input("Enter marketplace id: ")
+            delete_open_transactions(marketplace_id)
+            print(f"Open transactions in {marketplace_id} were deleted. Navigate to database to see additions.")
             exit_testing_program()
         # ---Listings Testing---
         elif user_input == "7":
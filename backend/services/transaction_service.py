@@ -1,9 +1,29 @@
 import firebase_admin
 from firebase_admin import credentials, db
-from typing import Dict, Any, List
-from .exceptions import ServiceError, NotFoundError, ValidationError, DatabaseError
-from .account_service import get_acc
-from .listing_service import get_listing
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+from .exceptions import ServiceError, NotFoundError, ValidationError, DatabaseError, PermissionDeniedError, ConflictError
+from .account_service import account_service, increment, SERVER_TIMESTAMP
+from .chat_service import chat_service
+from .fanout import fan_out
+from .listing_record import parse_price
+from .listing_service import listing_service, SELL_STATUS_SOLD
+from .price_stats import price_stats
+from .versions import versions
+
+logger = logging.getLogger(__name__)
+
+# Transaction Status values
+STATUS_PENDING = 'pending'
+STATUS_COMPLETED = 'completed'
+STATUS_CANCELLED = 'cancelled'
+
+# Default and largest page size for transaction history
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# History index per role: /{marketplace}/{index}/{user_id}/{transaction_id}
+ROLE_INDEXES = {'buyer': 'BuyerTransactions', 'seller': 'SellerTransactions'}
 
 def get_db_root():
     """Get the root of the Firebase database."""
@@ -17,75 +37,317 @@ def get_db_root():
     return db.reference('/')
 
 class TransactionService:
+    """
+    Sales between a buyer and a listing's seller, kept per marketplace:
+
+        /{marketplace}/Transaction/{id}                   the transaction
+        /{marketplace}/BuyerTransactions/{uid}/{id}       history indexes (push ids sort by creation,
+        /{marketplace}/SellerTransactions/{uid}/{id}      so history pages are key-range queries)
+        /{marketplace}/SellerStats/{uid}                  Sold count and Revenue, kept by increments
+        /{marketplace}/ListingSale/{listing}              id of the transaction that sold the listing
+
+    Completing a transaction writes its status, the listing's SellStatus (with the listing's summary and
+    change feed), the seller's stats and a ListingSold flag on every chat about the listing in a single
+    multi-path update, so none of them can disagree.
+    """
+
     def __init__(self, db_ref=None):
         """Initialize TransactionService with optional database reference for testability."""
         self.ref = db_ref or get_db_root()
 
-    #Add a transaction when a listing gets resolved
-    def add_transaction(self, transaction_data: Dict[str, Any]) -> str:
-        """Add a transaction. Returns the ListingID."""
-        required = ['BuyerID', 'DateTransaction', 'ListingID', 'Price', 'SellerID']
-        for field in required:
-            if field not in transaction_data:
-                raise ValidationError(f"Missing field '{field}' in transaction_data.")
-        listing_id = str(transaction_data['ListingID'])
-        # validate referenced resources
-        try:
-            get_acc(str(transaction_data['BuyerID']))
-            get_acc(str(transaction_data['SellerID']))
-            get_listing(listing_id)
-        except NotFoundError as e:
-            raise e
-        except ServiceError as e:
-            raise DatabaseError(f"Failed to verify resources: {e}")
+    def _marketplace_ref(self, marketplace_id: str):
+        if not marketplace_id:
+            raise ValueError("marketplace_id cannot be empty")
+        return self.ref.child(marketplace_id)
+
+    def create_transaction(self, marketplace_id: str, user_id: str, transaction_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Start a sale of ListingID. The caller is the buyer, or the seller naming BuyerID. Price defaults to the
+        listing's. With Status 'completed' the sale is recorded and completed in one update (the seller only).
+        """
+        listing_id = str(transaction_data.get('ListingID') or '')
+        if not listing_id:
+            raise ValidationError("Missing field 'ListingID' in transaction_data.")
+        status = transaction_data.get('Status', STATUS_PENDING)
+        if status not in (STATUS_PENDING, STATUS_COMPLETED):
+            raise ValidationError(f"Status must be '{STATUS_PENDING}' or '{STATUS_COMPLETED}'.")
+
+        # Without BuyerID the caller is the buyer (a seller omitting it is rejected below)
+        buyer_id = str(transaction_data.get('BuyerID') or user_id)
+        probes = fan_out({
+            'listing': lambda: listing_service.probe_listing(marketplace_id, listing_id),
+            'buyer': lambda: account_service.account_exists(buyer_id),
+        })
+        for outcome in probes.values():
+            if not outcome.ok:
+                raise outcome.error
+        listing = probes['listing'].value
+        if listing is None:
+            raise NotFoundError(f"Listing {listing_id} not found.")
+        seller_id = str(listing['UserID'])
+        if transaction_data.get('SellerID') is not None and str(transaction_data['SellerID']) != seller_id:
+            raise ValidationError(f"Listing {listing_id} does not belong to seller {transaction_data['SellerID']}.")
+        if user_id not in (buyer_id, seller_id):
+            raise PermissionDeniedError("Only the buyer or the seller can start a transaction.")
+        if buyer_id == seller_id:
+            raise ValidationError("A seller cannot buy their own listing.")
+        if status == STATUS_COMPLETED and user_id != seller_id:
+            raise PermissionDeniedError("Only the seller can complete a transaction.")
+        if listing.get('SellStatus') == SELL_STATUS_SOLD:
+            raise ConflictError(f"Listing {listing_id} is already sold.")
+        if not probes['buyer'].value:
+            raise NotFoundError(f"Account {buyer_id} not found.")
+        price = parse_price(transaction_data.get('Price', listing.get('Price')))
+        if price is None or price < 0:
+            raise ValidationError("Price must be a non-negative number.")
+
         try:
-            self.ref.child('Transaction').child(listing_id).set(transaction_data)
-            return listing_id
+            transaction_id = self._marketplace_ref(marketplace_id).child('Transaction').push().key
+            transaction = {
+                'TransactionID': transaction_id,
+                'ListingID': listing_id,
+                'BuyerID': buyer_id,
+                'SellerID': seller_id,
+                'Price': price,
+                'Status': STATUS_PENDING,
+                'CreatedAt': SERVER_TIMESTAMP,
+            }
+            if listing.get('Category'):
+                transaction['Category'] = listing['Category']  # for the category price statistics
+            if transaction_data.get('DateTransaction'):
+                transaction['DateTransaction'] = transaction_data['DateTransaction']
+            updates = {
+                f"Transaction/{transaction_id}": transaction,
+                f"BuyerTransactions/{buyer_id}/{transaction_id}": True,
+                f"SellerTransactions/{seller_id}/{transaction_id}": True,
+            }
+            if status == STATUS_COMPLETED:
+                transaction['Status'] = STATUS_COMPLETED
+                transaction['CompletedAt'] = SERVER_TIMESTAMP
+                self._complete(marketplace_id, transaction, updates, status_paths=False)
+            else:
+                self._marketplace_ref(marketplace_id).update(updates)
+            self._bump(marketplace_id, buyer_id, seller_id)
+            logger.info(f"Created {transaction['Status']} transaction {transaction_id} for listing {listing_id} in {marketplace_id}")
+            return self.get_transaction(marketplace_id, transaction_id)
+        except ServiceError:
+            raise
         except Exception as e:
+            logger.error(f"Failed to create transaction for listing {listing_id} in {marketplace_id}: {e}", exc_info=True)
             raise DatabaseError(f"Failed to add transaction: {e}")
 
-    #Delete a transaction too free space in db
-    def delete_transaction(self, listing_id: str) -> None:
-        """Delete a transaction by its ListingID."""
+    def complete_transaction(self, marketplace_id: str, transaction_id: str, user_id: str) -> Dict[str, Any]:
+        """Mark a pending transaction completed (the seller only) and the listing sold, in one update."""
+        transaction = self._participant_transaction(marketplace_id, transaction_id, user_id)
+        if str(transaction.get('SellerID')) != str(user_id):
+            raise PermissionDeniedError("Only the seller can complete a transaction.")
+        if transaction.get('Status') != STATUS_PENDING:
+            raise ConflictError(f"Transaction {transaction_id} is {transaction.get('Status')}.")
         try:
-            tx_ref = self.ref.child('Transaction').child(str(listing_id))
-            if not tx_ref.get():
-                raise NotFoundError(f"Transaction for listing {listing_id} not found.")
-            tx_ref.delete()
+            self._complete(marketplace_id, transaction, {}, status_paths=True)
+            self._bump(marketplace_id, transaction['BuyerID'], transaction['SellerID'])
+            logger.info(f"Completed transaction {transaction_id} for listing {transaction['ListingID']} in {marketplace_id}")
+            return self.get_transaction(marketplace_id, transaction_id)
         except ServiceError:
             raise
+        except Exception as e:
+            logger.error(f"Failed to complete transaction {transaction_id} in {marketplace_id}: {e}", exc_info=True)
+            raise DatabaseError(f"Failed to complete transaction: {e}")
+
+    def cancel_transaction(self, marketplace_id: str, transaction_id: str, user_id: str) -> Dict[str, Any]:
+        """Cancel a pending transaction (either participant). It stays in both users' history."""
+        transaction = self._participant_transaction(marketplace_id, transaction_id, user_id)
+        if transaction.get('Status') != STATUS_PENDING:
+            raise ConflictError(f"Transaction {transaction_id} is {transaction.get('Status')}.")
+        try:
+            self._marketplace_ref(marketplace_id).child('Transaction').child(transaction_id).update(
+                {'Status': STATUS_CANCELLED, 'CancelledAt': SERVER_TIMESTAMP})
+            self._bump(marketplace_id, transaction['BuyerID'], transaction['SellerID'])
+            return self.get_transaction(marketplace_id, transaction_id)
+        except Exception as e:
+            raise DatabaseError(f"Failed to cancel transaction: {e}")
+
+    def delete_transaction(self, marketplace_id: str, transaction_id: str, user_id: str) -> None:
+        """Delete a transaction that was never completed, with its history entries (either participant)."""
+        transaction = self._participant_transaction(marketplace_id, transaction_id, user_id)
+        if transaction.get('Status') == STATUS_COMPLETED:
+            raise ConflictError(f"Transaction {transaction_id} is completed and can't be deleted.")
+        try:
+            self._marketplace_ref(marketplace_id).update({
+                f"Transaction/{transaction_id}": None,
+                f"BuyerTransactions/{transaction['BuyerID']}/{transaction_id}": None,
+                f"SellerTransactions/{transaction['SellerID']}/{transaction_id}": None,
+            })
+            self._bump(marketplace_id, transaction['BuyerID'], transaction['SellerID'])
         except Exception as e:
             raise DatabaseError(f"Failed to delete transaction: {e}")
 
-    #From a listing id, get the particular transaction
-    def get_transaction(self, listing_id: str) -> Dict[str, Any]:
-        """Get the transaction for a specific listing."""
+    def get_transaction(self, marketplace_id: str, transaction_id: str) -> Dict[str, Any]:
+        """Get a transaction by its TransactionID."""
         try:
-            tx = self.ref.child('Transaction').child(str(listing_id)).get()
+            tx = self._marketplace_ref(marketplace_id).child('Transaction').child(str(transaction_id)).get()
             if not tx:
-                raise NotFoundError(f"Transaction for listing {listing_id} not found.")
+                raise NotFoundError(f"Transaction {transaction_id} not found.")
             return tx
         except ServiceError:
             raise
         except Exception as e:
             raise DatabaseError(f"Failed to get transaction: {e}")
 
-    #Get all transaction in db regardless of listingid
-    def get_all_transactions(self) -> List[Dict[str, Any]]:
-        """Get all transactions in the database."""
+    def get_user_transactions(self, marketplace_id: str, user_id: str, role: Optional[str] = None,
+                              limit: int = DEFAULT_PAGE_SIZE, after: Optional[str] = None) -> Dict[str, Any]:
+        """
+        A user's transactions newest first: {"transactions": [...], "next": cursor or None}. role 'buyer' or
+        'seller' limits them to one side. Reads one key range per index plus the page's transactions,
+        so cost follows the page size, not the length of the history.
+        """
+        roles = [role] if role else list(ROLE_INDEXES)
+        if any(r not in ROLE_INDEXES for r in roles):
+            raise ValidationError("role must be 'buyer' or 'seller'.")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
         try:
-            txs = self.ref.child('Transaction').get()
-            if not txs:
-                raise NotFoundError("No transactions found.")
-            return [t for t in txs.values() if t is not None]
+            mp_ref = self._marketplace_ref(marketplace_id)
+            keys = set()
+            for r in roles:
+                query = mp_ref.child(ROLE_INDEXES[r]).child(str(user_id)).order_by_key()
+                if after: # end_at is inclusive: fetch one extra and drop the cursor itself
+                    query = query.end_at(after)
+                raw = query.limit_to_last(limit + 2).get() or {}
+                keys.update(k for k in raw if k != after)
+            # Push ids sort by creation time; the newest `limit` across both indexes make the page
+            ordered = sorted(keys, reverse=True)
+            page = ordered[:limit]
+            results = fan_out({k: (lambda k=k: mp_ref.child('Transaction').child(k).get()) for k in page})
+            for outcome in results.values():
+                if not outcome.ok:
+                    raise outcome.error
+            return {"transactions": [results[k].value for k in page if results[k].value],
+                    "next": page[-1] if len(ordered) > limit else None}
         except ServiceError:
             raise
         except Exception as e:
-            raise DatabaseError(f"Failed to get all transactions: {e}")
+            raise DatabaseError(f"Failed to get transactions for user {user_id}: {e}")
+
+    def get_seller_stats(self, marketplace_id: str, seller_id: str) -> Dict[str, Any]:
+        """{"Sold", "Revenue"} for a seller in a marketplace."""
+        try:
+            stats = self._marketplace_ref(marketplace_id).child('SellerStats').child(str(seller_id)).get() or {}
+        except Exception as e:
+            raise DatabaseError(f"Failed to get seller stats: {e}")
+        return {"SellerID": str(seller_id), "Sold": stats.get('Sold', 0), "Revenue": stats.get('Revenue', 0)}
+
+    def get_completed_sales(self, marketplace_id: str) -> List[Tuple[str, Any, Any, float]]:
+        """(transaction_id, Category, Price, completed epoch seconds) of every completed sale in a marketplace."""
+        return [(tx_id, tx.get('Category'), tx.get('Price'), (tx.get('CompletedAt') or 0) / 1000)
+                for tx_id, tx in self._completed_transactions(marketplace_id).items()]
+
+    def get_sold_prices(self, marketplace_id: str) -> Dict[str, Any]:
+        """{listing_id: sale Price} of every listing sold through a transaction in a marketplace."""
+        return {str(tx['ListingID']): tx.get('Price')
+                for tx in self._completed_transactions(marketplace_id).values() if tx.get('ListingID')}
+
+    def _completed_transactions(self, marketplace_id: str) -> Dict[str, Dict[str, Any]]:
+        transactions_ref = self._marketplace_ref(marketplace_id).child('Transaction')
+        try:
+            # Only completed ones (needs .indexOn Status); fall back to reading them all without the index
+            try:
+                raw = transactions_ref.order_by_child('Status').equal_to(STATUS_COMPLETED).get() or {}
+            except Exception as query_e:
+                logger.warning(f"Status query on transactions in {marketplace_id} failed ({query_e}); reading all")
+                raw = transactions_ref.get() or {}
+        except Exception as e:
+            raise DatabaseError(f"Failed to read transactions in {marketplace_id}: {e}")
+        return {tx_id: tx for tx_id, tx in raw.items()
+                if isinstance(tx, dict) and tx.get('Status') == STATUS_COMPLETED}
+
+    def add_transaction(self, transaction_data: Dict[str, Any], marketplace_id: Optional[str] = None) -> str:
+        """
+        Record a completed sale on behalf of its seller. Returns the TransactionID.
+        marketplace_id is the listing's marketplace; without it the seller's is used.
+        """
+        required = ['BuyerID', 'DateTransaction', 'ListingID', 'Price', 'SellerID']
+        for field in required:
+            if field not in transaction_data:
+                raise ValidationError(f"Missing field '{field}' in transaction_data.")
+        seller_id = str(transaction_data['SellerID'])
+        if not marketplace_id:
+            marketplace_id = account_service.get_account_marketplace(seller_id)
+            if not marketplace_id:
+                raise NotFoundError(f"Account {seller_id} not found.")
+        transaction = self.create_transaction(marketplace_id, seller_id, dict(transaction_data, Status=STATUS_COMPLETED))
+        return transaction['TransactionID']
+
+    def _complete(self, marketplace_id: str, transaction: Dict[str, Any], updates: Dict[str, Any], status_paths: bool):
+        """
+        Write the completion of `transaction` together with `updates` in one multi-path update. The listing must
+        still exist. With status_paths the pending -> completed flip of the stored transaction is made first, in
+        an RTDB transaction, so only one of several concurrent completions goes on. The listing's ListingSale
+        claim is then taken (also in an RTDB transaction) so a listing is only ever sold once. Both are undone if
+        the update fails.
+        """
+        transaction_id = transaction['TransactionID']
+        listing_id = transaction['ListingID']
+        seller_id = transaction['SellerID']
+        mp_ref = self._marketplace_ref(marketplace_id)
+        status_ref = mp_ref.child('Transaction').child(transaction_id).child('Status')
+        sale_ref = mp_ref.child('ListingSale').child(listing_id)
+
+        if listing_service.probe_listing(marketplace_id, listing_id) is None:
+            raise NotFoundError(f"Listing {listing_id} not found.")
+
+        def flip(current):
+            if current != STATUS_PENDING:
+                raise ConflictError(f"Transaction {transaction_id} is {current}.")
+            return STATUS_COMPLETED
+
+        def claim(current):
+            if current is not None:
+                raise ConflictError(f"Listing {listing_id} is already sold.")
+            return transaction_id
+
+        if status_paths:
+            status_ref.transaction(flip)
+        claimed = False
+        try:
+            sale_ref.transaction(claim)
+            claimed = True
+            updates = dict(updates)
+            if status_paths:
+                updates[f"Transaction/{transaction_id}/CompletedAt"] = SERVER_TIMESTAMP
+            updates[f"SellerStats/{seller_id}/Sold"] = increment(1)
+            updates[f"SellerStats/{seller_id}/Revenue"] = increment(transaction.get('Price') or 0)
+            chat_updates, chat_ids = chat_service.listing_sold_updates(marketplace_id, listing_id, transaction_id)
+            updates.update(chat_updates)
+            listing_service.patch_listing_with(marketplace_id, listing_id, {'SellStatus': SELL_STATUS_SOLD}, updates)
+        except Exception:
+            if claimed:
+                sale_ref.transaction(lambda current: None if current == transaction_id else current)
+            if status_paths:
+                status_ref.transaction(lambda current: STATUS_PENDING if current == STATUS_COMPLETED else current)
+            raise
+        price_stats.sale_recorded(marketplace_id, transaction_id, transaction.get('Category'), transaction.get('Price'))
+        if chat_ids:
+            chat_service.chats_written(marketplace_id, chat_ids)
+
+    def _participant_transaction(self, marketplace_id: str, transaction_id: str, user_id: str) -> Dict[str, Any]:
+        transaction = self.get_transaction(marketplace_id, transaction_id)
+        if str(user_id) not in (str(transaction.get('BuyerID')), str(transaction.get('SellerID'))):
+            raise PermissionDeniedError("Only the buyer or the seller can change this transaction.")
+        return transaction
+
+    def _bump(self, marketplace_id: str, *user_ids: str):
+        for uid in user_ids:
+            versions.bump('transactions', marketplace_id, str(uid))
 
 # Default instance
 transaction_service = TransactionService()
 add_transaction = transaction_service.add_transaction
+create_transaction = transaction_service.create_transaction
+complete_transaction = transaction_service.complete_transaction
+cancel_transaction = transaction_service.cancel_transaction
 delete_transaction = transaction_service.delete_transaction
 get_transaction = transaction_service.get_transaction
-get_all_transactions = transaction_service.get_all_transactions
+get_user_transactions = transaction_service.get_user_transactions
+get_seller_stats = transaction_service.get_seller_stats
+get_completed_sales = transaction_service.get_completed_sales
+get_sold_prices = transaction_service.get_sold_prices
@@ -0,0 +1,61 @@
+# services/versions.py
+# Version counters for conditional GETs (ETag / If-None-Match -> 304).
+#
+# Service write methods bump a counter for what they changed: a listing, a marketplace's
+# listing set, an account, a chat or a marketplace's chat set. Read routes turn the
+# counters into a strong ETag and answer 304 before doing any heavy work (RTDB reads,
+# presigning, serialization) when the client already holds the current version.
+#
+# Counters live in this process. Each ETag carries a random boot token, so a restart
+# never reuses an old tag. Listing writes made by other processes reach us through the
+# listing replica stream and bump the listing counters too; account and chat writes are
+# only seen when they go through this process, which is how the app is deployed (a single
+# eventlet worker, as Flask-SocketIO requires without a message queue).
+
+import threading
+import uuid
+from typing import Dict, Hashable, Optional, Tuple
+
+from flask import Response, request
+
+
+class VersionRegistry:
+    def __init__(self):
+        self.boot = uuid.uuid4().hex[:8]
+        self._versions: Dict[Tuple[Hashable, ...], int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *key: Hashable) -> int:
+        with self._lock:
+            version = self._versions.get(key, 0) + 1
+            self._versions[key] = version
+            return version
+
+    def get(self, *key: Hashable) -> int:
+        return self._versions.get(key, 0)
+
+    def etag(self, *keys: Tuple[Hashable, ...], salt: Optional[str] = None) -> str:
+        """Strong ETag (unquoted) for the current versions of keys; salt distinguishes variants of one resource."""
+        parts = [self.boot] + [str(self.get(*key)) for key in keys]
+        if salt:
+            parts.append(salt)
+        return '.'.join(parts)
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    """A 304 response if the request's If-None-Match already names etag, else None."""
+    if request.if_none_match.contains(etag):
+        return tag(Response(status=304), etag)
+    return None
+
+
+def tag(response, etag: str):
+    """Set etag on a response (or a (response, status) tuple) and mark it revalidate-before-use."""
+    resp = response[0] if isinstance(response, tuple) else response
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    resp.headers['Vary'] = 'Authorization'
+    return response
+
+
+versions = VersionRegistry()
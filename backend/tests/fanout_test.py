@@ -0,0 +1,21 @@
+import time
+
+from services.fanout import fan_out
+
+
+def test_calls_run_concurrently():
+    fan_out({'warm-up': lambda: None})
+    start = time.perf_counter()
+    results = fan_out({name: (lambda: time.sleep(0.2) or 'done') for name in ('a', 'b', 'c')})
+    assert time.perf_counter() - start < 0.5
+    assert all(r.ok and r.value == 'done' for r in results.values())
+
+
+def test_failures_and_timeouts_are_per_call():
+    def boom():
+        raise ValueError("nope")
+
+    results = fan_out({'ok': lambda: 1, 'bad': boom, 'slow': lambda: time.sleep(1)}, timeout=0.2)
+    assert results['ok'].value == 1
+    assert isinstance(results['bad'].error, ValueError)
+    assert isinstance(results['slow'].error, TimeoutError)
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from services.image_cache import DiskLRUCache, ImageNotFound, url_for_key, verify_url
+
+
+def test_fill_and_hit(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 1024)
+    path, etag = cache.get_or_fill("a", lambda key: b"hello")
+    assert open(path, "rb").read() == b"hello"
+    assert cache.get_or_fill("a", lambda key: b"other") == (path, etag)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_eviction(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 25)
+    cache.put("a", b"x" * 10)
+    cache.put("b", b"x" * 10)
+    cache.get("a")  # a is now most recently used
+    cache.put("c", b"x" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.total_bytes == 20
+
+
+def test_index_survives_restart(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 1024)
+    _, etag = cache.put("a", b"hello")
+    reopened = DiskLRUCache(str(tmp_path), 1024)
+    assert reopened.get("a")[1] == etag
+    assert reopened.total_bytes == 5
+
+
+def test_single_flight(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 1024)
+    calls = []
+
+    def slow_loader(key):
+        calls.append(key)
+        time.sleep(0.1)
+        return b"data"
+
+    threads = [threading.Thread(target=cache.get_or_fill, args=("k", slow_loader)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ["k"]
+
+
+def test_failed_loads_are_remembered(tmp_path):
+    now = [1000.0]
+    cache = DiskLRUCache(str(tmp_path), 1024, negative_ttl=30, clock=lambda: now[0])
+    calls = []
+
+    def missing(key):
+        calls.append(key)
+        raise KeyError(key)
+
+    with pytest.raises(KeyError):
+        cache.get_or_fill("gone", missing)
+    with pytest.raises(ImageNotFound):
+        cache.get_or_fill("gone", missing)
+    now[0] += 31
+    path, _ = cache.get_or_fill("gone", lambda key: b"back")
+    assert calls == ["gone"] and open(path, "rb").read() == b"back"
+
+
+def test_signed_urls():
+    key = "x%Tz^Lp&abc*Gh!mN?y1"
+    url = url_for_key(key, now=1800 * 10 + 5)
+    path, _, query = url.partition("?")
+    assert path == "/api/images/x%25Tz%5ELp%26abc%2AGh%21mN%3Fy1"
+    params = dict(p.split("=") for p in query.split("&"))
+    assert params["expires"] == str(1800 * 12)
+    assert verify_url(key, params["expires"], params["sig"], now=1800 * 10 + 5) == 1800 * 2 - 5
+    assert verify_url(key, params["expires"], params["sig"], now=1800 * 12) is None  # expired
+    assert verify_url(key, int(params["expires"]) + 1800, params["sig"], now=1800 * 10) is None
+    assert verify_url("x%Tz^Lp&other", params["expires"], params["sig"], now=1800 * 10) is None
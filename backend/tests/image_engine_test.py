@@ -0,0 +1,82 @@
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+pytest.importorskip("cv2")
+
+from services import image_engine
+
+
+pillow = image_engine.PillowEngine()
+opencv = image_engine.OpenCVEngine()
+sample = image_engine._sample_image(800, 600)
+
+
+def psnr(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    mse = np.mean((a - b) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def decode(data):
+    return Image.open(io.BytesIO(data)).convert("RGB")
+
+
+def test_downscale_same_size():
+    a = pillow.downscale(sample, 0.5)
+    b = opencv.downscale(sample, 0.5)
+    assert a.size == b.size == (400, 300)
+
+
+def test_downscale_quality_close():
+    a = pillow.downscale(sample, 0.5)
+    b = opencv.downscale(sample, 0.5)
+    assert psnr(a, b) > 30
+
+
+@pytest.mark.parametrize("max_kb", [40, 100])
+def test_compress_within_budget(max_kb):
+    for engine in (pillow, opencv):
+        data = engine.compress(sample, max_kb)
+        assert len(data) <= max_kb * 1024
+        assert decode(data).size[0] > 0
+
+
+def test_compress_quality_and_size_close():
+    a = pillow.compress(sample, 100)
+    b = opencv.compress(sample, 100)
+    img_a, img_b = decode(a), decode(b)
+    assert img_a.size == img_b.size
+    # byte sizes within 35% of each other
+    assert abs(len(a) - len(b)) <= 0.35 * max(len(a), len(b))
+    # quality against the source within 2 dB of each other
+    reference = sample.resize(img_a.size) if img_a.size != sample.size else sample
+    assert abs(psnr(img_a, reference) - psnr(img_b, reference)) < 2.0
+
+
+def test_calibration_picks_available_engine():
+    result = image_engine.calibrate(sample, rounds=1)
+    for op in image_engine.OPERATIONS:
+        assert result["choices"][op] in ("pillow", "opencv")
+
+
+def test_forced_engine(monkeypatch):
+    monkeypatch.setenv("REUSEU_IMAGE_ENGINE", "opencv")
+    assert image_engine.get_engine("compress").name == "opencv"
+    monkeypatch.setenv("REUSEU_IMAGE_ENGINE", "pillow")
+    assert image_engine.get_engine("downscale").name == "pillow"
+
+
+def test_uncalibrated_defaults_to_pillow(monkeypatch, tmp_path):
+    monkeypatch.delenv("REUSEU_IMAGE_ENGINE", raising=False)
+    monkeypatch.setattr(image_engine, "CALIBRATION_PATH", str(tmp_path / "missing.json"))
+    monkeypatch.setattr(image_engine, "calibrate", lambda *a, **k: pytest.fail("calibrated inline"))
+    image_engine.reset()
+    try:
+        assert image_engine.get_engine("compress").name == "pillow"
+        assert image_engine.get_engine("downscale").name == "pillow"
+    finally:
+        image_engine.reset()
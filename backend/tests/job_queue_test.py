@@ -0,0 +1,115 @@
+import time
+
+from services.job_queue import JobQueue
+
+
+def make_queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), base_delay=0.0, max_delay=0.0)
+
+
+def test_job_runs_and_stores_result(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.register('add')(lambda payload: payload['a'] + payload['b'])
+    job_id = queue.enqueue('add', {'a': 1, 'b': 2})
+    assert queue.run_one()
+    job = queue.get_job(job_id)
+    assert job['status'] == 'done'
+    assert job['result'] == 3
+    assert not queue.run_one()
+
+
+def test_idempotency_key_dedupes(tmp_path):
+    queue = make_queue(tmp_path)
+    first = queue.enqueue('noop', {}, idempotency_key='same')
+    second = queue.enqueue('noop', {}, idempotency_key='same')
+    assert first == second
+    assert queue.metrics()['depth']['queued'] == 1
+
+
+def test_retry_then_dead_letter(tmp_path):
+    queue = make_queue(tmp_path)
+    calls, dead = [], []
+
+    def flaky(payload):
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    queue.register('flaky', on_dead=lambda payload, error: dead.append(error))(flaky)
+    job_id = queue.enqueue('flaky', {'x': 1}, max_attempts=3)
+    while queue.run_one():
+        pass
+    job = queue.get_job(job_id)
+    assert len(calls) == 3
+    assert job['status'] == 'dead'
+    assert 'boom' in job['last_error']
+    assert dead and 'boom' in dead[0]
+    assert [j['id'] for j in queue.dead_letters()] == [job_id]
+
+    assert queue.requeue(job_id)
+    assert queue.get_job(job_id)['status'] == 'queued'
+
+
+def test_backoff_delays_retry(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), base_delay=60.0)
+    queue.register('fail')(lambda payload: 1 / 0)
+    job_id = queue.enqueue('fail', {})
+    assert queue.run_one()
+    assert queue.get_job(job_id)['status'] == 'queued'
+    assert not queue.run_one()  # not due for about a minute
+
+
+def test_jobs_survive_restart(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.0)
+    job_id = queue.enqueue('later', {'n': 1})
+    queue._claim()  # simulate a crash while the job was running; its lease expires at once
+
+    reopened = make_queue(tmp_path)
+    seen = []
+    reopened.register('later')(lambda payload: seen.append(payload['n']))
+    assert reopened.recover() == 1
+    assert reopened.run_one()
+    assert seen == [1]
+    assert reopened.get_job(job_id)['status'] == 'done'
+
+
+def test_live_leases_are_not_recovered(tmp_path):
+    running = make_queue(tmp_path)
+    job_id = running.enqueue('slow', {})
+    running._claim()
+
+    other = make_queue(tmp_path)  # a second process sharing the file starts up
+    assert other.recover() == 0
+    assert not other.run_one()
+    assert running.renew_leases() == 1
+    assert other.get_job(job_id)['status'] == 'running'
+
+
+def test_database_is_opened_on_first_use(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    queue = JobQueue(str(path))
+    queue.register('noop')(lambda payload: None)
+    assert not path.exists()
+    queue.enqueue('noop', {})
+    assert path.exists()
+
+
+def test_metrics(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.register('noop')(lambda payload: None)
+    queue.enqueue('noop', {})
+    queue.enqueue('noop', {}, delay=3600)
+    time.sleep(0.01)
+    metrics = queue.metrics()
+    assert metrics['depth']['queued'] == 2
+    assert metrics['oldest_ready_age_seconds'] > 0
+    queue.run_one()
+    metrics = queue.metrics()
+    assert metrics['depth']['done'] == 1
+    assert metrics['latency_seconds']['p50'] is not None
+    assert metrics['completed'] == 1
+
+
+def test_get_job_includes_payload(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue('noop', {'user_id': 'u1'})
+    assert queue.get_job(job_id)['payload'] == {'user_id': 'u1'}
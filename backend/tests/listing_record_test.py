@@ -0,0 +1,34 @@
+import pytest
+
+from services.listing_record import ListingRecord, parse_price, summary_of
+
+
+def test_round_trip_keeps_unknown_fields():
+    data = {'ListingID': 'a', 'UserID': 'u1', 'Title': 'Lamp', 'Price': '12', 'Category': ['Dorm'], 'Color': 'red'}
+    record = ListingRecord.from_dict(data)
+    assert record.price == 12
+    assert record.extra == {'Color': 'red'}
+    assert record.to_dict() == dict(data, Price=12)
+    assert not hasattr(record, '__dict__')
+
+
+def test_listing_id_filled_from_key():
+    record = ListingRecord.from_dict({'Title': 'Lamp'}, 'abc')
+    assert record.get('ListingID') == 'abc'
+    assert record.get('ImageStatus', 'ready') == 'ready'
+    assert 'Price' not in record.to_dict()
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('12', 12), ('12.50', 12.5), ('$1,200', 1200), (7.0, 7), (3.25, 3.25), ('free', None), (None, None), (True, None),
+])
+def test_parse_price(raw, expected):
+    assert parse_price(raw) == expected
+
+
+def test_projection_and_summary():
+    data = {'ListingID': 'a', 'Title': 'Lamp', 'Description': 'long text', 'ImageKeys': ['k1', 'k2'],
+            'CoverImageKey': 'k1', 'Price': 5}
+    record = ListingRecord.from_dict(data)
+    assert record.to_dict(['Title', 'Price', 'Nope']) == {'Title': 'Lamp', 'Price': 5}
+    assert summary_of(data) == {'ListingID': 'a', 'Title': 'Lamp', 'CoverImageKey': 'k1', 'Price': 5}
@@ -0,0 +1,86 @@
+from services.listing_replica import ListingReplica, ListingReplicaManager
+
+
+class FakeEvent:
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class FakeRef:
+    def __init__(self):
+        self.callback = None
+
+    def listen(self, callback):
+        self.callback = callback
+        return None
+
+
+def live_replica(initial):
+    ref = FakeRef()
+    replica = ListingReplica('grinnell', ref)
+    replica.start()
+    ref.callback(FakeEvent('put', '/', initial))
+    return replica, ref
+
+
+def as_dict(replica, listing_id):
+    record = replica.get(listing_id)
+    return record.to_dict() if record is not None else None
+
+
+def test_bootstrap_put():
+    replica, _ = live_replica({'a': {'Title': 'Lamp'}, 'b': {'Title': 'Desk'}})
+    assert replica.is_live()
+    assert as_dict(replica, 'a') == {'ListingID': 'a', 'Title': 'Lamp'}
+    assert replica.metrics()['size'] == 2
+
+
+def test_put_patch_and_delete_events():
+    replica, ref = live_replica({'a': {'Title': 'Lamp', 'Price': 5}})
+    ref.callback(FakeEvent('put', '/a/Price', '7'))
+    ref.callback(FakeEvent('patch', '/a', {'SellStatus': 0, 'Title': 'Desk lamp'}))
+    ref.callback(FakeEvent('put', '/b', {'Title': 'Fridge'}))
+    assert as_dict(replica, 'a') == {'ListingID': 'a', 'Title': 'Desk lamp', 'Price': 7, 'SellStatus': 0}
+    assert as_dict(replica, 'b') == {'ListingID': 'b', 'Title': 'Fridge'}
+    ref.callback(FakeEvent('put', '/a', None))
+    assert replica.get('a') is None
+    ref.callback(FakeEvent('patch', '/', {'b/Price': 40, 'c': {'Title': 'Chair'}}))
+    assert as_dict(replica, 'b') == {'ListingID': 'b', 'Title': 'Fridge', 'Price': 40}
+    assert as_dict(replica, 'c') == {'ListingID': 'c', 'Title': 'Chair'}
+
+
+def test_events_replace_records():
+    replica, ref = live_replica({'a': {'Title': 'Lamp'}})
+    snapshot = replica.items()
+    ref.callback(FakeEvent('put', '/a/Title', 'Desk'))
+    assert replica.get('a').title == 'Desk'
+    assert snapshot[0][1].title == 'Lamp'
+
+
+def test_write_lag_measured_on_echo():
+    replica, ref = live_replica({})
+    replica.apply('put', '/a', {'Title': 'Lamp'})
+    replica.note_write('a')
+    ref.callback(FakeEvent('put', '/a', {'Title': 'Lamp'}))
+    assert replica.metrics()['last_write_lag_seconds'] is not None
+
+
+def test_missing_echo_fails_the_replica():
+    replica, _ = live_replica({})
+    replica.apply('put', '/a', {'Title': 'Lamp'})
+    replica.note_write('a')
+    assert replica.is_live()
+    replica._pending_writes['a'] -= 3600  # the stream never echoed the write
+    assert not replica.is_live()
+    assert replica.metrics()['state'] == 'failed'
+
+
+def test_manager_falls_back_until_live():
+    manager = ListingReplicaManager(enabled=True)
+    ref = FakeRef()
+    assert manager.get('grinnell', ref) is None  # bootstrapping
+    ref.callback(FakeEvent('put', '/', {'a': {'Title': 'Lamp'}}))
+    assert manager.get('grinnell', ref).get('a').title == 'Lamp'
+    assert ListingReplicaManager(enabled=False).get('grinnell', ref) is None
@@ -0,0 +1,30 @@
+from services.presign_cache import PresignCache
+
+
+def test_reuse_within_window_and_resign_after():
+    now = [1000.0]
+    cache = PresignCache(window=1800, clock=lambda: now[0])
+    signed = []
+
+    def sign(key):
+        signed.append(key)
+        return f"https://bucket/{key}?sig={len(signed)}"
+
+    first = cache.get_or_sign('cover-1', sign)
+    now[0] = 1799.0  # same window
+    assert cache.get_or_sign('cover-1', sign) == first
+    assert signed == ['cover-1']
+
+    now[0] = 1800.0  # next window: a reused URL could have under 30 minutes left
+    assert cache.get_or_sign('cover-1', sign) != first
+    assert signed == ['cover-1', 'cover-1']
+    assert cache.metrics()['hits'] == 1
+
+
+def test_size_bound_evicts_least_recently_used():
+    cache = PresignCache(max_entries=2, clock=lambda: 0.0)
+    for key in ('a', 'b', 'a', 'c'):
+        cache.get_or_sign(key, lambda k: k.upper())
+    assert cache.metrics()['entries'] == 2
+    assert cache.get_or_sign('a', lambda k: 'resigned') == 'A'
+    assert cache.get_or_sign('b', lambda k: 'resigned') == 'resigned'
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from services.price_cache import PredictionCache, prediction_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_760_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_is_normalised():
+    a = prediction_key({1: 'Kitchen', 2: 'Utensils'}, 'Serrated  Knife!', 'Sharp, barely used.')
+    b = prediction_key(['utensils', 'kitchen '], 'serrated knife', 'sharp barely used')
+    assert a == b
+    assert a != prediction_key(['utensils', 'kitchen'], 'serrated knife', 'dull')
+    assert prediction_key(None, 'Lamp', None) == 'lamp||'
+
+
+def test_ttl_and_lru_eviction():
+    clock = Clock()
+    cache = PredictionCache(ttl=60, max_entries=2, clock=clock)
+    cache.put('a', {'minPrice': 1, 'maxPrice': 2})
+    cache.put('b', {'minPrice': 3, 'maxPrice': 4})
+    assert cache.get('a') == {'minPrice': 1, 'maxPrice': 2}  # a is now the most recently used
+    cache.put('c', {'minPrice': 5, 'maxPrice': 6})
+    assert cache.get('b') is None
+    clock.now += 61
+    assert cache.get('a') is None and cache.get('c') is None
+
+
+def test_concurrent_misses_share_one_call():
+    cache = PredictionCache()
+    calls, release = [], threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'minPrice': 10, 'maxPrice': 20}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute)[0])) for _ in range(5)]
+    for t in threads:
+        t.start()
+    while cache.coalesced < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1
+    assert results == [{'minPrice': 10, 'maxPrice': 20}] * 5
+    assert cache.get_or_compute('k', compute) == ({'minPrice': 10, 'maxPrice': 20}, True) and len(calls) == 1
+
+
+def test_errors_are_not_cached():
+    cache = PredictionCache()
+
+    def fail():
+        raise ValueError("Could not parse price range")
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute('k', fail)
+    assert cache.get_or_compute('k', lambda: {'minPrice': 1, 'maxPrice': 2}) == ({'minPrice': 1, 'maxPrice': 2}, False)
+
+
+def test_persists_across_restarts(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / 'price_cache.json')
+    cache = PredictionCache(ttl=60, path=path, clock=clock)
+    cache.put('a', {'minPrice': 1, 'maxPrice': 2})
+    clock.now += 30
+    cache.put('b', {'minPrice': 3, 'maxPrice': 4})
+
+    clock.now += 40  # a has expired, b has not
+    restarted = PredictionCache(ttl=60, path=path, clock=clock)
+    assert restarted.get('a') is None
+    assert restarted.get('b') == {'minPrice': 3, 'maxPrice': 4}
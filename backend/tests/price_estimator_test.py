@@ -0,0 +1,56 @@
+from services.price_estimator import EstimatorManager, PathMetrics, PriceEstimator, features, MIN_CONFIDENCE, MIN_TRAINING_DOCS
+
+
+def catalog():
+    docs = []
+    for i in range(10):
+        docs.append((f"Mini fridge {i}", ['Appliances'], "Works great, pick up in the dorm", 60 + i))
+        docs.append((f"Desk lamp {i}", ['Furniture'], "LED lamp with adjustable arm", 15 + i % 3))
+        docs.append((f"Calculus textbook edition {i}", ['Books'], "Some highlighting", 40 + 2 * i))
+    docs.append(("Broken thing", None, None, None))  # unpriced: skipped
+    return docs
+
+
+def test_features_are_stable_and_weighted():
+    a = features("Mini Fridge", ['Appliances'], None)
+    assert a == features("mini fridge", ['appliances '], "")
+    assert len(a) == 4  # mini, fridge, mini_fridge, c:appliances
+
+
+def test_similar_listings_give_a_confident_range():
+    model = PriceEstimator(catalog())
+    assert model.size == 30
+    estimate = model.estimate("mini fridge", ['Appliances'], "compact fridge for a dorm room")
+    assert estimate is not None
+    assert 60 <= estimate["minPrice"] <= estimate["maxPrice"] <= 69
+    assert estimate["neighbors"] >= 3
+    assert estimate["confidence"] >= MIN_CONFIDENCE
+
+
+def test_unknown_items_have_no_estimate():
+    model = PriceEstimator(catalog())
+    assert model.estimate("vintage synthesizer", ['Music'], "analog keys") is None
+
+
+def test_manager_skips_marketplaces_with_too_little_data():
+    manager = EstimatorManager(enabled=True)
+    assert manager.train('tiny', lambda mp: catalog()[:MIN_TRAINING_DOCS - 1]) is None
+    assert manager.train('grinnell', lambda mp: catalog()) is not None
+    assert manager.get('grinnell', lambda mp: catalog()).size == 30
+    assert manager.metrics()['tiny']['listings'] == 0
+
+
+def test_disabled_manager_returns_no_model():
+    manager = EstimatorManager(enabled=False)
+    manager.train('grinnell', lambda mp: catalog())
+    assert manager.get('grinnell', lambda mp: catalog()) is None
+
+
+def test_path_metrics():
+    metrics = PathMetrics()
+    for _ in range(3):
+        metrics.record('local', 0.002)
+    metrics.record('llm', 0.8)
+    result = metrics.metrics()
+    assert result['local']['count'] == 3 and result['local']['share'] == 0.75
+    assert result['llm']['p50_ms'] == 800.0
@@ -0,0 +1,101 @@
+import threading
+
+from services.price_stats import PriceStats, SalePrices, WEEK_SECONDS, category_keys
+
+
+NOW = 1_760_000_000.0
+
+
+def loaded(listings, sales=()):
+    stats = PriceStats(clock=lambda: NOW)
+    stats.ensure_loaded('grinnell', lambda mp: (listings.items(), list(sales)))
+    return stats
+
+
+def test_category_keys():
+    assert category_keys(['Furniture', 'Dorm ']) == ('furniture', 'dorm')
+    assert category_keys({'0': 'Books', '1': 'books'}) == ('books',)
+    assert category_keys('Lamps') == ('lamps',)
+    assert category_keys(None) == ('uncategorized',)
+
+
+def test_summary_of_active_listings():
+    stats = loaded({str(i): {'Category': ['Furniture'], 'Price': str(i), 'SellStatus': 1} for i in range(1, 101)})
+    active = stats.summary('grinnell', 'furniture')['active']
+    assert active['count'] == 100
+    assert active['min'] == 1 and active['max'] == 100
+    assert active['percentiles']['p50'] == 50.5
+    assert sum(active['histogram']['counts']) == 100
+    assert len(active['histogram']['edges']) == 11
+
+
+def test_listing_writes_update_incrementally():
+    stats = loaded({'a': {'Category': ['Desk'], 'Price': 10, 'SellStatus': 1},
+                    'b': {'Category': ['Desk', 'Dorm'], 'Price': 30, 'SellStatus': 1}})
+    stats.listing_written('grinnell', 'put', 'c', {'Category': ['Desk'], 'Price': 50, 'SellStatus': 1})
+    assert stats.summary('grinnell', 'Desk')['active']['count'] == 3
+
+    stats.listing_written('grinnell', 'patch', 'b', {'SellStatus': 0})  # sold: no longer an asking price
+    assert stats.summary('grinnell', 'desk')['active']['count'] == 2
+    assert stats.summary('grinnell', 'dorm')['active']['count'] == 0
+
+    stats.listing_written('grinnell', 'patch', 'a', {'Price': 20})
+    stats.listing_written('grinnell', 'put', 'c', None)
+    active = stats.summary('grinnell', 'desk')['active']
+    assert (active['count'], active['max']) == (1, 20)
+
+
+def test_writes_before_load_are_ignored():
+    stats = PriceStats(clock=lambda: NOW)
+    stats.listing_written('grinnell', 'put', 'a', {'Category': ['Desk'], 'Price': 10})
+    assert stats.categories('grinnell') == {}
+
+
+def test_sales_trend_and_dedupe():
+    sales = [(f"t{i}", ['Books'], 10 + i, NOW - (7 - i) * WEEK_SECONDS - 60) for i in range(8)]
+    stats = loaded({}, sales)
+    stats.sale_recorded('grinnell', 't7', ['Books'], 17, NOW - 60)  # already loaded
+    summary = stats.summary('grinnell', 'books')
+    assert summary['sold']['count'] == 8
+    assert [w['median'] for w in summary['trend']['weeks']] == [10, 11, 12, 13, 14, 15, 16, 17]
+    assert summary['trend']['slopePerWeek'] == 1.0
+
+
+def test_sale_ring_keeps_the_latest():
+    sales = SalePrices(capacity=40, initial=4)
+    for i in range(100):
+        sales.add(f"t{i}", i, i)
+    prices, times = sales.arrays()
+    assert len(prices) == 40
+    assert sorted(prices.tolist()) == list(range(60, 100))
+
+
+def test_writes_during_load_are_replayed():
+    stats = PriceStats(clock=lambda: NOW)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_load(mp):
+        started.set()
+        release.wait(5)
+        return {'a': {'Category': ['Desk'], 'Price': 10, 'SellStatus': 1}}.items(), []
+
+    loader = threading.Thread(target=stats.ensure_loaded, args=('grinnell', slow_load))
+    loader.start()
+    started.wait(5)
+    stats.listing_written('grinnell', 'patch', 'a', {'Price': 25})
+    release.set()
+    loader.join(5)
+    assert stats.summary('grinnell', 'desk')['active']['max'] == 25
+
+
+def test_listings_count_once_their_images_are_ready():
+    stats = loaded({'a': {'Category': ['Desk'], 'Price': 10, 'SellStatus': 1},
+                    'b': {'Category': ['Desk'], 'Price': 20, 'SellStatus': 1, 'ImageStatus': 'processing'}})
+    assert stats.summary('grinnell', 'desk')['active']['count'] == 1
+    stats.listing_written('grinnell', 'put', 'c', {'Category': ['Desk'], 'Price': 30, 'SellStatus': 1,
+                                                   'ImageStatus': 'processing'})
+    assert stats.summary('grinnell', 'desk')['active']['count'] == 1
+    stats.listing_written('grinnell', 'patch', 'b', {'ImageStatus': 'ready'})
+    stats.listing_written('grinnell', 'patch', 'c', {'ImageStatus': 'ready'})
+    active = stats.summary('grinnell', 'desk')['active']
+    assert (active['count'], active['max']) == (3, 30)
@@ -0,0 +1,46 @@
+import gzip
+import json
+
+from services.response_cache import EncodedResponse, ResponseCache
+
+
+def test_entry_encodings():
+    entry = EncodedResponse.from_data([{'Title': 'Lamp'}] * 50)
+    assert json.loads(entry.identity) == [{'Title': 'Lamp'}] * 50
+    body, encoding = entry.negotiate('gzip, deflate')
+    assert encoding == 'gzip' and gzip.decompress(body) == entry.identity
+    assert entry.negotiate('gzip;q=0, identity') == (entry.identity, None)
+    if entry.br is not None:
+        assert entry.negotiate('gzip, br')[1] == 'br'
+
+
+def test_cache_hit_invalidate_and_generation():
+    cache = ResponseCache()
+    calls = []
+
+    def build():
+        calls.append(1)
+        return [len(calls)]
+
+    first = cache.get_or_build('grinnell', (), build, generation=1)
+    assert cache.get_or_build('grinnell', (), build, generation=1) is first
+    assert len(calls) == 1
+    cache.get_or_build('grinnell', (('fields', 'Title'),), build, generation=1)
+    assert len(calls) == 2
+
+    cache.invalidate('grinnell')
+    assert cache.get('grinnell', (), generation=1) is None
+    rebuilt = cache.get_or_build('grinnell', (), build, generation=1)
+    assert cache.get('grinnell', (), generation=2) is None  # replica moved on
+    assert rebuilt.etag != first.etag
+
+
+def test_ttl_and_size_bound():
+    cache = ResponseCache(ttl=0.0, max_entries=2)
+    cache.put('a', (), EncodedResponse(b'[]'))
+    assert cache.get('a', ()) is None
+    cache = ResponseCache(max_entries=2)
+    for mp in ('a', 'b', 'c'):
+        cache.put(mp, (), EncodedResponse(b'[]'))
+    assert cache.get('a', ()) is None
+    assert cache.get('c', ()) is not None
@@ -2,7 +2,7 @@ import firebase_admin
 import pytest
 from firebase_admin import credentials, db
 
-from services.transaction_service import add_transaction, delete_transaction, get_transaction
+from services.transaction_service import create_transaction, delete_transaction, get_transaction, get_user_transactions
 from services.exceptions import NotFoundError
 
 
@@ -16,25 +16,41 @@ except ValueError:
 # get root ref
 ref = db.reference('/')
 
-transaction_id = add_transaction({
-        'BuyerID': 7,
-        'DateTransaction': 'now',
-        'ListingID': 9,
-        'Price': 0,
-        'SellerID': 8
+marketplace_id = 'transaction-test'
+ref.child('Account').child('tx-buyer').set({'UserID': 'tx-buyer', 'marketplace_id': marketplace_id})
+ref.child('Account').child('tx-seller').set({'UserID': 'tx-seller', 'marketplace_id': marketplace_id})
+ref.child(marketplace_id).child('Listing').child('tx-listing').set({
+        'ListingID': 'tx-listing',
+        'Price': 12,
+        'SellStatus': 1,
+        'Title': 'this',
+        'UserID': 'tx-seller'
     })
 
-compare = get_transaction(transaction_id)
+transaction_id = create_transaction(marketplace_id, 'tx-buyer', {'ListingID': 'tx-listing', 'DateTransaction': 'now'})['TransactionID']
+
+compare = get_transaction(marketplace_id, transaction_id)
+bought = get_user_transactions(marketplace_id, 'tx-buyer', role='buyer')
+sold = get_user_transactions(marketplace_id, 'tx-seller', role='seller')
 
 def test_get():
-    assert compare['BuyerID'] == 7
+    assert compare['BuyerID'] == 'tx-buyer'
     assert compare['DateTransaction'] == 'now'
-    assert compare['ListingID'] == 9
-    assert compare['Price'] == 0
-    assert compare['SellerID'] == 8
+    assert compare['ListingID'] == 'tx-listing'
+    assert compare['Price'] == 12
+    assert compare['SellerID'] == 'tx-seller'
+    assert compare['Status'] == 'pending'
+
+def test_history():
+    assert [t['TransactionID'] for t in bought['transactions']] == [transaction_id]
+    assert [t['TransactionID'] for t in sold['transactions']] == [transaction_id]
+    assert bought['next'] is None
 
-delete_transaction(transaction_id)
+delete_transaction(marketplace_id, transaction_id, 'tx-buyer')
+ref.child(marketplace_id).delete()
+ref.child('Account').child('tx-buyer').delete()
+ref.child('Account').child('tx-seller').delete()
 
 def test_deletion():
-    with pytest.raises(NotFoundError, match= f"Transaction for listing {transaction_id} not found."):
-        get_transaction(transaction_id)
+    with pytest.raises(NotFoundError, match= f"Transaction {transaction_id} not found."):
+        get_transaction(marketplace_id, transaction_id)
@@ -0,0 +1,34 @@
+from flask import Flask, jsonify
+
+from services.versions import VersionRegistry, not_modified, tag
+
+
+def test_bump_changes_etag():
+    registry = VersionRegistry()
+    before = registry.etag(('listing', 'grinnell', 'a'))
+    registry.bump('listing', 'grinnell', 'b')
+    assert registry.etag(('listing', 'grinnell', 'a')) == before
+    registry.bump('listing', 'grinnell', 'a')
+    assert registry.etag(('listing', 'grinnell', 'a')) != before
+    assert registry.etag(('chats', 'grinnell'), salt='u1') != registry.etag(('chats', 'grinnell'), salt='u2')
+
+
+def test_restart_never_reuses_tags():
+    assert VersionRegistry().etag(('account', 'u1')) != VersionRegistry().etag(('account', 'u1'))
+
+
+def test_conditional_helpers():
+    app = Flask(__name__)
+    registry = VersionRegistry()
+    etag = registry.etag(('account', 'u1'))
+
+    with app.test_request_context(headers={'If-None-Match': f'"{etag}"'}):
+        response = not_modified(etag)
+        assert response.status_code == 304
+        assert response.headers['ETag'] == f'"{etag}"'
+
+    with app.test_request_context(headers={'If-None-Match': '"stale"'}):
+        assert not_modified(etag) is None
+        response, status = tag(jsonify({'a': 1}), etag), 200
+        assert response.headers['ETag'] == f'"{etag}"'
+        assert response.headers['Cache-Control'] == 'private, no-cache'
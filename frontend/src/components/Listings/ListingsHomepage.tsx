@@ -352,9 +352,10 @@ export default function ListingsHomepage() {
                   }
                   setFavorites(updatedFavorites);
                   await import("@/pages/api/accounts").then((mod) =>
-                    mod.accountsApi.updateFavorites(
+                    mod.accountsApi.setFavorite(
                       user.uid,
-                      updatedFavorites,
+                      listing.ListingID,
+                      newState,
                       token
                     )
                   );
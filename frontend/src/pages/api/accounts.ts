@@ -63,6 +63,18 @@ export const accountsApi = {
     return response.json();
   },
 
+  /**
+   * Favorite or unfavorite a single listing
+   */
+  setFavorite: async (accountId: string, listingId: string, favorited: boolean, token: string) => {
+    const response = await fetch(`${API_BASE_URL}/accounts/${accountId}/favorites/${listingId}`, {
+      method: favorited ? 'PUT' : 'DELETE',
+      headers: getAuthHeaders(token),
+    });
+    if (!response.ok) throw new Error("Failed to update favorite");
+    return response.json();
+  },
+
   createAccount: async (accountData: AccountData, token: string) => {
     const response = await fetch(`${API_BASE_URL}/accounts/`, {
       method: 'POST',